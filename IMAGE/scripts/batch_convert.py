@@ -0,0 +1,326 @@
+import argparse
+import contextlib
+import csv
+import os
+import re
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from conversion_cache import CACHE_FILE_NAME, ConversionCache, file_sha256
+from pos2drawio import CONVERTER_VERSION, convert_file
+from pos2drawio.filters import ElementFilter, parse_bbox, parse_zindex_range
+from pos2drawio.geometry import GeometryOptions
+from pos2drawio.metrics import Metrics
+from pos2drawio.paging import parse_page_size
+from pos2drawio.patch import patch_file
+from pos2drawio.text import LABEL_AUTO, LABEL_MODES
+
+SUMMARY_FIELDS = ['file', 'status', 'elements', 'nodes', 'links', 'seconds', 'error']
+
+# 视为成功的状态，cached表示输入未变化、跳过了转换
+OK_STATUSES = ('ok', 'cached')
+
+# 单个文件超时；继承BaseException，转换过程中按元素捕获Exception的地方不会把它当作普通错误吞掉
+class ConversionTimeout(BaseException):
+    pass
+
+def _raise_timeout(signum, frame):
+    raise ConversionTimeout()
+
+# 递归查找目录下所有.pos文件，返回 (所在的输入根目录, pos文件路径) 列表
+def find_pos_files(paths):
+    pos_files = []
+    for path in paths:
+        if os.path.isfile(path):
+            if path.endswith('.pos'):
+                pos_files.append((os.path.dirname(os.path.abspath(path)), path))
+            continue
+        root = os.path.abspath(path)
+        for dir_path, dir_names, file_names in os.walk(path):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                if file_name.endswith('.pos'):
+                    pos_files.append((root, os.path.join(dir_path, file_name)))
+    return pos_files
+
+# 计算输出文件路径：默认与pos文件同目录，指定output_dir时按相对路径镜像目录结构
+def output_path(pos_file, root, output_dir):
+    xml_name = os.path.basename(pos_file)[:-len('.pos')] + '.drawio.xml'
+    if output_dir is None:
+        return os.path.join(os.path.dirname(pos_file), xml_name)
+    rel_dir = os.path.relpath(os.path.dirname(os.path.abspath(pos_file)), root)
+    return os.path.normpath(os.path.join(output_dir, rel_dir, xml_name))
+
+# 默认的缓存清单目录
+def default_cache_dir(path):
+    return path if os.path.isdir(path) else os.path.dirname(path) or '.'
+
+# 在工作进程中转换一个文件，任何异常都被捕获并作为结果返回，不影响其他文件
+# hash_input为True时先记录输入的size/mtime/sha256供缓存使用；哈希与expected_sha256相同时跳过转换
+# options为传给convert_file的转换选项（如embed_preview、extract_preview）
+# patch为True时用patch_file增量更新已有的输出，只重新生成变化的单元格
+# log_sample为元素级日志的抽样比例，默认不打印；各阶段的耗时和计数放在结果的metrics中
+def convert_one(pos_file, xml_file, timeout=None, hash_input=False, expected_sha256=None, options=None, patch=False,
+                log_sample=0.0):
+    result = {'file': pos_file, 'status': 'ok', 'elements': 0, 'nodes': 0, 'links': 0, 'error': ''}
+    start = time.perf_counter()
+    metrics = Metrics(log_sample)
+
+    use_alarm = timeout and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        if hash_input:
+            st = os.stat(pos_file)
+            result.update(size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=file_sha256(pos_file))
+            if result['sha256'] == expected_sha256:
+                result['status'] = 'cached'
+                return result
+
+        os.makedirs(os.path.dirname(xml_file) or '.', exist_ok=True)
+        # 没有要求抽样元素日志时，转换过程的输出全部丢弃
+        with contextlib.ExitStack() as stack:
+            if not log_sample:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+            if patch:
+                stats = patch_file(pos_file, xml_file, label_mode=(options or {}).get('label_mode', LABEL_AUTO),
+                                   metrics=metrics)
+            else:
+                stats = convert_file(pos_file, xml_file, metrics=metrics, **(options or {}))
+        result.update(stats)
+    except ConversionTimeout:
+        result['status'] = 'timeout'
+        result['error'] = f'超过{timeout}秒'
+    except Exception as e:
+        result['status'] = 'error'
+        # 只保留异常信息的第一行，保持汇总表整齐
+        message = str(e).strip().splitlines()
+        result['error'] = f"{type(e).__name__}: {message[0] if message else ''}"
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        result['seconds'] = time.perf_counter() - start
+        result['metrics'] = metrics.to_dict()
+
+    return result
+
+# 在进程池中转换一批文件，逐个产出结果
+# 工作进程崩溃（如被OOM杀掉）会让整个进程池失效，这时把未完成的文件放到单独的进程中逐个重试
+# jobs中每一项为 (pos_file, xml_file, convert_one的关键字参数)
+def run_pool(jobs, workers, timeout):
+    crashed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(convert_one, pos_file, xml_file, timeout, **kwargs): (pos_file, xml_file, kwargs)
+                   for pos_file, xml_file, kwargs in jobs}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except BrokenProcessPool:
+                crashed.append(futures[future])
+
+    for pos_file, xml_file, kwargs in crashed:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            try:
+                yield pool.submit(convert_one, pos_file, xml_file, timeout, **kwargs).result()
+            except BrokenProcessPool:
+                yield {'file': pos_file, 'status': 'crashed', 'elements': 0, 'nodes': 0, 'links': 0,
+                       'seconds': 0.0, 'error': '工作进程异常退出'}
+
+# 打印汇总表
+def print_summary(results):
+    width = max([len('file')] + [len(r['file']) for r in results])
+    print(f"{'file':<{width}}  {'status':<8}{'elements':>10}{'nodes':>8}{'links':>8}{'seconds':>10}")
+    for r in results:
+        print(f"{r['file']:<{width}}  {r['status']:<8}{r['elements']:>10}{r['nodes']:>8}{r['links']:>8}{r['seconds']:>10.3f}")
+        if r['error']:
+            print(f"{'':<{width}}  {r['error']}")
+
+    ok = sum(1 for r in results if r['status'] in OK_STATUSES)
+    cached = sum(1 for r in results if r['status'] == 'cached')
+    print(f"共 {len(results)} 个文件，成功 {ok} 个（其中未变化跳过 {cached} 个），失败 {len(results) - ok} 个，"
+          f"元素 {sum(r['elements'] for r in results)}，节点 {sum(r['nodes'] for r in results)}，"
+          f"连接线 {sum(r['links'] for r in results)}")
+
+# 汇总表写为CSV
+def write_summary_csv(results, path):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        for r in results:
+            writer.writerow({k: (f'{r[k]:.3f}' if k == 'seconds' else r[k]) for k in SUMMARY_FIELDS})
+
+def _page_size(text):
+    try:
+        return parse_page_size(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def _bbox(text):
+    try:
+        return parse_bbox(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def _zindex_range(text):
+    try:
+        return parse_zindex_range(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def _types(text):
+    return tuple(t.strip() for t in text.split(',') if t.strip())
+
+# 提前编译一次，正则写错时在解析参数时就报错；选项中保存的仍是字符串
+def _regex(text):
+    try:
+        re.compile(text)
+    except re.error as e:
+        raise argparse.ArgumentTypeError(f'正则无效: {e}')
+    return text
+
+# 转换选项的命令行参数，batch_convert和watch_convert共用
+def add_conversion_arguments(parser):
+    parser.add_argument('--extract-preview', action='store_true', help='同时把内嵌的预览图解码为同名的.png文件')
+    parser.add_argument('--embed-preview', action='store_true', help='把预览图作为锁定的背景图片嵌入draw.io')
+    parser.add_argument('--page-size', type=_page_size, metavar='宽x高',
+                        help='按网格分页，每个格子输出为一个draw.io页面，例如 2000x2000')
+    parser.add_argument('--compress', action='store_true', help='页面内容按draw.io的压缩格式写出，文件通常小5到10倍')
+    parser.add_argument('--labels', choices=LABEL_MODES, default=LABEL_AUTO,
+                        help='文本标签模式：auto只有换行时转纯文本、带行内样式时保留HTML，html总是保留HTML，text总是转纯文本')
+    parser.add_argument('--geometry', action='store_true',
+                        help='几何处理：按画布原点平移坐标、保留连接线折点并计算曲线锚点（需要numpy）')
+    parser.add_argument('--scale', type=float, default=1.0, help='几何处理时的缩放比例，默认1，指定时自动启用--geometry')
+    parser.add_argument('--snap', type=float, default=0, help='几何处理时对齐的网格大小，默认0不对齐，指定时自动启用--geometry')
+    parser.add_argument('--patch', action='store_true',
+                        help='增量更新已有的输出文件，只重新生成新增、变化、删除的元素，保留其余单元格（包括手工修改）')
+    parser.add_argument('--types', type=_types, metavar='类型,...',
+                        help='只转换这些类型（元素的name）的元素，例如 rectangle,note,linker')
+    parser.add_argument('--bbox', type=_bbox, metavar='x,y,宽,高',
+                        help='只转换中心点落在这个区域内的节点')
+    parser.add_argument('--text', type=_regex, metavar='正则', help='只转换标签文本匹配这个正则的节点')
+    parser.add_argument('--zindex', type=_zindex_range, metavar='下限:上限',
+                        help='只转换zindex在这个闭区间内的元素，任一端可以省略')
+    parser.add_argument('--z-order', action='store_true',
+                        help='按ProcessOn的zindex层叠顺序写出单元格，重叠的图形和注释上下关系与原图一致')
+
+# 性能指标和元素级日志的命令行参数，batch_convert和watch_convert共用
+def add_metrics_arguments(parser):
+    parser.add_argument('--metrics', metavar='文件',
+                        help='把各阶段耗时和计数写入文件：扩展名为.prom时为Prometheus textfile格式，否则为JSON')
+    parser.add_argument('--log-sample', type=float, default=0.0, metavar='比例',
+                        help='按比例抽样打印元素级日志，例如0.01；默认0不打印，1打印全部')
+
+# 把一个文件的结果计入汇总的指标
+def record_metrics(metrics, result):
+    metrics.merge(result.get('metrics', {}))
+    metrics.count(f"status_{result['status']}")
+
+# 检查互相冲突的转换选项
+def check_conversion_arguments(parser, args):
+    if args.patch and (args.page_size or args.compress or args.embed_preview or args.geometry
+                       or args.scale != 1.0 or args.snap):
+        parser.error('--patch不能与--page-size、--compress、--embed-preview和几何处理选项同时使用')
+    if args.patch and (args.types or args.bbox or args.text or args.zindex):
+        parser.error('--patch不能与--types、--bbox、--text和--zindex同时使用')
+    if args.patch and args.z_order:
+        parser.error('--patch保留已有单元格的顺序，不能与--z-order同时使用')
+
+# 由命令行参数得到传给convert_file的选项
+def conversion_options(args):
+    geometry = None
+    if args.geometry or args.scale != 1.0 or args.snap:
+        geometry = GeometryOptions(scale=args.scale, snap=args.snap)
+    element_filter = None
+    if args.types or args.bbox or args.text or args.zindex:
+        element_filter = ElementFilter(args.types, args.bbox, args.text, args.zindex)
+    return {'embed_preview': args.embed_preview, 'extract_preview': args.extract_preview,
+            'page_size': args.page_size, 'geometry': geometry, 'label_mode': args.labels,
+            'compress': args.compress, 'element_filter': element_filter, 'z_order': args.z_order}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='递归查找.pos文件并用进程池并行转换为draw.io XML')
+    parser.add_argument('paths', nargs='*', default=['.'], help='要转换的目录或.pos文件，默认当前目录')
+    parser.add_argument('-o', '--output-dir', help='输出目录，按输入的相对路径镜像；默认写在.pos文件旁边')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='工作进程数，默认CPU核数')
+    parser.add_argument('--timeout', type=float, default=300, help='单个文件的超时秒数，0表示不限制')
+    parser.add_argument('--summary', help='把汇总表另存为CSV文件')
+    parser.add_argument('--cache', help=f'增量转换缓存清单路径，默认为输出目录（或第一个输入目录）下的{CACHE_FILE_NAME}')
+    parser.add_argument('--no-cache', action='store_true', help='不使用缓存，全部重新转换')
+    add_conversion_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    check_conversion_arguments(parser, args)
+    return args
+
+# 主函数
+def main(argv=None):
+    args = parse_args(argv)
+
+    pos_files = find_pos_files(args.paths)
+    if not pos_files:
+        print('没有找到.pos文件')
+        return 0
+
+    options = conversion_options(args)
+    started = time.perf_counter()
+
+    cache = None
+    if not args.no_cache:
+        manifest_path = args.cache or os.path.join(args.output_dir or default_cache_dir(args.paths[0]), CACHE_FILE_NAME)
+        cache = ConversionCache(manifest_path, CONVERTER_VERSION, options).load()
+
+    # 大小和mtime都未变化的文件直接跳过，其余文件交给进程池
+    results = []
+    jobs = []
+    cached_entries = {}
+    for root, pos_file in pos_files:
+        xml_file = output_path(pos_file, root, args.output_dir)
+        state, entry = cache.lookup(pos_file, xml_file) if cache else ('miss', None)
+        if state == 'fresh':
+            result = {'file': pos_file, 'status': 'cached', 'seconds': 0.0, 'error': ''}
+            result.update((k, entry[k]) for k in ('elements', 'nodes', 'links'))
+            cache.record(pos_file, xml_file, entry['size'], entry['mtime_ns'], entry['sha256'], entry)
+            results.append(result)
+            continue
+        kwargs = {'hash_input': cache is not None, 'expected_sha256': entry['sha256'] if entry else None,
+                  'options': options, 'patch': args.patch, 'log_sample': args.log_sample}
+        jobs.append((pos_file, xml_file, kwargs))
+        cached_entries[pos_file] = entry
+
+    workers = max(1, min(args.jobs, len(jobs)))
+    print(f'找到 {len(pos_files)} 个.pos文件，{len(results)} 个未变化，使用 {workers} 个进程转换 {len(jobs)} 个')
+
+    xml_files = {pos_file: xml_file for pos_file, xml_file, _ in jobs}
+    for result in run_pool(jobs, workers, args.timeout or None):
+        if cache and result['status'] in OK_STATUSES:
+            pos_file = result['file']
+            if result['status'] == 'cached':
+                result.update((k, cached_entries[pos_file][k]) for k in ('elements', 'nodes', 'links'))
+            cache.record(pos_file, xml_files[pos_file], result['size'], result['mtime_ns'], result['sha256'], result)
+        results.append(result)
+        print(f"[{len(results)}/{len(pos_files)}] {result['status']:<8} {result['file']}")
+
+    if cache:
+        cache.save()
+
+    results.sort(key=lambda r: r['file'])
+    print_summary(results)
+    if args.summary:
+        write_summary_csv(results, args.summary)
+        print(f'已生成汇总表: {args.summary}')
+    if args.metrics:
+        metrics = Metrics()
+        for result in results:
+            record_metrics(metrics, result)
+        metrics.add_time('run', time.perf_counter() - started)
+        metrics.write(args.metrics)
+        print(f'已生成性能指标: {args.metrics}')
+
+    return 0 if all(r['status'] in OK_STATUSES for r in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
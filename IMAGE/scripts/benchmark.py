@@ -0,0 +1,220 @@
+import argparse
+import base64
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# 被测的转换器
+CONVERTERS = ['pos_to_drawio', 'pos_to_drawio_large', 'pos_to_drawio_streaming']
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+# 合成图表使用的节点类型，包含三个转换器都支持的rect/round
+NODE_TYPES = ['rectangle', 'rect', 'round', 'note', 'roundRectangle', 'diamond',
+              'singleRightArrow', 'singleLeftArrow', 'circle']
+
+TEXT_WORDS = ['zookeeper', 'ZAB', 'paxos', 'leader', 'follower', 'observer', 'zxid', 'myid', '3888',
+              '分布式', '协调', '选举', '配置中心', '分布式锁', '事务', '快照', '会话', '临时节点', '回调']
+
+# 模仿ProcessOn导出的节点元素，保留那些体积很大但转换器用不到的样板字段
+def make_node(rng, element_id, element_type, text_size, zindex):
+    words = []
+    length = 0
+    while length < text_size:
+        word = rng.choice(TEXT_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    text = '&nbsp;'.join(words[:len(words) // 2]) + '<div>' + ' '.join(words[len(words) // 2:]) + '</div>'
+    fill = {'color': f'{rng.randrange(256)}, {rng.randrange(256)}, {rng.randrange(256)}'} if rng.random() < 0.3 else {}
+    return {
+        'textBlock': [{'position': {'w': 'w-20', 'y': 0, 'h': 'h', 'x': 10}, 'text': text}],
+        'lineStyle': {'lineWidth': rng.choice([1, 2])} if rng.random() < 0.2 else {},
+        'link': '', 'children': [], 'parent': '',
+        'attribute': {'linkable': True, 'visible': True, 'container': False, 'rotatable': True,
+                      'markerOffset': 5, 'collapsable': False, 'collapsed': False},
+        'fontStyle': {}, 'resizeDir': ['tl', 'tr', 'br', 'bl'],
+        'dataAttributes': [{'id': f'{element_id}{i}', 'category': 'default', 'name': name, 'value': '', 'type': kind}
+                           for i, (name, kind) in enumerate([('序号', 'number'), ('名称', 'string'), ('所有者', 'string'),
+                                                             ('连接', 'link'), ('便笺', 'string')])],
+        'shapeStyle': {'alpha': 1}, 'id': element_id,
+        'anchors': [{'y': '0', 'x': 'w/2'}, {'y': 'h', 'x': 'w/2'}, {'y': 'h/2', 'x': '0'}, {'y': 'h/2', 'x': 'w'}],
+        'category': 'basic', 'title': element_type, 'name': element_type, 'fillStyle': fill,
+        'path': [{'actions': [{'action': 'move', 'y': '0', 'x': '0'}, {'action': 'line', 'y': '0', 'x': 'w'},
+                              {'action': 'line', 'y': 'h', 'x': 'w'}, {'action': 'line', 'y': 'h', 'x': '0'},
+                              {'action': 'close'}]}],
+        'locked': False, 'group': '',
+        'props': {'w': rng.uniform(40, 300), 'y': rng.uniform(0, 50000), 'h': rng.uniform(20, 120), 'angle': 0,
+                  'x': rng.uniform(0, 2000), 'zindex': zindex}
+    }
+
+def make_linker(rng, element_id, source_id, target_id, zindex):
+    return {
+        'id': element_id,
+        'to': {'id': target_id, 'y': rng.uniform(0, 50000), 'angle': 3.141592653589793, 'x': rng.uniform(0, 2000)},
+        'text': '', 'linkerType': rng.choice(['curve', 'broken', 'straight']), 'name': 'linker', 'lineStyle': {},
+        'points': [{'y': rng.uniform(0, 50000), 'x': rng.uniform(0, 2000)} for _ in range(rng.randrange(0, 4))],
+        'locked': False, 'dataAttributes': [],
+        'from': {'id': source_id, 'y': rng.uniform(0, 50000), 'angle': 1.5707963267948966, 'x': rng.uniform(0, 2000)},
+        'group': '', 'props': {'zindex': zindex}
+    }
+
+def element_id_for(index):
+    return f'16d{index:011x}'
+
+# 生成合成的ProcessOn .pos文件
+# 元素边生成边写出，生成一百万个元素也不需要把整个图表放进内存
+# linker_ratio为连接线占比，text_size为每个节点文本的大致字符数，png_kb为pngdata预览图的大小
+def generate_pos(path, elements, linker_ratio=0.4, text_size=40, png_kb=950, seed=0):
+    rng = random.Random(seed)
+
+    # 先确定每个位置是节点还是连接线，连接线的端点从全部节点中随机选取（包括后面才出现的节点）
+    kinds = bytearray(1 if rng.random() < linker_ratio else 0 for _ in range(elements))
+    node_indexes = [i for i, kind in enumerate(kinds) if kind == 0] or [0]
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"diagram":{"image":{"height":6549,"pngdata":"')
+        png_rng = random.Random(seed + 1)
+        remaining = png_kb * 1024
+        while remaining > 0:
+            chunk = min(remaining, 3 * 65536)
+            f.write(base64.b64encode(png_rng.randbytes(chunk)).decode('ascii'))
+            remaining -= chunk
+        f.write('","width":1933,"y":-30,"x":-65},"elements":{"page":')
+        f.write(json.dumps({'showGrid': True, 'gridSize': 15, 'orientation': 'portrait', 'height': 50000,
+                            'backgroundColor': 'transparent', 'width': 2000, 'padding': 20}))
+        f.write(',"elements":{')
+
+        for index, kind in enumerate(kinds):
+            element_id = element_id_for(index)
+            if kind == 0:
+                element = make_node(rng, element_id, rng.choice(NODE_TYPES), text_size, index)
+            else:
+                element = make_linker(rng, element_id, element_id_for(rng.choice(node_indexes)),
+                                      element_id_for(rng.choice(node_indexes)), index)
+            if index:
+                f.write(',')
+            f.write(json.dumps(element_id) + ':' + json.dumps(element, ensure_ascii=False))
+
+        f.write('}}},"meta":')
+        f.write(json.dumps({'id': f'synthetic-{seed}', 'member': 'benchmark', 'exportTime': '2026-01-01 00:00:00',
+                            'diagramInfo': {'category': 'flow', 'title': f'synthetic-{elements}',
+                                            'created': '2026-01-01 00:00:00', 'creator': 'benchmark',
+                                            'modified': '2026-01-01 00:00:00'},
+                            'type': 'ProcessOn Schema File', 'version': '1.0'}))
+        f.write('}')
+
+# 在当前进程中用指定的转换器转换一个文件
+def run_converter(converter, pos_file, xml_file):
+    module = __import__(converter)
+    if converter == 'pos_to_drawio_streaming':
+        return module.convert_pos_file(pos_file, xml_file)
+
+    data = module.read_pos_file(pos_file)
+    if data is None:
+        raise ValueError('read_pos_file返回None')
+    with open(xml_file, 'w', encoding='utf-8') as f:
+        module.write_drawio_xml(data, f)
+
+# 子进程入口：转换一次并以JSON报告耗时和峰值内存
+def run_child(converter, pos_file, xml_file):
+    __import__(converter)
+    baseline_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        run_converter(converter, pos_file, xml_file)
+    seconds = time.perf_counter() - start
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':  # macOS上ru_maxrss的单位是字节
+        baseline_rss_kb //= 1024
+        peak_rss_kb //= 1024
+    print(json.dumps({'seconds': seconds, 'peak_rss_kb': peak_rss_kb, 'baseline_rss_kb': baseline_rss_kb,
+                      'output_bytes': os.path.getsize(xml_file)}))
+
+# 每次测量都在新的子进程中进行，峰值内存互不影响
+def measure(converter, pos_file, xml_file, timeout):
+    cmd = [sys.executable, os.path.abspath(__file__), '_child', converter, pos_file, xml_file]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+    except subprocess.TimeoutExpired:
+        return {'status': 'timeout'}
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return {'status': 'error', 'error': lines[-1] if lines else f'exit code {proc.returncode}'}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['status'] = 'ok'
+    return result
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='用合成的ProcessOn图表测量各转换器的耗时和峰值内存')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='元素数量列表，逗号分隔')
+    parser.add_argument('--converters', default=','.join(CONVERTERS), help='要测量的转换器，逗号分隔')
+    parser.add_argument('--linker-ratio', type=float, default=0.4, help='连接线占全部元素的比例')
+    parser.add_argument('--text-size', type=int, default=40, help='每个节点文本的大致字符数')
+    parser.add_argument('--png-kb', type=int, default=950, help='pngdata预览图大小（KB）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--repeat', type=int, default=1, help='每个组合重复测量的次数，取最快的一次')
+    parser.add_argument('--timeout', type=float, default=3600, help='单次测量的超时秒数')
+    parser.add_argument('--workdir', help='存放合成pos文件和输出的目录，默认使用临时目录')
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help='结果JSON文件')
+    return parser.parse_args(argv)
+
+# 主函数
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['_child']:
+        run_child(*argv[1:4])
+        return 0
+
+    args = parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    converters = [c for c in args.converters.split(',') if c]
+    workdir = args.workdir or tempfile.mkdtemp(prefix='pos_benchmark_')
+    os.makedirs(workdir, exist_ok=True)
+
+    results = []
+    for size in sizes:
+        # 相同参数生成的文件可以复用
+        pos_file = os.path.join(workdir, f'synthetic-{size}-l{args.linker_ratio}-t{args.text_size}'
+                                         f'-p{args.png_kb}-s{args.seed}.pos')
+        if not os.path.exists(pos_file):
+            print(f'生成 {size} 个元素的合成图表: {pos_file}')
+            generate_pos(pos_file, size, args.linker_ratio, args.text_size, args.png_kb, args.seed)
+        pos_bytes = os.path.getsize(pos_file)
+
+        for converter in converters:
+            xml_file = os.path.join(workdir, f'{converter}-{size}.drawio.xml')
+            runs = [measure(converter, pos_file, xml_file, args.timeout) for _ in range(args.repeat)]
+            ok_runs = [r for r in runs if r['status'] == 'ok']
+            best = min(ok_runs, key=lambda r: r['seconds']) if ok_runs else runs[-1]
+            best.update(converter=converter, elements=size, pos_bytes=pos_bytes)
+            results.append(best)
+
+            if best['status'] == 'ok':
+                print(f"{converter:<26}{size:>9} 元素  {best['seconds']:>9.3f} 秒  峰值内存 {best['peak_rss_kb'] / 1024:>8.1f} MB")
+            else:
+                print(f"{converter:<26}{size:>9} 元素  {best['status']}: {best.get('error', '')}")
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {'linker_ratio': args.linker_ratio, 'text_size': args.text_size,
+                   'png_kb': args.png_kb, 'seed': args.seed, 'repeat': args.repeat},
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'已生成结果: {args.output}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
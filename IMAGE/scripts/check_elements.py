@@ -1,73 +1,83 @@
-import ijson
+import argparse
+import os
+
+from pos2drawio.index import build_index, load_index
+
+# 打印一个元素的主要属性
+def print_element(element_id, element_data):
+    element_type = element_data.get('name')
+    print(f"  ID: {element_id}")
+    print(f"  主要属性: {list(element_data.keys())}")
+
+    # 打印一些关键属性
+    if 'props' in element_data:
+        print(f"  位置大小: x={element_data['props'].get('x', 'N/A')}, y={element_data['props'].get('y', 'N/A')}, w={element_data['props'].get('w', 'N/A')}, h={element_data['props'].get('h', 'N/A')}")
+
+    if 'textBlock' in element_data and element_data['textBlock']:
+        text_block = element_data['textBlock'][0]
+        if 'text' in text_block:
+            print(f"  文本: {text_block['text']}")
+
+    if element_type == 'linker':
+        if 'from' in element_data and 'to' in element_data:
+            print(f"  连接: 从 {element_data['from'].get('id', 'N/A')} 到 {element_data['to'].get('id', 'N/A')}")
 
 # 检查pos文件中的元素类型和数量
-def check_elements(file_path):
+# 统计和查找都走 <pos文件>.idx 索引，只解码需要打印的元素；索引不存在或过期时自动重建
+def check_elements(file_path, element_ids=None):
     try:
-        with open(file_path, 'rb') as f:
-            # 获取实际的图表元素
-            parser = ijson.items(f, 'diagram.elements.elements')
-            for item in parser:
-                elements = item
-                break
-        
+        index = load_index(file_path)
+
         print(f"=== 检查文件: {file_path} ===")
-        print(f"总元素数量: {len(elements)}")
-        
+        print(f"总元素数量: {len(index)}")
+
         # 统计不同类型的元素
-        element_types = {}
-        for element_id, element_data in elements.items():
-            element_type = element_data['name']
-            if element_type in element_types:
-                element_types[element_type] += 1
-            else:
-                element_types[element_type] = 1
-        
+        element_types = index.type_counts()
+
         print(f"元素类型统计:")
         for element_type, count in element_types.items():
             print(f"  {element_type}: {count}个")
-        
-        # 查看每种类型的一个示例
-        print(f"\n每种类型的示例:")
-        seen_types = set()
-        for element_id, element_data in elements.items():
-            element_type = element_data['name']
-            if element_type not in seen_types:
-                print(f"\n{element_type} 示例:")
-                print(f"  ID: {element_id}")
-                print(f"  主要属性: {list(element_data.keys())}")
-                
-                # 打印一些关键属性
-                if 'props' in element_data:
-                    print(f"  位置大小: x={element_data['props'].get('x', 'N/A')}, y={element_data['props'].get('y', 'N/A')}, w={element_data['props'].get('w', 'N/A')}, h={element_data['props'].get('h', 'N/A')}")
-                
-                if 'textBlock' in element_data and element_data['textBlock']:
-                    text_block = element_data['textBlock'][0]
-                    if 'text' in text_block:
-                        print(f"  文本: {text_block['text']}")
-                
-                if element_type == 'linker':
-                    if 'from' in element_data and 'to' in element_data:
-                        print(f"  连接: 从 {element_data['from'].get('id', 'N/A')} 到 {element_data['to'].get('id', 'N/A')}")
-                
-                seen_types.add(element_type)
-                
-            if len(seen_types) == len(element_types):
-                break
-        
-        return elements, element_types
+
+        if element_ids:
+            # 查看指定的元素
+            for element_id in element_ids:
+                entry = index.get(element_id)
+                if entry is None:
+                    print(f"\n元素 {element_id} 不存在")
+                    continue
+                print(f"\n{entry.type} 元素 (偏移 {entry.offset}, 长度 {entry.length}, zindex {entry.zindex}):")
+                print_element(element_id, index.read_element(element_id))
+        else:
+            # 查看每种类型的一个示例
+            print(f"\n每种类型的示例:")
+            examples = [next(index.by_type(element_type)).id for element_type in element_types]
+            for element_id, element_data in index.iter_elements(examples):
+                print(f"\n{element_data.get('name')} 示例:")
+                print_element(element_id, element_data)
+
+        return index, element_types
     except Exception as e:
         print(f"读取文件 {file_path} 时出错: {e}")
         return None, None
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='检查pos文件中的元素类型和数量，或按id查看元素')
+    parser.add_argument('files', nargs='*', help='要检查的pos文件，默认当前目录下的所有.pos文件')
+    parser.add_argument('--id', dest='ids', action='append', help='只查看指定id的元素，可重复')
+    parser.add_argument('--reindex', action='store_true', help='先重建元素索引')
+    return parser.parse_args(argv)
+
 # 主函数
-def main():
-    import os
-    
+def main(argv=None):
+    args = parse_args(argv)
+
     # 获取当前目录下的所有.pos文件
-    pos_files = [f for f in os.listdir('.') if f.endswith('.pos')]
-    
+    pos_files = args.files or [f for f in os.listdir('.') if f.endswith('.pos')]
+
     for pos_file in pos_files:
-        check_elements(pos_file)
+        if args.reindex:
+            build_index(pos_file)
+        check_elements(pos_file, args.ids)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
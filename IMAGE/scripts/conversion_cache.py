@@ -0,0 +1,176 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows上没有fcntl，退化为不加锁
+    fcntl = None
+
+CACHE_FILE_NAME = '.pos2drawio-cache.json'
+MANIFEST_VERSION = 1
+
+# 计算文件内容的sha256
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# 转换器版本和样式选项共同决定输出内容，任意一个变化都要重新转换
+def options_key(converter_version, options=None):
+    payload = json.dumps({'version': converter_version, 'options': options or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+# 对清单文件加锁，多个并发运行之间互斥地读-改-写
+@contextmanager
+def locked(manifest_path, exclusive):
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    with open(manifest_path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _read_entries(manifest_path):
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('entries', {})
+
+# 原子地写清单：先写临时文件再替换，读者永远看不到写了一半的清单
+def _write_entries(manifest_path, entries):
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.pos2drawio-cache-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'entries': entries}, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+# 增量转换缓存
+# 清单以pos文件的绝对路径为键，记录输入的大小、mtime、sha256、转换器版本和选项以及转换统计
+# 查询时先比较size/mtime，只有mtime变化而大小不变时才需要重新计算哈希
+class ConversionCache:
+    def __init__(self, manifest_path, converter_version, options=None):
+        self.manifest_path = manifest_path
+        self.key = options_key(converter_version, options)
+        self.entries = {}
+        self.updates = {}
+
+    def load(self):
+        with locked(self.manifest_path, exclusive=False):
+            self.entries = _read_entries(self.manifest_path)
+        return self
+
+    # 返回 (状态, 缓存的条目)
+    # 'fresh'：大小和mtime都没变，可以直接跳过
+    # 'verify'：大小没变但mtime变了，需要比较哈希
+    # 'miss'：没有可用的缓存
+    def lookup(self, pos_file, xml_file):
+        entry = self.entries.get(os.path.abspath(pos_file))
+        if (not entry or entry.get('key') != self.key
+                or entry.get('output') != os.path.abspath(xml_file) or not os.path.exists(xml_file)):
+            return 'miss', None
+
+        st = os.stat(pos_file)
+        if entry['size'] != st.st_size:
+            return 'miss', None
+        if entry['mtime_ns'] == st.st_mtime_ns:
+            return 'fresh', entry
+        return 'verify', entry
+
+    # 记录一次转换（或一次命中）的结果，调用save()后才会写入清单
+    def record(self, pos_file, xml_file, size, mtime_ns, sha256, stats):
+        self.updates[os.path.abspath(pos_file)] = {
+            'key': self.key,
+            'output': os.path.abspath(xml_file),
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'sha256': sha256,
+            'elements': stats.get('elements', 0),
+            'nodes': stats.get('nodes', 0),
+            'links': stats.get('links', 0),
+            'last_used': time.time()
+        }
+
+    # 在排他锁内重新读取清单，合并本次运行的更新后写回，不会覆盖其他并发运行写入的条目
+    def save(self):
+        if not self.updates:
+            return
+        with locked(self.manifest_path, exclusive=True):
+            entries = _read_entries(self.manifest_path)
+            entries.update(self.updates)
+            _write_entries(self.manifest_path, entries)
+        self.entries = entries
+        self.updates = {}
+
+# 清理清单：删除源文件或输出文件已不存在的条目，以及超过max_age_days天未使用的条目
+def prune(manifest_path, max_age_days=None):
+    with locked(manifest_path, exclusive=True):
+        entries = _read_entries(manifest_path)
+        now = time.time()
+        kept = {}
+        for pos_file, entry in entries.items():
+            if not os.path.exists(pos_file) or not os.path.exists(entry.get('output', '')):
+                continue
+            if max_age_days is not None and now - entry.get('last_used', 0) > max_age_days * 86400:
+                continue
+            kept[pos_file] = entry
+        _write_entries(manifest_path, kept)
+    return len(entries) - len(kept), len(kept)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='管理pos→drawio增量转换缓存清单')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    prune_parser = subparsers.add_parser('prune', help='删除失效或过期的缓存条目')
+    prune_parser.add_argument('manifest', nargs='?', default=CACHE_FILE_NAME, help='缓存清单路径')
+    prune_parser.add_argument('--max-age-days', type=float, help='删除超过这么多天没有被使用的条目')
+
+    show_parser = subparsers.add_parser('show', help='列出缓存条目')
+    show_parser.add_argument('manifest', nargs='?', default=CACHE_FILE_NAME, help='缓存清单路径')
+
+    clear_parser = subparsers.add_parser('clear', help='清空缓存')
+    clear_parser.add_argument('manifest', nargs='?', default=CACHE_FILE_NAME, help='缓存清单路径')
+    return parser.parse_args(argv)
+
+# 主函数
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.command == 'prune':
+        removed, kept = prune(args.manifest, args.max_age_days)
+        print(f'已删除 {removed} 个缓存条目，保留 {kept} 个')
+    elif args.command == 'show':
+        with locked(args.manifest, exclusive=False):
+            entries = _read_entries(args.manifest)
+        for pos_file, entry in sorted(entries.items()):
+            last_used = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.get('last_used', 0)))
+            print(f"{pos_file}  {entry['sha256'][:12]}  {entry['elements']:>8}  {last_used}")
+        print(f'共 {len(entries)} 个缓存条目')
+    elif args.command == 'clear':
+        with locked(args.manifest, exclusive=True):
+            _write_entries(args.manifest, {})
+        print('缓存已清空')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
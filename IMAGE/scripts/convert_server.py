@@ -0,0 +1,496 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import struct
+import sys
+import time
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+# 本地HTTP转换服务：POST /convert 的请求体是.pos文件，响应体是边转换边以chunked编码返回的draw.io XML
+# 事件循环只负责搬运字节：请求体按块经管道送进常驻的工作进程，跳过pngdata预览图后由ijson边收边解析边转换，
+# 转换结果也按块经管道送回；每一步都等待对端消费（drain），慢客户端会一路反压到工作进程，内存占用有上限
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BODY = 64 * 1024 * 1024
+# 请求行和请求头合计的上限
+MAX_HEADER_BYTES = 16 * 1024
+READ_SIZE = 64 * 1024
+# 工作进程攒够这么多字节的XML才发送一块
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
+# 服务进程和工作进程之间的消息：1字节类型 + 4字节长度 + 内容
+FRAME_HEADER = struct.Struct('>cI')
+FRAME_OPTIONS = b'O'  # 开始一个请求，内容为转换选项（JSON）
+FRAME_BODY = b'B'     # 请求体数据
+FRAME_END = b'F'      # 请求体结束
+FRAME_DATA = b'D'     # 输出的XML数据
+FRAME_DONE = b'S'     # 转换成功，内容为统计信息（JSON）
+FRAME_ERROR = b'E'    # 转换失败，内容为错误信息
+
+ELEMENTS_PREFIX = 'diagram.elements.elements'
+
+class HttpError(Exception):
+    def __init__(self, status, message=''):
+        super().__init__(message or HTTPStatus(status).phrase)
+        self.status = status
+
+# ---------------- 工作进程 ----------------
+
+def _read_frame(stream):
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None, b''
+    kind, length = FRAME_HEADER.unpack(header)
+    return kind, stream.read(length) if length else b''
+
+def _write_frame(stream, kind, payload=b''):
+    stream.write(FRAME_HEADER.pack(kind, len(payload)))
+    stream.write(payload)
+    stream.flush()
+
+# 把BODY消息还原为连续的字节流，供ijson读取，遇到END消息时结束
+class FrameBodyReader(io.RawIOBase):
+    def __init__(self, stream):
+        self.stream = stream
+        self.pending = memoryview(b'')
+        self.finished = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending:
+            if self.finished:
+                return 0
+            kind, payload = _read_frame(self.stream)
+            if kind == FRAME_BODY:
+                self.pending = memoryview(payload)
+            elif kind == FRAME_END:
+                self.finished = True
+            else:
+                raise EOFError('服务进程已关闭管道')
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    # 丢弃请求体剩余的部分，使下一个请求从消息边界开始
+    def drain(self):
+        while not self.finished:
+            self.pending = memoryview(b'')
+            self.readinto(bytearray(READ_SIZE))
+
+# 把DrawioWriter写出的文本攒成DATA消息
+class FrameOutput:
+    def __init__(self, stream, chunk_size=OUTPUT_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.chunk_size:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self.parts:
+            _write_frame(self.stream, FRAME_DATA, ''.join(self.parts).encode('utf-8'))
+            self.parts = []
+            self.size = 0
+
+# 工作进程主循环：一次处理一个请求，直到服务进程关闭管道
+def worker_main():
+    import ijson
+
+    from pos2drawio import convert_elements
+    from pos2drawio.reader import PngdataSkippingStream
+
+    # 协议使用原来的标准输入输出，转换过程中的print改到标准错误
+    protocol_in = os.fdopen(os.dup(0), 'rb')
+    protocol_out = os.fdopen(os.dup(1), 'wb')
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    while True:
+        kind, payload = _read_frame(protocol_in)
+        if kind is None:
+            return 0
+        if kind != FRAME_OPTIONS:
+            raise RuntimeError(f'意外的消息类型: {kind!r}')
+        options = json.loads(payload)
+
+        body = FrameBodyReader(protocol_in)
+        out = FrameOutput(protocol_out)
+        try:
+            elements = ijson.kvitems(PngdataSkippingStream(body, READ_SIZE), ELEMENTS_PREFIX)
+            stats = convert_elements(elements, out, indent=options['indent'],
+                                     label_mode=options['label_mode'], compress=options['compress'])
+            out.flush()
+            body.drain()
+            _write_frame(protocol_out, FRAME_DONE, json.dumps(stats).encode('utf-8'))
+        except EOFError:
+            return 0
+        except Exception as e:
+            body.drain()
+            message = str(e).strip().splitlines()
+            _write_frame(protocol_out, FRAME_ERROR,
+                         f"{type(e).__name__}: {message[0] if message else ''}".encode('utf-8'))
+
+# ---------------- 服务进程 ----------------
+
+# 一个常驻的工作进程，同时只处理一个请求
+class Worker:
+    def __init__(self, process):
+        self.process = process
+        self.requests = 0
+
+    @classmethod
+    async def spawn(cls):
+        process = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), '--worker',
+                                                       stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE)
+        return cls(process)
+
+    def send(self, kind, payload=b''):
+        self.process.stdin.write(FRAME_HEADER.pack(kind, len(payload)))
+        if payload:
+            self.process.stdin.write(payload)
+
+    async def drain(self):
+        await self.process.stdin.drain()
+
+    async def receive(self):
+        header = await self.process.stdout.readexactly(FRAME_HEADER.size)
+        kind, length = FRAME_HEADER.unpack(header)
+        return kind, await self.process.stdout.readexactly(length) if length else b''
+
+    def kill(self):
+        if self.process.returncode is None:
+            self.process.kill()
+
+# 固定大小的工作进程池；所有进程启动时就导入好转换器，请求到达时直接开始转换
+# 空闲进程不足时最多max_pending个请求排队等待，更多的请求直接返回503
+class WorkerPool:
+    def __init__(self, size, max_pending, max_requests):
+        self.size = size
+        self.max_pending = max_pending
+        self.max_requests = max_requests
+        self.idle = asyncio.Queue()
+        self.waiting = 0
+
+    async def start(self):
+        for worker in await asyncio.gather(*(Worker.spawn() for _ in range(self.size))):
+            self.idle.put_nowait(worker)
+
+    async def acquire(self):
+        if self.idle.empty() and self.waiting >= self.max_pending:
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, '转换任务过多，请稍后重试')
+        self.waiting += 1
+        try:
+            return await self.idle.get()
+        finally:
+            self.waiting -= 1
+
+    # 出错或处理请求数达到上限的进程被替换为新进程
+    def release(self, worker, healthy):
+        worker.requests += 1
+        if healthy and worker.requests < self.max_requests:
+            self.idle.put_nowait(worker)
+            return
+        worker.kill()
+        asyncio.get_running_loop().create_task(self._replace(worker))
+
+    async def _replace(self, worker):
+        await worker.process.wait()
+        self.idle.put_nowait(await Worker.spawn())
+
+    async def close(self):
+        while not self.idle.empty():
+            worker = self.idle.get_nowait()
+            worker.process.stdin.close()
+            await worker.process.wait()
+
+class ConvertServer:
+    def __init__(self, args):
+        from pos2drawio.metrics import Metrics
+        from pos2drawio.text import LABEL_MODES
+
+        self.args = args
+        self.label_modes = LABEL_MODES
+        self.pool = WorkerPool(args.workers, args.max_pending, args.max_requests)
+        self.metrics = Metrics()
+
+    async def serve(self):
+        await self.pool.start()
+        server = await asyncio.start_server(self.handle, self.args.host, self.args.port, limit=MAX_HEADER_BYTES)
+        print(f'监听 http://{self.args.host}:{self.args.port}/convert ，{self.args.workers} 个工作进程已就绪')
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.pool.close()
+
+    # 一个连接只处理一个请求，响应结束后关闭连接
+    async def handle(self, reader, writer):
+        start = time.perf_counter()
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+        try:
+            method, path, query, headers = await self.read_head(reader)
+            if path == '/convert' and method == 'POST':
+                status = await self.handle_convert(reader, writer, query, headers)
+            elif path == '/healthz' and method == 'GET':
+                status = self.send_text(writer, HTTPStatus.OK, json.dumps(self.health()), 'application/json')
+            elif path == '/metrics' and method == 'GET':
+                status = self.send_text(writer, HTTPStatus.OK, self.metrics.to_prometheus(),
+                                        'text/plain; version=0.0.4')
+            elif path in ('/convert', '/healthz', '/metrics'):
+                raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED)
+            else:
+                raise HttpError(HTTPStatus.NOT_FOUND)
+        except HttpError as e:
+            status = self.send_text(writer, e.status, str(e) + '\n')
+        except (ConnectionError, asyncio.IncompleteReadError):
+            status = 499
+        except Exception as e:
+            print(f'处理请求失败: {type(e).__name__}: {e}', file=sys.stderr)
+            self.send_text(writer, status, HTTPStatus(status).phrase + '\n')
+        finally:
+            self.metrics.count('requests')
+            self.metrics.count(f'responses_{int(status)}')
+            self.metrics.add_time('request', time.perf_counter() - start)
+            writer.close()
+
+    async def read_head(self, reader):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.args.client_timeout)
+        except asyncio.LimitOverrunError:
+            raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        except asyncio.TimeoutError:
+            raise HttpError(HTTPStatus.REQUEST_TIMEOUT)
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, '无法解析请求行')
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        return method, url.path, parse_qs(url.query), headers
+
+    def send_text(self, writer, status, text, content_type='text/plain; charset=utf-8'):
+        body = text.encode('utf-8')
+        writer.write(f'HTTP/1.1 {int(status)} {HTTPStatus(status).phrase}\r\n'
+                     f'Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode('latin-1') + body)
+        return status
+
+    def health(self):
+        return {'workers': self.pool.size, 'idle': self.pool.idle.qsize(), 'waiting': self.pool.waiting}
+
+    def convert_options(self, query):
+        label_mode = query.get('labels', ['auto'])[-1]
+        if label_mode not in self.label_modes:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"labels只能是 {', '.join(self.label_modes)}")
+        compress = query.get('compress', ['0'])[-1] in ('1', 'true', 'yes')
+        indent = None if query.get('compact', ['0'])[-1] in ('1', 'true', 'yes') else '  '
+        return {'label_mode': label_mode, 'compress': compress, 'indent': indent}
+
+    async def handle_convert(self, reader, writer, query, headers):
+        options = self.convert_options(query)
+        if 'transfer-encoding' in headers:
+            if headers['transfer-encoding'].lower() != 'chunked':
+                raise HttpError(HTTPStatus.NOT_IMPLEMENTED, '只支持chunked传输编码')
+        elif 'content-length' not in headers:
+            raise HttpError(HTTPStatus.LENGTH_REQUIRED)
+        elif not headers['content-length'].isdigit():
+            raise HttpError(HTTPStatus.BAD_REQUEST, 'Content-Length无效')
+        elif int(headers['content-length']) > self.args.max_body:
+            raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f'请求体超过{self.args.max_body}字节')
+
+        worker = await self.pool.acquire()
+        healthy = False
+        try:
+            if headers.get('expect', '').lower() == '100-continue':
+                writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            worker.send(FRAME_OPTIONS, json.dumps(options).encode('utf-8'))
+            pump = asyncio.get_running_loop().create_task(self.pump_body(reader, headers, worker))
+            response = {'started': False}
+            try:
+                status, healthy, error = await asyncio.wait_for(self.relay(writer, worker, pump, response),
+                                                                self.args.timeout)
+            except asyncio.TimeoutError:
+                pump.cancel()
+                if response['started']:
+                    writer.transport.abort()
+                    return HTTPStatus.GATEWAY_TIMEOUT
+                raise HttpError(HTTPStatus.GATEWAY_TIMEOUT, f'转换超过{self.args.timeout}秒')
+            # 响应开始之前的错误在这里才抛出，已经空闲的工作进程先标记为可以继续使用
+            if error is not None:
+                raise error
+            return status
+        finally:
+            self.pool.release(worker, healthy)
+
+    # 把请求体按块送进工作进程，无论成功、出错还是被取消，最后都发送END
+    async def pump_body(self, reader, headers, worker):
+        try:
+            async for chunk in self.iter_body(reader, headers):
+                worker.send(FRAME_BODY, chunk)
+                await worker.drain()
+                self.metrics.count('bytes_in', len(chunk))
+        finally:
+            worker.send(FRAME_END)
+
+    # 逐块读取请求体（Content-Length或chunked），超过大小上限时抛出413
+    async def iter_body(self, reader, headers):
+        total = 0
+
+        async def read(n):
+            try:
+                data = await asyncio.wait_for(reader.read(n), self.args.client_timeout)
+            except asyncio.TimeoutError:
+                raise HttpError(HTTPStatus.REQUEST_TIMEOUT)
+            if not data:
+                raise HttpError(HTTPStatus.BAD_REQUEST, '请求体不完整')
+            return data
+
+        async def read_line():
+            try:
+                return await asyncio.wait_for(reader.readuntil(b'\r\n'), self.args.client_timeout)
+            except asyncio.TimeoutError:
+                raise HttpError(HTTPStatus.REQUEST_TIMEOUT)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                raise HttpError(HTTPStatus.BAD_REQUEST, 'chunked编码无效')
+
+        if 'content-length' in headers and 'transfer-encoding' not in headers:
+            remaining = int(headers['content-length'])
+            while remaining:
+                data = await read(min(remaining, READ_SIZE))
+                remaining -= len(data)
+                yield data
+            return
+
+        while True:
+            try:
+                size = int((await read_line()).split(b';', 1)[0], 16)
+            except ValueError:
+                raise HttpError(HTTPStatus.BAD_REQUEST, 'chunked编码无效')
+            if size == 0:
+                while await read_line() != b'\r\n':
+                    pass
+                return
+            total += size
+            if total > self.args.max_body:
+                raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f'请求体超过{self.args.max_body}字节')
+            while size:
+                data = await read(min(size, READ_SIZE))
+                size -= len(data)
+                yield data
+            await read_line()
+
+    # 把工作进程的输出转发给客户端，返回 (状态码, 工作进程是否可以继续使用, 要返回给客户端的HttpError或None)
+    # 第一块输出到达之前出错时返回HttpError，由调用方在归还工作进程之后抛出；
+    # 之后出错只能中断连接，客户端会看到不完整的chunked响应
+    # 工作进程发出DONE或ERROR之后已经空闲，只有异常退出的进程才需要替换
+    # response['started']记录是否已经发出响应头，超时处理据此决定返回504还是中断连接
+    async def relay(self, writer, worker, pump, response):
+        started = False
+        client_gone = False
+        while True:
+            try:
+                kind, payload = await worker.receive()
+            except asyncio.IncompleteReadError:
+                pump.cancel()
+                if started:
+                    writer.transport.abort()
+                    return HTTPStatus.INTERNAL_SERVER_ERROR, False, None
+                return HTTPStatus.INTERNAL_SERVER_ERROR, False, HttpError(HTTPStatus.INTERNAL_SERVER_ERROR,
+                                                                          '工作进程异常退出')
+
+            if kind == FRAME_DATA:
+                if client_gone:
+                    continue
+                try:
+                    if not started:
+                        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/xml; charset=utf-8\r\n'
+                                     b'Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n')
+                        response['started'] = started = True
+                    writer.write(b'%x\r\n%b\r\n' % (len(payload), payload))
+                    await writer.drain()
+                    self.metrics.count('bytes_out', len(payload))
+                except ConnectionError:
+                    # 客户端断开后继续读完工作进程的输出，进程可以留给下一个请求
+                    client_gone = True
+                    pump.cancel()
+                continue
+
+            # 请求体本身的问题（超过大小、超时、编码错误）优先于由此导致的转换错误
+            if not pump.done():
+                pump.cancel()
+            try:
+                await pump
+            except HttpError as e:
+                if started:
+                    writer.transport.abort()
+                    return e.status, True, None
+                return e.status, True, e
+            except (asyncio.CancelledError, ConnectionError):
+                pass
+
+            if kind == FRAME_DONE:
+                stats = json.loads(payload)
+                for key, value in stats.items():
+                    self.metrics.count(key, value)
+                if client_gone:
+                    return 499, True, None
+                if not started:
+                    writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/xml; charset=utf-8\r\n'
+                                 b'Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n')
+                writer.write(b'0\r\n\r\n')
+                await writer.drain()
+                return HTTPStatus.OK, True, None
+
+            if kind == FRAME_ERROR:
+                self.metrics.count('conversion_errors')
+                if started or client_gone:
+                    writer.transport.abort()
+                    return HTTPStatus.UNPROCESSABLE_ENTITY, True, None
+                return HTTPStatus.UNPROCESSABLE_ENTITY, True, HttpError(HTTPStatus.UNPROCESSABLE_ENTITY,
+                                                                        payload.decode('utf-8', 'replace'))
+
+            raise RuntimeError(f'意外的消息类型: {kind!r}')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='本地HTTP转换服务：POST /convert 上传.pos文件，流式返回draw.io XML')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址，默认127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'监听端口，默认{DEFAULT_PORT}')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help='工作进程数（同时进行的转换数），默认CPU核数')
+    parser.add_argument('--max-pending', type=int, default=16, help='等待空闲工作进程的请求数上限，超出时返回503，默认16')
+    parser.add_argument('--max-body', type=int, default=DEFAULT_MAX_BODY, help=f'请求体字节数上限，默认{DEFAULT_MAX_BODY}')
+    parser.add_argument('--timeout', type=float, default=300, help='单个转换的超时秒数，默认300')
+    parser.add_argument('--client-timeout', type=float, default=30, help='等待客户端数据的超时秒数，默认30')
+    parser.add_argument('--max-requests', type=int, default=1000, help='每个工作进程处理这么多请求后替换为新进程，默认1000')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+# 主函数
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        return worker_main()
+    try:
+        asyncio.run(ConvertServer(args).serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+# 监视目录树中指定扩展名文件的新增和修改
+# Linux上通过ctypes直接调用inotify，其他平台（或inotify不可用时）退化为定期扫描比较size/mtime
+
+# inotify事件掩码，见 <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# 文件写完关闭、被移动进来（先写临时文件再改名的导出方式）、子目录创建
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+# 递归列出目录下指定扩展名的文件
+def scan_files(root, suffix):
+    found = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        for file_name in file_names:
+            if file_name.endswith(suffix):
+                found.append(os.path.join(dir_path, file_name))
+    return found
+
+# 基于inotify的监视器，每个目录一个watch，新建的子目录自动加入
+class InotifyWatcher:
+    def __init__(self, roots, suffix):
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError(errno.ENOSYS, '找不到libc')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, '当前系统不支持inotify')
+        self.libc = libc
+        self.suffix = suffix
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        # watch描述符 -> 目录路径
+        self.dirs = {}
+        try:
+            for root in self.roots:
+                self._add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self.dirs[wd] = path
+
+    # 监视整个目录树，返回其中已有的目标文件（目录刚创建时，里面的文件可能早于watch出现）
+    def _add_tree(self, root):
+        found = []
+        for dir_path, dir_names, file_names in os.walk(root):
+            try:
+                self._add_watch(dir_path)
+            except FileNotFoundError:
+                continue
+            found.extend(os.path.join(dir_path, f) for f in file_names if f.endswith(self.suffix))
+        return found
+
+    # 等待最多timeout秒（None为一直等待），返回期间新增或写入的文件路径
+    def read(self, timeout=None):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        changed = []
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            changed.extend(self._parse(data))
+        return changed
+
+    def _parse(self, data):
+        changed = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, pos)
+            name = os.fsdecode(data[pos + EVENT_HEADER.size:pos + EVENT_HEADER.size + length].rstrip(b'\0'))
+            pos += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，丢失的事件无从得知，重新扫描全部目录
+                for root in self.roots:
+                    changed.extend(scan_files(root, self.suffix))
+                continue
+            directory = self.dirs.get(wd)
+            if directory is None:
+                continue
+            if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                if mask & IN_IGNORED:
+                    del self.dirs[wd]
+                continue
+
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed.extend(self._add_tree(path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and name.endswith(self.suffix):
+                changed.append(path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+# 轮询监视器：每隔interval秒扫描一次目录树，比较每个文件的size和mtime
+# 没有“写完关闭”的通知，所以文件连续两次扫描没有变化后才报告，避免读到写了一半的文件
+class PollingWatcher:
+    def __init__(self, roots, suffix, interval=1.0):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.suffix = suffix
+        self.interval = interval
+        self.snapshot = self._scan()
+        # 最近一次报告（或启动时已存在）的状态
+        self.reported = dict(self.snapshot)
+        self.next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        snapshot = {}
+        for root in self.roots:
+            for path in scan_files(root, self.suffix):
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def read(self, timeout=None):
+        wait = self.next_scan - time.monotonic()
+        if timeout is not None and timeout < wait:
+            time.sleep(max(timeout, 0))
+            return []
+        time.sleep(max(wait, 0))
+        self.next_scan = time.monotonic() + self.interval
+
+        snapshot = self._scan()
+        changed = [path for path, state in snapshot.items()
+                   if state == self.snapshot.get(path) and state != self.reported.get(path)]
+        self.reported = {path: state for path, state in self.reported.items() if path in snapshot}
+        for path in changed:
+            self.reported[path] = snapshot[path]
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+# 优先使用inotify，不可用时退化为轮询
+def create_watcher(roots, suffix, polling=False, interval=1.0):
+    if not polling:
+        try:
+            return InotifyWatcher(roots, suffix)
+        except (OSError, AttributeError) as e:
+            print(f'inotify不可用（{e}），改为每{interval}秒轮询一次')
+    return PollingWatcher(roots, suffix, interval)
+
+# 合并短时间内对同一文件的多次写入：文件在delay秒内没有新的事件后才视为写完
+class Debouncer:
+    def __init__(self, delay):
+        self.delay = delay
+        self.deadlines = {}
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def touch(self, path, now=None):
+        self.deadlines[path] = (time.monotonic() if now is None else now) + self.delay
+
+    # 距离下一个文件就绪还要等待的秒数，没有等待中的文件时返回None
+    def timeout(self, now=None):
+        if not self.deadlines:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, min(self.deadlines.values()) - now)
+
+    # 取出已经就绪的文件
+    def pop_ready(self, now=None):
+        now = time.monotonic() if now is None else now
+        ready = [path for path, deadline in self.deadlines.items() if deadline <= now]
+        for path in ready:
+            del self.deadlines[path]
+        return ready
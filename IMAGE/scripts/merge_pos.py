@@ -0,0 +1,50 @@
+import argparse
+import sys
+import time
+
+from batch_convert import find_pos_files
+from pos2drawio.geometry import GeometryOptions
+from pos2drawio.merge import DEFAULT_MERGE_OUTPUT, merge_files
+from pos2drawio.text import LABEL_AUTO, LABEL_MODES
+
+# 把多个pos文件合并为一个多页的draw.io文档，每个文件一页，页面名取自图表标题
+# 例如把一套课件合并发布：python merge_pos.py ZOOKEEPER.pos ZOOKEEPER理论.pos -o ZOOKEEPER课件.drawio.xml
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='把多个pos文件合并为一个多页的draw.io文档')
+    parser.add_argument('paths', nargs='+', help='要合并的.pos文件或目录，按给出的顺序成页，目录内按路径排序')
+    parser.add_argument('-o', '--output', default=DEFAULT_MERGE_OUTPUT, help=f'输出文件，默认{DEFAULT_MERGE_OUTPUT}')
+    parser.add_argument('--embed-preview', action='store_true', help='把每个文件的预览图作为锁定的背景图片嵌入对应页面')
+    parser.add_argument('--compress', action='store_true', help='页面内容按draw.io的压缩格式写出，文件通常小5到10倍')
+    parser.add_argument('--labels', choices=LABEL_MODES, default=LABEL_AUTO,
+                        help='文本标签模式：auto只有换行时转纯文本、带行内样式时保留HTML，html总是保留HTML，text总是转纯文本')
+    parser.add_argument('--geometry', action='store_true',
+                        help='几何处理：按画布原点平移坐标、保留连接线折点并计算曲线锚点（需要numpy）')
+    parser.add_argument('--scale', type=float, default=1.0, help='几何处理时的缩放比例，默认1，指定时自动启用--geometry')
+    parser.add_argument('--snap', type=float, default=0, help='几何处理时对齐的网格大小，默认0不对齐，指定时自动启用--geometry')
+    return parser.parse_args(argv)
+
+# 主函数
+def main(argv=None):
+    args = parse_args(argv)
+    pos_files = [pos_file for _, pos_file in find_pos_files(args.paths)]
+    if not pos_files:
+        print('没有找到.pos文件')
+        return 1
+
+    geometry = None
+    if args.geometry or args.scale != 1.0 or args.snap:
+        geometry = GeometryOptions(scale=args.scale, snap=args.snap)
+
+    start = time.perf_counter()
+    stats = merge_files(pos_files, args.output, embed_preview=args.embed_preview, geometry=geometry,
+                        label_mode=args.labels, compress=args.compress)
+    for page in stats['files']:
+        renamed = f"，{page['renamed_ids']} 个重复的id已改名" if page['renamed_ids'] else ''
+        print(f"  {page['page']}: {page['file']}  元素 {page['elements']}，节点 {page['nodes']}，连接线 {page['links']}{renamed}")
+    print(f"已生成 {args.output}：{stats['pages']} 页，元素 {stats['elements']}，"
+          f"耗时 {time.perf_counter() - start:.2f}s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
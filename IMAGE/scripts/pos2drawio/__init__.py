@@ -0,0 +1,34 @@
+# ProcessOn .pos → draw.io 转换器
+#
+# 进程内调用示例:
+#     import pos2drawio
+#     stats = pos2drawio.convert_file('ZOOKEEPER.pos')          # 写入 ZOOKEEPER.drawio.xml
+#     pos2drawio.convert('ZOOKEEPER.pos', out)                  # 写入任意文本流
+#     pos2drawio.extract_preview('ZOOKEEPER.pos', 'ZOOKEEPER.png')  # 解码内嵌的预览图
+#     pos2drawio.patch_file('ZOOKEEPER.pos')                    # 只更新变化的单元格
+#     pos2drawio.TextIndex().search('ZAB 选举')                 # 在已索引的图表中全文检索
+#     pos2drawio.merge_files(['a.pos', 'b.pos'], 'ab.drawio.xml')  # 多个文件合并为一个多页文档
+#     pos2drawio.convert_file('ZOOKEEPER.pos', z_order=True)    # 按zindex层叠顺序写出单元格
+#
+# 新的元素类型通过 register_handler / handles 注册到分派表中
+
+from .compression import compress_diagram, decompress_diagram
+from .core import (CONVERTER_VERSION, convert, convert_elements, convert_file, convert_paged, convert_pos_data,
+                   default_output_path, iter_pos_elements, preview_output_path, write_elements)
+from .filters import ElementFilter, filter_elements, select_from_index
+from .geometry import Geometry, GeometryOptions
+from .handlers import HANDLERS, LINKER, NODE, Handler, get_element_text, get_handler, handles, register_handler
+from .index import PosIndex, build_index, load_index
+from .merge import merge, merge_files
+from .metrics import Metrics
+from .paging import parse_page_size, plan_pages
+from .patch import patch_file
+from .preview import extract_preview, read_preview_info, write_preview_cell
+from .reader import drop_boilerplate, open_pos_stream, read_diagram_title, read_pos_elements, read_pos_file
+from .scanner import ScanError, find_value_span, find_value_start
+from .search import TextIndex, tokenize
+from .table import NodeTable
+from .text import LABEL_AUTO, LABEL_HTML, LABEL_MODES, LABEL_TEXT, html_to_text, translate_label
+from .validator import validate_file
+from .writer import DrawioWriter
+from .zorder import external_sort, iter_z_ordered
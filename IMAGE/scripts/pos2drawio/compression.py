@@ -0,0 +1,73 @@
+import base64
+import binascii
+import io
+import re
+import zlib
+from urllib.parse import unquote_to_bytes
+
+# draw.io的压缩页面格式：<diagram>的文本内容为 base64(raw deflate(encodeURIComponent(mxGraphModel的XML)))
+
+# encodeURIComponent不转义的字符
+URI_SAFE = frozenset(b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_.!~*\'()')
+# 每个字节对应的编码结果，整块编码时用map查表，不需要逐字节的Python循环
+URI_QUOTE_TABLE = [chr(b) if b in URI_SAFE else f'%{b:02X}' for b in range(256)]
+
+# 解压时每次base64解码的字符数，必须是4的倍数
+DECOMPRESS_CHUNK_SIZE = 4 * 16 * 1024
+# 末尾可能被截断的百分号编码
+PARTIAL_QUOTE_RE = re.compile(rb'%[0-9A-Fa-f]?\Z')
+
+def encode_uri_component(text):
+    return ''.join(map(URI_QUOTE_TABLE.__getitem__, text.encode('utf-8')))
+
+# 把写入的文本边生成边压缩，并把base64结果写到out，不在内存中保留整页的XML
+# 与文本流一样使用write()，最后必须调用close()写出剩余的数据
+class DeflateBase64Writer:
+    def __init__(self, out, level=9):
+        self.out = out
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        # 不足3字节、暂时无法base64编码的压缩数据
+        self.pending = b''
+
+    def write(self, text):
+        self._emit(self.compressor.compress(encode_uri_component(text).encode('ascii')))
+        return len(text)
+
+    def close(self):
+        self._emit(self.compressor.flush(), final=True)
+
+    def _emit(self, data, final=False):
+        data = self.pending + data
+        cut = len(data) if final else len(data) - len(data) % 3
+        if cut:
+            self.out.write(base64.b64encode(data[:cut]).decode('ascii'))
+        self.pending = data[cut:]
+
+# 压缩一整页XML
+def compress_diagram(xml):
+    out = io.StringIO()
+    writer = DeflateBase64Writer(out)
+    writer.write(xml)
+    writer.close()
+    return out.getvalue()
+
+# 逐块产出压缩页面解码后的XML字节
+def iter_decompressed(payload, chunk_size=DECOMPRESS_CHUNK_SIZE):
+    payload = ''.join(payload.split())
+    decompressor = zlib.decompressobj(-15)
+    tail = b''
+    try:
+        for pos in range(0, len(payload), chunk_size):
+            data = tail + decompressor.decompress(base64.b64decode(payload[pos:pos + chunk_size]))
+            # 百分号编码可能被块边界截断，留到下一块
+            partial = PARTIAL_QUOTE_RE.search(data)
+            cut = partial.start() if partial else len(data)
+            tail = data[cut:]
+            yield unquote_to_bytes(data[:cut])
+        yield unquote_to_bytes(tail + decompressor.flush())
+    except (binascii.Error, zlib.error) as e:
+        raise ValueError(f'压缩页面无法解码: {e}') from None
+
+# 解压一整页，返回XML文本
+def decompress_diagram(payload):
+    return b''.join(iter_decompressed(payload)).decode('utf-8')
@@ -0,0 +1,374 @@
+import contextlib
+import json
+import os
+import time
+import uuid
+
+import ijson
+
+from .filters import filter_elements, select_from_index
+from .geometry import Geometry
+from .handlers import LINKER, NODE, get_element_text, get_handler
+from .index import load_index
+from .metrics import (PHASE_GEOMETRY, PHASE_INDEX, PHASE_LINK, PHASE_NODE, PHASE_PARSE, PHASE_PREVIEW, PHASE_SERIALIZE,
+                      PHASE_TEXT, PHASE_TOTAL, Metrics)
+from .paging import page_link_cells, plan_pages
+from .preview import extract_preview as extract_preview_image
+from .preview import read_preview_info, write_preview_cell
+from .reader import map_pos_file, open_pos_stream
+from .styles import style_cache_info
+from .text import LABEL_AUTO
+from .writer import DIAGRAM_ATTRS, DrawioWriter
+from .zorder import iter_z_ordered, node_ids
+
+# 转换器版本，输出格式发生变化时递增，使增量转换缓存失效
+CONVERTER_VERSION = 4
+
+# 使用ijson.kvitems逐个产出 (element_id, element_data)，任意时刻只有一个元素在内存中
+# pngdata预览图在送入ijson之前就被跳过，不会被逐字节分词
+def iter_pos_elements(file_path):
+    with open_pos_stream(file_path) as f:
+        yield from ijson.kvitems(f, 'diagram.elements.elements')
+
+# 逐个元素转换并写入writer
+# 每个元素按name在分派表中找到处理器，不支持的类型直接跳过
+# 节点转换后立即写出；两端节点都已写出的连接线也立即写出，
+# 否则只缓存连接线的id、两端id和转换好的属性，等缺失的端点节点出现后再写出
+# geometry为Geometry时，用其中批量处理过的几何信息替换处理器输出的mxGeometry
+# label_mode为文本标签的转换模式，见text.LABEL_MODES
+# known_nodes为输出中已经存在或一定会写出的节点id（增量更新、按层叠顺序写出时），连向这些节点的连接线不必等待
+# check_node为可调用对象时，known_nodes中还没有写出的节点第一次被连接线引用时由它预先转换一遍，
+# 返回False（转换会失败）的节点不算已知，连向它的连接线照常等待，最后报告跳过
+# metrics为Metrics时各阶段的耗时和计数累加到其中，元素级日志按其抽样比例打印
+# 循环中直接读时钟并累加到局部变量，每个元素的计时开销只有几次perf_counter调用
+def write_elements(element_items, writer, geometry=None, label_mode=LABEL_AUTO, known_nodes=(), metrics=None,
+                   check_node=None):
+    if metrics is None:
+        metrics = Metrics()
+    stats = {'elements': 0, 'nodes': 0, 'links': 0}
+    # 各阶段的累计耗时，结束时计入metrics
+    spent = dict.fromkeys((PHASE_TEXT, PHASE_NODE, PHASE_LINK, PHASE_GEOMETRY, PHASE_SERIALIZE), 0.0)
+    clock = time.perf_counter
+    log_elements = metrics.log_sample > 0
+    style_cache = style_cache_info()
+
+    # 已写出节点的id
+    nodes = set(known_nodes)
+    # 已写出或已经由check_node确认过的节点id
+    checked = set()
+    # 缺失的端点id -> 等待该节点的连接线列表
+    waiting_links = {}
+
+    def emit_link(link):
+        element_id, source_id, target_id, attrs, children = link
+        start = clock()
+        writer.write_cell(attrs, children)
+        spent[PHASE_SERIALIZE] += clock() - start
+        stats['links'] += 1
+        if log_elements and metrics.sampled():
+            print(f"Created link {element_id} from {source_id} to {target_id} {'- ' + attrs['value'][:30] if attrs['value'] else ''}")
+
+    # 连接线的端点都已就绪时写出，否则挂到第一个缺失的端点上
+    def resolve_link(link):
+        _, source_id, target_id, _, _ = link
+        for endpoint_id in (source_id, target_id):
+            if check_node is not None and endpoint_id in nodes and endpoint_id not in checked:
+                checked.add(endpoint_id)
+                if not check_node(endpoint_id):
+                    nodes.discard(endpoint_id)
+            if endpoint_id not in nodes:
+                waiting_links.setdefault(endpoint_id, []).append(link)
+                return
+        emit_link(link)
+
+    for element_id, element_data in metrics.timed_iter(PHASE_PARSE, element_items):
+        stats['elements'] += 1
+        element_type = element_data.get('name')
+        handler = get_handler(element_type)
+        if handler is None:
+            metrics.count('unsupported_elements')
+            continue
+
+        if handler.kind == NODE:
+            # 创建节点
+            try:
+                t0 = clock()
+                text = get_element_text(element_data, label_mode)
+                t1 = clock()
+                attrs, children = handler.convert(element_id, element_data, text)
+                t2 = clock()
+                if geometry is not None:
+                    attrs, children = geometry.apply(element_id, NODE, attrs, children)
+                t3 = clock()
+                writer.write_cell(attrs, children)
+                spent[PHASE_SERIALIZE] += clock() - t3
+                spent[PHASE_TEXT] += t1 - t0
+                spent[PHASE_NODE] += t2 - t1
+                spent[PHASE_GEOMETRY] += t3 - t2
+
+                nodes.add(element_id)
+                if check_node is not None:
+                    checked.add(element_id)
+                stats['nodes'] += 1
+                if log_elements and metrics.sampled():
+                    print(f"Created node {element_id}: {element_type} - {text[:50]}{'...' if len(text) > 50 else ''}")
+            except Exception as e:
+                metrics.count('node_errors')
+                metrics.log_error(f"Error creating node {element_id}: {e}")
+                # 预先声明为已知的节点没能写出，之后连向它的连接线不能再直接写出
+                nodes.discard(element_id)
+                continue
+
+            # 写出等待这个节点的连接线
+            for link in waiting_links.pop(element_id, ()):
+                resolve_link(link)
+
+        elif handler.kind == LINKER:
+            try:
+                t0 = clock()
+                text = get_element_text(element_data, label_mode)
+                t1 = clock()
+                attrs, children = handler.convert(element_id, element_data, text)
+                t2 = clock()
+                if geometry is not None:
+                    attrs, children = geometry.apply(element_id, LINKER, attrs, children)
+                spent[PHASE_GEOMETRY] += clock() - t2
+                spent[PHASE_TEXT] += t1 - t0
+                spent[PHASE_LINK] += t2 - t1
+                resolve_link((element_id, attrs['source'], attrs['target'], attrs, children))
+            except Exception as e:
+                metrics.count('link_errors')
+                metrics.log_error(f"Error creating link {element_id}: {e}")
+
+    # 到最后端点仍未出现的连接线
+    for pending in waiting_links.values():
+        for element_id, source_id, target_id, _, _ in pending:
+            metrics.count('skipped_links')
+            print(f"Skipping link {element_id}: source {source_id} or target {target_id} not found")
+
+    calls = {PHASE_TEXT: stats['nodes'] + stats['links'], PHASE_NODE: stats['nodes'], PHASE_LINK: stats['links'],
+             PHASE_GEOMETRY: stats['nodes'] + stats['links'] if geometry is not None else 0,
+             PHASE_SERIALIZE: stats['nodes'] + stats['links']}
+    for phase, seconds in spent.items():
+        metrics.add_time(phase, seconds, calls[phase])
+    for key, value in stats.items():
+        metrics.count(key, value)
+    hits, misses = style_cache_info()
+    metrics.count('style_cache_hits', hits - style_cache[0])
+    metrics.count('style_cache_misses', misses - style_cache[1])
+
+    print(f"Processed {stats['elements']} elements")
+    print(f"Created {stats['nodes']} nodes")
+    print(f"Created {stats['links']} links")
+
+    return stats
+
+# 把 (element_id, element_data) 序列转换为完整的draw.io文档写入out，返回统计信息
+# preview_from为pos文件路径时，先把其中的预览图作为背景图片单元格写入
+# compress为True时页面内容按draw.io的压缩格式（raw deflate + base64）写出
+# known_nodes为输入中一定会出现的节点id，连向这些节点的连接线不必等待端点写出，check_node见write_elements
+def convert_elements(element_items, out, indent='  ', preview_from=None, geometry=None, label_mode=LABEL_AUTO,
+                     compress=False, metrics=None, known_nodes=(), check_node=None):
+    if metrics is None:
+        metrics = Metrics()
+    writer = DrawioWriter(out, indent, compress)
+    writer.start()
+    if preview_from is not None:
+        with metrics.timer(PHASE_PREVIEW):
+            write_preview_cell(writer, preview_from, geometry=geometry)
+    stats = write_elements(element_items, writer, geometry, label_mode, known_nodes, metrics, check_node)
+    with metrics.timer(PHASE_SERIALIZE):
+        writer.end()
+    return stats
+
+# 转换已经解析好的pos数据（read_pos_file的返回值）
+def convert_pos_data(pos_data, out, indent='  '):
+    elements = pos_data.get('diagram', {}).get('elements', {}).get('elements', {})
+    return convert_elements(elements.items(), out, indent)
+
+# 流式转换一个pos文件写入out：边解析边转换边写出
+# embed_preview为True时把pngdata预览图嵌入为背景图片
+# page_size为 (宽, 高) 时按网格分页，每个格子输出为一个<diagram>页面
+# geometry为GeometryOptions时先读一遍所有元素做几何处理（平移、缩放、对齐网格、连接线控制点），再转换
+# metrics为Metrics时记录各阶段的耗时和计数，见metrics模块
+# element_filter为filters.ElementFilter时只转换满足条件的元素，其余元素解析后立即丢弃
+# z_order为True时按props.zindex的层叠顺序写出单元格（见zorder模块），连接线也按自己的zindex写出，
+# 不再等待端点节点；默认按文件中的顺序写出
+def convert(pos_file, out, indent='  ', embed_preview=False, page_size=None, geometry=None, label_mode=LABEL_AUTO,
+            compress=False, metrics=None, element_filter=None, z_order=False):
+    if metrics is None:
+        metrics = Metrics()
+    if page_size is not None:
+        return convert_paged(pos_file, out, page_size, indent, embed_preview, geometry, label_mode, compress, metrics,
+                             element_filter, z_order)
+
+    known_nodes = ()
+    if z_order:
+        # 排序键和节点id取自元素索引；筛选条件也在索引记录上判断
+        with metrics.timer(PHASE_INDEX):
+            index = load_index(pos_file)
+            selection = select_from_index(index, element_filter) if element_filter else None
+            known_nodes = selection[0] if selection else node_ids(index)
+
+    # 几何处理和转换各读一遍，筛选掉的元素数只在转换时计入metrics
+    def elements(metrics=None):
+        if z_order:
+            return iter_z_ordered(index, selection, metrics=metrics)
+        items = iter_pos_elements(pos_file)
+        return items if element_filter is None else filter_elements(items, element_filter, metrics)
+
+    stage = None
+    if geometry:
+        with metrics.timer(PHASE_GEOMETRY):
+            stage = build_geometry(pos_file, elements(), geometry)
+    with contextlib.ExitStack() as stack:
+        check_node = None
+        if z_order:
+            check_node = _node_checker(index, stack.enter_context(map_pos_file(pos_file)), label_mode, stage)
+        return convert_elements(elements(metrics), out, indent,
+                                preview_from=pos_file if embed_preview else None, geometry=stage,
+                                label_mode=label_mode, compress=compress, metrics=metrics, known_nodes=known_nodes,
+                                check_node=check_node)
+
+# 按层叠顺序写出时连接线可能先于端点节点写出：第一次引用还没写出的节点时从mm中解码并预先转换一遍，
+# 转换会失败的节点不算已知，连向它的连接线与按文件顺序转换时一样被跳过，不会指向不存在的单元格
+def _node_checker(index, mm, label_mode, geometry):
+    def check(element_id):
+        entry = index.get(element_id)
+        try:
+            element_data = json.loads(bytes(mm[entry.offset:entry.offset + entry.length]))
+            handler = get_handler(element_data.get('name'))
+            attrs, children = handler.convert(element_id, element_data, get_element_text(element_data, label_mode))
+            if geometry is not None:
+                geometry.apply(element_id, NODE, attrs, children)
+        except Exception:
+            return False
+        return True
+    return check
+
+# 对pos文件中的元素做几何处理，画布原点取diagram.image的x/y
+def build_geometry(pos_file, element_items, options):
+    info = read_preview_info(pos_file) or {}
+    origin = (float(info.get('x', 0)), float(info.get('y', 0)))
+    return Geometry(element_items, options, origin)
+
+# 分页转换：借助元素索引按网格把节点分到各页，每页只从pos文件中解码本页用到的元素
+# 跨页的连接线在两侧页面各画成一段连向跳转链接的线，点击即可切换到对方页面
+# 预览图覆盖整张画布，只嵌入到第一页
+# element_filter的类型、zindex和区域条件直接在索引记录上判断，不满足条件的元素不会被解码
+# z_order为True时每页内按层叠顺序写出，跨页连接线及其占位节点仍写在页面最后
+def convert_paged(pos_file, out, page_size, indent='  ', embed_preview=False, geometry=None, label_mode=LABEL_AUTO,
+                  compress=False, metrics=None, element_filter=None, z_order=False):
+    if metrics is None:
+        metrics = Metrics()
+    with metrics.timer(PHASE_INDEX):
+        index = load_index(pos_file)
+        selection = select_from_index(index, element_filter) if element_filter else None
+        pages = plan_pages(index, page_size, selection)
+    if selection is not None:
+        planned = sum(len(page.element_ids) + len(page.outgoing) for page in pages)
+        supported = sum(count for element_type, count in index.type_counts().items() if get_handler(element_type))
+        metrics.count('filtered_elements', supported - planned)
+    stage = None
+    if geometry:
+        with metrics.timer(PHASE_GEOMETRY):
+            stage = build_geometry(pos_file, index.iter_elements(), geometry)
+
+    stats = {'elements': 0, 'nodes': 0, 'links': 0, 'pages': len(pages)}
+    writer = DrawioWriter(out, indent, compress)
+    for i, page in enumerate(pages):
+        diagram_attrs = dict(DIAGRAM_ATTRS, name=page.name, id=page.id)
+        if i == 0:
+            writer.start(diagram_attrs=diagram_attrs)
+            if embed_preview:
+                with metrics.timer(PHASE_PREVIEW):
+                    write_preview_cell(writer, pos_file, geometry=stage)
+        else:
+            with metrics.timer(PHASE_SERIALIZE):
+                writer.end_diagram()
+                writer.start_diagram(diagram_attrs)
+
+        known_nodes = ()
+        if z_order:
+            known_nodes = {element_id for element_id in page.element_ids
+                           if get_handler(index.get(element_id).type).kind == NODE}
+        with contextlib.ExitStack() as stack:
+            check_node = None
+            if z_order:
+                check_node = _node_checker(index, stack.enter_context(map_pos_file(pos_file)), label_mode, stage)
+            page_stats = write_elements(index.iter_elements(page.element_ids, z_order), writer, stage, label_mode,
+                                        known_nodes, metrics, check_node)
+        for key in ('elements', 'nodes', 'links'):
+            stats[key] += page_stats[key]
+
+        # 跨页连接线
+        cross_links = [(linker_id, other_page, True) for linker_id, other_page in page.outgoing]
+        cross_links.extend((linker_id, other_page, False) for linker_id, other_page in page.incoming)
+        other_pages = {linker_id: (other_page, outgoing) for linker_id, other_page, outgoing in cross_links}
+        for linker_id, element_data in metrics.timed_iter(PHASE_PARSE, index.iter_elements(other_pages)):
+            other_page, outgoing = other_pages[linker_id]
+            try:
+                with metrics.timer(PHASE_LINK):
+                    text = get_element_text(element_data, label_mode)
+                    stub, attrs, children = page_link_cells(linker_id, element_data, text, other_page, outgoing,
+                                                            stage.transform_point if stage else None)
+                with metrics.timer(PHASE_SERIALIZE):
+                    writer.write_object(*stub)
+                    writer.write_cell(attrs, children)
+            except Exception as e:
+                metrics.count('link_errors')
+                metrics.log_error(f"Error creating page link {linker_id}: {e}")
+                continue
+            if outgoing:
+                stats['elements'] += 1
+                stats['links'] += 1
+            metrics.count('page_links')
+            metrics.log_element(lambda: f"Created page link {linker_id} {'to' if outgoing else 'from'} {other_page.name}")
+
+    with metrics.timer(PHASE_SERIALIZE):
+        if not pages:
+            writer.start()
+        writer.end()
+    metrics.count('pages', stats['pages'])
+    print(f"Created {stats['pages']} pages")
+    return stats
+
+# 流式转换一个pos文件并保存为xml文件，xml_file默认为同名的.drawio.xml
+# 先写入同目录下的临时文件，成功后再替换目标文件，失败时不会留下半截的xml
+# 临时文件名带进程号和随机后缀，并发转换同一文件也互不干扰
+# extract_preview为True时同时把预览图解码为同名的.png文件
+def convert_file(pos_file, xml_file=None, indent='  ', embed_preview=False, extract_preview=False, page_size=None,
+                 geometry=None, label_mode=LABEL_AUTO, compress=False, metrics=None, element_filter=None,
+                 z_order=False):
+    if metrics is None:
+        metrics = Metrics()
+    if xml_file is None:
+        xml_file = default_output_path(pos_file)
+    tmp_file = f'{xml_file}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+    try:
+        with metrics.timer(PHASE_TOTAL):
+            with open(tmp_file, 'x', encoding='utf-8') as f:
+                stats = convert(pos_file, f, indent, embed_preview, page_size, geometry, label_mode, compress, metrics,
+                                element_filter, z_order)
+            os.replace(tmp_file, xml_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+    if extract_preview:
+        with metrics.timer(PHASE_PREVIEW):
+            stats['preview_bytes'] = extract_preview_image(pos_file, preview_output_path(xml_file))
+    metrics.count('files')
+    return stats
+
+# pos文件对应的默认输出路径
+def default_output_path(pos_file):
+    if pos_file.endswith('.pos'):
+        pos_file = pos_file[:-len('.pos')]
+    return pos_file + '.drawio.xml'
+
+# 输出文件对应的预览图路径
+def preview_output_path(xml_file):
+    if xml_file.endswith('.drawio.xml'):
+        xml_file = xml_file[:-len('.drawio.xml')]
+    return xml_file + '.png'
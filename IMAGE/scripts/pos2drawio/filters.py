@@ -0,0 +1,157 @@
+import math
+import re
+import sys
+from collections import namedtuple
+
+from .handlers import NODE, get_handler
+from .index import element_bbox, element_zindex
+from .search import element_text
+
+# 子集转换：只转换满足条件的元素，条件在解析出元素之后、构建样式和XML之前判断
+# types为元素类型（name）的集合；bbox为 (x, y, w, h) 区域，节点中心落在区域内才保留；
+# text为对标签纯文本做re.search的正则；zindex为 (下限, 上限) 闭区间，任一端可以为None
+# 节点按全部条件筛选；连接线按类型和zindex筛选，并且两端节点都被保留时才保留
+# 所有字段都是普通值，可以直接作为转换选项写入缓存清单
+ElementFilter = namedtuple('ElementFilter', ['types', 'bbox', 'text', 'zindex'])
+ElementFilter.__new__.__defaults__ = (None, None, None, None)
+
+# 解析 "x,y,w,h" 形式的区域
+def parse_bbox(text):
+    try:
+        x, y, w, h = (float(v) for v in text.split(','))
+    except ValueError:
+        raise ValueError(f'区域应为 x,y,宽,高，例如 0,0,2000,1500: {text}') from None
+    if w <= 0 or h <= 0:
+        raise ValueError(f'区域的宽高必须为正数: {text}')
+    return x, y, w, h
+
+# 解析 "下限:上限" 形式的zindex范围，任一端可以省略
+def parse_zindex_range(text):
+    low, sep, high = text.partition(':')
+    if not sep:
+        low = high = text
+    try:
+        return (int(low) if low.strip() else None, int(high) if high.strip() else None)
+    except ValueError:
+        raise ValueError(f'zindex范围应为 下限:上限，例如 10:200 或 :50: {text}') from None
+
+# 编译后的判断条件，从便宜到昂贵依次判断：类型、zindex、区域、文本
+class _Predicates:
+    def __init__(self, element_filter):
+        self.types = frozenset(element_filter.types) if element_filter.types else None
+        self.bbox = element_filter.bbox
+        self.text = re.compile(element_filter.text) if element_filter.text else None
+        self.zindex_low, self.zindex_high = element_filter.zindex or (None, None)
+
+    def match_type(self, element_type):
+        return self.types is None or element_type in self.types
+
+    def match_zindex(self, zindex):
+        return ((self.zindex_low is None or zindex >= self.zindex_low)
+                and (self.zindex_high is None or zindex <= self.zindex_high))
+
+    def match_bbox(self, bbox):
+        if self.bbox is None:
+            return True
+        x, y, w, h = bbox
+        if math.isnan(x) or math.isnan(y) or math.isnan(w) or math.isnan(h):
+            return False
+        rx, ry, rw, rh = self.bbox
+        cx, cy = x + w / 2, y + h / 2
+        return rx <= cx <= rx + rw and ry <= cy <= ry + rh
+
+    def match_text(self, element_data):
+        return self.text is None or self.text.search(element_text(element_data)) is not None
+
+    # 不需要解码元素就能判断的条件
+    def match_meta(self, kind, element_type, zindex, bbox):
+        if not self.match_type(element_type) or not self.match_zindex(zindex):
+            return False
+        return kind != NODE or self.match_bbox(bbox)
+
+# 流式筛选 (element_id, element_data) 序列
+# 两端节点都已保留的连接线立即产出；端点还没出现的连接线暂存，等端点出现后再决定，
+# 所以产出顺序可能与输入不同（write_elements本来就允许任意顺序）
+# 只记录节点id（驻留的字符串），被丢弃的元素在这里就被释放，不会进入样式和XML阶段
+def filter_elements(element_items, element_filter, metrics=None):
+    predicates = _Predicates(element_filter)
+    kept = set()
+    rejected = set()
+    # 缺失的端点id -> 等待该节点的连接线 [(linker_id, element_data)]
+    waiting = {}
+    dropped = 0
+
+    # 连接线的两端都已确定时返回True（保留）或False（丢弃），还有端点未出现时挂到该端点上并返回None
+    def resolve(linker_id, element_data):
+        for end in ('from', 'to'):
+            endpoint_id = (element_data.get(end) or {}).get('id')
+            if endpoint_id in rejected:
+                return False
+            if endpoint_id not in kept:
+                waiting.setdefault(endpoint_id, []).append((linker_id, element_data))
+                return None
+        return True
+
+    for element_id, element_data in element_items:
+        element_type = element_data.get('name')
+        handler = get_handler(element_type)
+        if handler is None:
+            yield element_id, element_data
+            continue
+        kind = handler.kind
+        bbox = element_bbox(element_data) if kind == NODE and predicates.bbox else None
+        if (not predicates.match_meta(kind, element_type, element_zindex(element_data), bbox)
+                or kind == NODE and not predicates.match_text(element_data)):
+            dropped += 1
+            if kind == NODE:
+                rejected.add(sys.intern(element_id))
+                dropped += len(waiting.pop(element_id, ()))
+            continue
+
+        if kind != NODE:
+            decision = resolve(element_id, element_data)
+            if decision:
+                yield element_id, element_data
+            elif decision is False:
+                dropped += 1
+            continue
+
+        kept.add(sys.intern(element_id))
+        yield element_id, element_data
+        # 重新判断等待这个节点的连接线
+        for linker_id, linker_data in waiting.pop(element_id, ()):
+            decision = resolve(linker_id, linker_data)
+            if decision:
+                yield linker_id, linker_data
+            elif decision is False:
+                dropped += 1
+
+    # 端点始终没有出现的连接线原样交给write_elements，由它报告跳过
+    for pending in waiting.values():
+        yield from pending
+
+    if metrics is not None:
+        metrics.count('filtered_elements', dropped)
+
+# 借助元素索引筛选，返回保留的节点id集合和候选连接线id集合
+# 类型、zindex和区域直接用索引中的记录判断，只有文本条件需要解码候选节点；
+# 连接线的端点由调用方在解码连接线时检查（见paging.plan_pages）
+def select_from_index(index, element_filter):
+    predicates = _Predicates(element_filter)
+    nodes = set()
+    text_candidates = []
+    linkers = set()
+    for entry in index.entries():
+        handler = get_handler(entry.type)
+        if handler is None or not predicates.match_meta(handler.kind, entry.type, entry.zindex, entry.bbox):
+            continue
+        if handler.kind != NODE:
+            linkers.add(entry.id)
+        elif predicates.text is None:
+            nodes.add(entry.id)
+        else:
+            text_candidates.append(entry.id)
+    for element_id, element_data in index.iter_elements(text_candidates):
+        if predicates.match_text(element_data):
+            nodes.add(element_id)
+    return nodes, linkers
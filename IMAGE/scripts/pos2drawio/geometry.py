@@ -0,0 +1,183 @@
+import math
+import sys
+from array import array
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .handlers import LINKER, NODE, get_handler
+from .table import NodeTable
+
+# 几何处理阶段：先把所有节点的外框和连接线的端点/折点收集到NumPy数组中，
+# 整批做平移、缩放、网格对齐和曲线锚点计算，写出时再按id取回结果替换mxGeometry
+# translate为True时按diagram.image的x/y把画布原点移到(0, 0)；snap为网格大小，0表示不对齐
+GeometryOptions = namedtuple('GeometryOptions', ['translate', 'scale', 'snap'])
+GeometryOptions.__new__.__defaults__ = (True, 1.0, 0)
+
+# ProcessOn的linkerType -> 附加的draw.io连接线样式
+LINKER_TYPE_STYLES = {
+    'curve': 'curved=1',
+    'broken': 'edgeStyle=orthogonalEdgeStyle',
+}
+
+# 曲线缺少控制点时，控制点沿锚点方向伸出两端距离的这个比例，但不少于MIN_CONTROL_DISTANCE
+CONTROL_DISTANCE_RATIO = 0.4
+MIN_CONTROL_DISTANCE = 20.0
+
+NAN = float('nan')
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+# 端点id和连接线类型大量重复，驻留后共用同一个字符串对象
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+def _format(value):
+    return str(float(value))
+
+# 收集阶段：节点的外框存入NodeTable，连接线的端点和折点存入array，不保留元素字典，最后由Geometry转换为NumPy数组
+class _Collector:
+    def __init__(self):
+        self.nodes = NodeTable()
+        self.linker_ids = {}
+        # 每条连接线6个数：from.x, from.y, from.angle, to.x, to.y, to.angle
+        self.ends = array('d')
+        self.source_ids = []
+        self.target_ids = []
+        self.linker_types = []
+        # 所有折点的x, y依次排列
+        self.points = array('d')
+        self.point_offsets = array('q', [0])
+
+    def add(self, element_id, element_data):
+        handler = get_handler(element_data.get('name'))
+        if handler is None:
+            return
+        if handler.kind == NODE:
+            self.nodes.add_element(element_id, element_data)
+        elif handler.kind == LINKER:
+            source = element_data.get('from') or {}
+            target = element_data.get('to') or {}
+            self.linker_ids[sys.intern(element_id)] = len(self.source_ids)
+            self.ends.extend((_number(source.get('x')), _number(source.get('y')), _number(source.get('angle')),
+                              _number(target.get('x')), _number(target.get('y')), _number(target.get('angle'))))
+            self.source_ids.append(_intern(source.get('id')))
+            self.target_ids.append(_intern(target.get('id')))
+            self.linker_types.append(_intern(element_data.get('linkerType')))
+            for point in element_data.get('points') or ():
+                self.points.append(_number(point.get('x')))
+                self.points.append(_number(point.get('y')))
+            self.point_offsets.append(len(self.points) // 2)
+
+# 几何处理结果
+class Geometry:
+    def __init__(self, element_items, options=GeometryOptions(), origin=(0.0, 0.0)):
+        if np is None:
+            raise RuntimeError('几何处理阶段需要安装numpy: pip install numpy')
+        self.options = options
+
+        collector = _Collector()
+        for element_id, element_data in element_items:
+            collector.add(element_id, element_data)
+
+        nodes = collector.nodes
+        self.node_ids = nodes.rows
+        self.linker_ids = collector.linker_ids
+        self.linker_types = collector.linker_types
+        self.point_offsets = np.frombuffer(collector.point_offsets, dtype=np.int64)
+
+        boxes = np.column_stack([np.frombuffer(column, dtype=np.float64)
+                                 for column in (nodes.x, nodes.y, nodes.w, nodes.h)]).reshape(-1, 4)
+        ends = np.frombuffer(collector.ends, dtype=np.float64).reshape(-1, 6)
+        points = np.frombuffer(collector.points, dtype=np.float64).reshape(-1, 2)
+
+        # 端点所在节点在boxes中的行号，找不到为-1
+        endpoint_rows = np.column_stack([np.fromiter((nodes.row(i, -1) for i in ids), dtype=np.int64, count=len(ids))
+                                         for ids in (collector.source_ids, collector.target_ids)]).reshape(-1, 2)
+
+        # 锚点在节点外框上的相对位置（draw.io的exitX/exitY、entryX/entryY），平移缩放不改变相对位置，
+        # 所以在变换之前用原始坐标计算
+        self.anchors = np.full((len(ends), 4), np.nan)
+        for side in (0, 1):
+            rows = endpoint_rows[:, side]
+            known = rows >= 0
+            box = boxes[rows[known]]
+            xy = ends[known][:, side * 3:side * 3 + 2]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                relative = (xy - box[:, :2]) / box[:, 2:]
+            self.anchors[known, side * 2:side * 2 + 2] = np.clip(relative, 0.0, 1.0)
+
+        # 没有控制点的曲线，沿锚点方向生成两个控制点；ProcessOn的角度a对应的伸出方向为 (-cos a, -sin a)
+        distance = np.hypot(ends[:, 3] - ends[:, 0], ends[:, 4] - ends[:, 1])
+        distance = np.maximum(distance * CONTROL_DISTANCE_RATIO, MIN_CONTROL_DISTANCE)
+        self.controls = np.empty((len(ends), 2, 2))
+        for side in (0, 1):
+            angle = ends[:, side * 3 + 2]
+            self.controls[:, side, 0] = ends[:, side * 3] - np.cos(angle) * distance
+            self.controls[:, side, 1] = ends[:, side * 3 + 1] - np.sin(angle) * distance
+
+        # 平移、缩放、网格对齐
+        self.origin = np.asarray(origin if options.translate else (0.0, 0.0), dtype=np.float64)
+        boxes[:, :2] = self.transform(boxes[:, :2])
+        boxes[:, 2:] *= options.scale
+        self.boxes = boxes
+        self.points = self.transform(points)
+        self.controls = self.transform(self.controls.reshape(-1, 2)).reshape(-1, 2, 2)
+
+    # 平移缩放并对齐网格，xy为 (..., 2) 的数组
+    def transform(self, xy):
+        xy = (np.asarray(xy, dtype=np.float64) - self.origin) * self.options.scale
+        if self.options.snap:
+            xy = np.round(xy / self.options.snap) * self.options.snap
+        return xy
+
+    # 单个点的变换，返回 (x, y)
+    def transform_point(self, x, y):
+        return tuple(self.transform([_number(x), _number(y)]).tolist())
+
+    # 用处理后的几何信息替换handler转换出的mxCell属性和子元素
+    def apply(self, element_id, kind, attrs, children):
+        if kind == NODE:
+            row = self.node_ids.get(element_id)
+            if row is None:
+                return attrs, children
+            x, y, w, h = self.boxes[row].tolist()
+            geometry = ('mxGeometry', {
+                'x': _format(x), 'y': _format(y), 'width': _format(w), 'height': _format(h), 'as': 'geometry'
+            }, ())
+            return attrs, [geometry]
+
+        row = self.linker_ids.get(element_id)
+        if row is None:
+            return attrs, children
+
+        style = [attrs['style']]
+        linker_type = self.linker_types[row]
+        if linker_type in LINKER_TYPE_STYLES:
+            style.append(LINKER_TYPE_STYLES[linker_type])
+        exit_x, exit_y, entry_x, entry_y = self.anchors[row].tolist()
+        if not (math.isnan(exit_x) or math.isnan(exit_y)):
+            style.append(f'exitX={exit_x:.4g};exitY={exit_y:.4g};exitDx=0;exitDy=0')
+        if not (math.isnan(entry_x) or math.isnan(entry_y)):
+            style.append(f'entryX={entry_x:.4g};entryY={entry_y:.4g};entryDx=0;entryDy=0')
+        attrs = dict(attrs, style=';'.join(style))
+
+        start, end = self.point_offsets[row], self.point_offsets[row + 1]
+        points = self.points[start:end]
+        if end == start and linker_type == 'curve':
+            points = self.controls[row]
+        points = points[~np.isnan(points).any(axis=1)]
+
+        geometry_children = ()
+        if len(points):
+            geometry_children = [('Array', {'as': 'points'}, [
+                ('mxPoint', {'x': _format(x), 'y': _format(y)}, ()) for x, y in points.tolist()
+            ])]
+        return attrs, [('mxGeometry', {'relative': '1', 'as': 'geometry'}, geometry_children)]
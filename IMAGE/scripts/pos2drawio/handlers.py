@@ -0,0 +1,75 @@
+from collections import namedtuple
+
+from .styles import SHAPE_STYLES, linker_style, node_style
+from .text import LABEL_AUTO, translate_label
+
+NODE = 'node'
+LINKER = 'linker'
+
+# 元素处理器
+# kind为NODE或LINKER，convert(element_id, element_data, text) 返回 (mxCell属性, 子元素列表)
+Handler = namedtuple('Handler', ['kind', 'convert'])
+
+# 元素类型(element['name']) -> 处理器的分派表
+HANDLERS = {}
+
+# 注册处理器，已存在的同名处理器会被替换
+def register_handler(name, kind, convert):
+    if kind not in (NODE, LINKER):
+        raise ValueError(f'未知的处理器类型: {kind}')
+    HANDLERS[name] = Handler(kind, convert)
+
+# 装饰器形式的注册，可以一次注册多个元素类型
+def handles(*names, kind=NODE):
+    def decorator(convert):
+        for name in names:
+            register_handler(name, kind, convert)
+        return convert
+    return decorator
+
+# 查找元素类型对应的处理器，不支持的类型返回None
+def get_handler(name):
+    return HANDLERS.get(name)
+
+# 提取textBlock中的文本并转换为draw.io标签，mode见text.LABEL_MODES
+def get_element_text(element_data, mode=LABEL_AUTO):
+    text = ''
+    if 'textBlock' in element_data and element_data['textBlock']:
+        text_block = element_data['textBlock'][0]
+        if 'text' in text_block:
+            text = translate_label(text_block['text'], mode)
+    return text
+
+# 把节点元素转换为mxCell的属性和子元素
+@handles(*SHAPE_STYLES)
+def convert_node(element_id, element_data, text):
+    # 几何信息
+    props = element_data['props']
+    geometry = ('mxGeometry', {
+        'x': str(props['x']),
+        'y': str(props['y']),
+        'width': str(props['w']),
+        'height': str(props['h']),
+        'as': 'geometry'
+    }, ())
+
+    return {
+        'id': element_id,
+        'value': text,
+        'style': node_style(element_data),
+        'parent': '1',
+        'vertex': '1'
+    }, [geometry]
+
+# 把连接线元素转换为mxCell的属性和子元素
+@handles('linker', kind=LINKER)
+def convert_linker(element_id, element_data, text):
+    return {
+        'id': element_id,
+        'value': text,
+        'style': linker_style(element_data),
+        'parent': '1',
+        'source': element_data['from']['id'],
+        'target': element_data['to']['id'],
+        'edge': '1'
+    }, [('mxGeometry', {'relative': '1', 'as': 'geometry'}, ())]
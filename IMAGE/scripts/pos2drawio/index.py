@@ -0,0 +1,194 @@
+import json
+import os
+import struct
+import uuid
+from collections import namedtuple
+
+from .reader import ELEMENTS_PATH, map_pos_file
+from .scanner import ScanError, find_value_start, iter_member_values
+
+# 元素偏移索引：与pos文件放在一起的 <pos文件>.idx 旁路文件
+# 文件格式：
+#   INDEX_MAGIC
+#   一行JSON头：版本、源文件size/mtime_ns、元素数量、类型表
+#   count条定长记录 RECORD：偏移、长度、类型序号、zindex、bbox(x, y, w, h)
+#   所有元素id，按记录顺序以\n分隔的UTF-8文本
+# 查询时只读取头和id，按需解码记录，再从mmap的pos文件中解码需要的元素
+
+INDEX_MAGIC = b'POSIDX\n'
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.idx'
+RECORD = struct.Struct('<QIHi4d')
+
+NAN = float('nan')
+
+# 索引中的一个元素；bbox为 (x, y, w, h)，未知时为NaN
+IndexEntry = namedtuple('IndexEntry', ['id', 'offset', 'length', 'type', 'zindex', 'bbox'])
+
+# 索引与pos文件不一致或格式不对时抛出
+class PosIndexError(ValueError):
+    pass
+
+# pos文件对应的默认索引路径
+def default_index_path(pos_file):
+    return pos_file + INDEX_SUFFIX
+
+# 计算元素的外接矩形：节点取props，连接线取两端点和折点
+def element_bbox(element_data):
+    props = element_data.get('props') or {}
+    if element_data.get('name') != 'linker':
+        try:
+            return float(props['x']), float(props['y']), float(props['w']), float(props['h'])
+        except (KeyError, TypeError, ValueError):
+            return NAN, NAN, NAN, NAN
+
+    points = [element_data.get('from') or {}, element_data.get('to') or {}]
+    points.extend(element_data.get('points') or ())
+    xs, ys = [], []
+    for point in points:
+        try:
+            xs.append(float(point['x']))
+            ys.append(float(point['y']))
+        except (KeyError, TypeError, ValueError):
+            continue
+    if not xs:
+        return NAN, NAN, NAN, NAN
+    return min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)
+
+# 元素的props.zindex，缺失或无效时为0
+def element_zindex(element_data):
+    try:
+        return int((element_data.get('props') or {}).get('zindex', 0))
+    except (TypeError, ValueError):
+        return 0
+
+def _source_stat(pos_file):
+    st = os.stat(pos_file)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+# 流式扫描一遍pos文件，生成索引旁路文件，返回索引路径
+# 结构扫描器只跳过pngdata等兄弟值，每个元素由json的C解码器解码一次，取出类型、zindex和bbox后立即丢弃
+# 临时文件名带进程号和随机后缀，并发为同一文件建索引时互不干扰，最后一个完成的替换目标文件
+def build_index(pos_file, index_file=None):
+    if index_file is None:
+        index_file = default_index_path(pos_file)
+
+    types = {}
+    ids = []
+    tmp_file = f'{index_file}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+    try:
+        with map_pos_file(pos_file) as mm, open(tmp_file + '.records', 'xb') as records:
+            start = find_value_start(mm, ELEMENTS_PATH)
+            if start is None:
+                raise ScanError(f'{pos_file} 中没有 diagram.elements.elements')
+            for element_id, value_start, value_end, element_data in iter_member_values(mm, start):
+                element_type = element_data.get('name', '') if isinstance(element_data, dict) else ''
+                type_index = types.setdefault(element_type, len(types))
+                records.write(RECORD.pack(value_start, value_end - value_start, type_index,
+                                          element_zindex(element_data), *element_bbox(element_data)))
+                ids.append(element_id)
+
+        header = dict(version=INDEX_VERSION, count=len(ids), types=list(types), **_source_stat(pos_file))
+        with open(tmp_file, 'xb') as f, open(tmp_file + '.records', 'rb') as records:
+            f.write(INDEX_MAGIC)
+            f.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n')
+            while True:
+                chunk = records.read(1024 * 1024)
+                if not chunk:
+                    break
+                f.write(chunk)
+            f.write('\n'.join(ids).encode('utf-8'))
+        os.replace(tmp_file, index_file)
+    finally:
+        for path in (tmp_file, tmp_file + '.records'):
+            if os.path.exists(path):
+                os.remove(path)
+    return index_file
+
+# 读取索引；pos文件在建索引之后被修改过时抛出PosIndexError
+class PosIndex:
+    def __init__(self, pos_file, index_file=None):
+        self.pos_file = pos_file
+        self.index_file = index_file or default_index_path(pos_file)
+
+        with open(self.index_file, 'rb') as f:
+            data = f.read()
+        if not data.startswith(INDEX_MAGIC):
+            raise PosIndexError(f'{self.index_file} 不是元素索引文件')
+        header_end = data.index(b'\n', len(INDEX_MAGIC)) + 1
+        header = json.loads(data[len(INDEX_MAGIC):header_end])
+        if header.get('version') != INDEX_VERSION:
+            raise PosIndexError(f'{self.index_file} 的索引版本 {header.get("version")} 不受支持')
+        stat = _source_stat(pos_file)
+        if header['size'] != stat['size'] or header['mtime_ns'] != stat['mtime_ns']:
+            raise PosIndexError(f'{pos_file} 在建索引之后被修改过')
+
+        self.types = header['types']
+        self._records = memoryview(data)[header_end:header_end + header['count'] * RECORD.size]
+        ids_blob = data[header_end + header['count'] * RECORD.size:]
+        self.ids = ids_blob.decode('utf-8').split('\n') if header['count'] else []
+        self._positions = {element_id: i for i, element_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, element_id):
+        return element_id in self._positions
+
+    def _entry(self, i):
+        offset, length, type_index, zindex, x, y, w, h = RECORD.unpack_from(self._records, i * RECORD.size)
+        return IndexEntry(self.ids[i], offset, length, self.types[type_index], zindex, (x, y, w, h))
+
+    # 按id查找，不存在时返回None
+    def get(self, element_id):
+        i = self._positions.get(element_id)
+        return None if i is None else self._entry(i)
+
+    # 按文件中的顺序产出所有索引项
+    def entries(self):
+        for i in range(len(self.ids)):
+            yield self._entry(i)
+
+    # 按文件中的顺序产出每个元素的 (偏移, 长度, zindex)，不构造索引项
+    def spans(self):
+        for offset, length, _, zindex, *_ in RECORD.iter_unpack(self._records):
+            yield offset, length, zindex
+
+    # 每种类型的元素数量，按首次出现的顺序
+    def type_counts(self):
+        counts = dict.fromkeys(self.types, 0)
+        for type_index in RECORD.iter_unpack(self._records):
+            counts[self.types[type_index[2]]] += 1
+        return counts
+
+    # 指定类型的索引项
+    def by_type(self, element_type):
+        return (entry for entry in self.entries() if entry.type == element_type)
+
+    # 从pos文件中只解码给定的元素，按文件偏移顺序产出 (element_id, element_data)
+    # z_order为True时按 (zindex, 偏移) 即层叠顺序产出，在内存中排序，整个文件的层叠顺序见zorder模块
+    # 结果可以直接交给convert_elements做子集转换
+    def iter_elements(self, element_ids=None, z_order=False):
+        key = (lambda entry: (entry.zindex, entry.offset)) if z_order else (lambda entry: entry.offset)
+        if element_ids is None:
+            entries = sorted(self.entries(), key=key) if z_order else self.entries()
+        else:
+            entries = sorted((self.get(element_id) for element_id in element_ids if element_id in self), key=key)
+        with map_pos_file(self.pos_file) as mm:
+            for entry in entries:
+                yield entry.id, json.loads(bytes(mm[entry.offset:entry.offset + entry.length]))
+
+    # 解码单个元素，不存在时返回None
+    def read_element(self, element_id):
+        for _, element_data in self.iter_elements([element_id]):
+            return element_data
+        return None
+
+# 打开pos文件的索引，索引不存在或已过期时先重建
+def load_index(pos_file, index_file=None):
+    index_file = index_file or default_index_path(pos_file)
+    try:
+        return PosIndex(pos_file, index_file)
+    except (OSError, PosIndexError):
+        build_index(pos_file, index_file)
+        return PosIndex(pos_file, index_file)
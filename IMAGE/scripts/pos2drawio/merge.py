@@ -0,0 +1,130 @@
+import os
+import sys
+import uuid
+
+from .core import build_geometry, iter_pos_elements, write_elements
+from .metrics import PHASE_GEOMETRY, PHASE_PREVIEW, PHASE_SERIALIZE, PHASE_TOTAL, Metrics
+from .preview import write_preview_cell
+from .reader import read_diagram_title
+from .text import LABEL_AUTO
+from .writer import DIAGRAM_ATTRS, DrawioWriter
+
+# 合并模式：把多个pos文件流式写入同一个mxfile，每个文件一个<diagram>页面
+# 页面名取自meta.diagramInfo.title，没有标题时用文件名，重名的页面加序号
+# 同一套课件的几个图表常常复制自同一份原稿，元素id会重复；与前面页面重复的id在本页统一改名，
+# 连接线的两端随之改名，整个文档中的单元格id保证唯一
+# 样式字符串由styles模块的进程级缓存构建，同一次合并中相同的样式组合只构建一次
+
+# 默认的合并输出文件名
+DEFAULT_MERGE_OUTPUT = 'merged.drawio.xml'
+
+# 页面名：标题或文件名，重名时加 (2)、(3)……
+def _page_name(pos_file, title, used_names):
+    name = title or os.path.splitext(os.path.basename(pos_file))[0]
+    candidate = name
+    n = 1
+    while candidate in used_names:
+        n += 1
+        candidate = f'{name} ({n})'
+    used_names.add(candidate)
+    return candidate
+
+# 本页的改名规则：与前面页面重复的id改为 <id>-p<页号>，仍然重复时再加序号
+class _PageIds:
+    def __init__(self, used_ids, page_number):
+        self.used_ids = used_ids
+        self.page_number = page_number
+        self.renamed = {}
+        self.page_ids = set()
+
+    def rename(self, element_id):
+        if element_id not in self.used_ids:
+            return element_id
+        new_id = self.renamed.get(element_id)
+        if new_id is None:
+            new_id = f'{element_id}-p{self.page_number}'
+            n = 1
+            while new_id in self.used_ids:
+                n += 1
+                new_id = f'{element_id}-p{self.page_number}-{n}'
+            self.renamed[element_id] = new_id
+        return new_id
+
+    # 改写元素id和连接线两端的id，并记录本页写出的id
+    def apply(self, element_items, record=True):
+        for element_id, element_data in element_items:
+            element_id = self.rename(element_id)
+            for end in ('from', 'to'):
+                endpoint = element_data.get(end)
+                if isinstance(endpoint, dict) and endpoint.get('id') is not None:
+                    endpoint['id'] = self.rename(endpoint['id'])
+            if record:
+                self.page_ids.add(sys.intern(element_id))
+            yield element_id, element_data
+
+    # 本页结束，其id加入已使用的集合
+    def commit(self):
+        self.used_ids.update(self.page_ids)
+
+# 把pos_files依次合并写入out，返回 {'elements', 'nodes', 'links', 'pages', 'files': [每个文件的统计]}
+# 每个文件单独流式解析，任意时刻只有一个元素在内存中；跨页保留的只有已使用的元素id
+def merge(pos_files, out, indent='  ', embed_preview=False, geometry=None, label_mode=LABEL_AUTO, compress=False,
+          metrics=None):
+    if metrics is None:
+        metrics = Metrics()
+    stats = {'elements': 0, 'nodes': 0, 'links': 0, 'pages': len(pos_files), 'files': []}
+    used_ids = set()
+    used_names = set()
+    writer = DrawioWriter(out, indent, compress)
+    for page_number, pos_file in enumerate(pos_files, 1):
+        name = _page_name(pos_file, read_diagram_title(pos_file), used_names)
+        diagram_attrs = dict(DIAGRAM_ATTRS, name=name, id=f'page-{page_number}')
+        if page_number == 1:
+            writer.start(diagram_attrs=diagram_attrs)
+        else:
+            with metrics.timer(PHASE_SERIALIZE):
+                writer.end_diagram()
+                writer.start_diagram(diagram_attrs)
+
+        ids = _PageIds(used_ids, page_number)
+        stage = None
+        if geometry:
+            with metrics.timer(PHASE_GEOMETRY):
+                stage = build_geometry(pos_file, ids.apply(iter_pos_elements(pos_file), record=False), geometry)
+        if embed_preview:
+            with metrics.timer(PHASE_PREVIEW):
+                write_preview_cell(writer, pos_file, 'pos-preview' if page_number == 1 else f'pos-preview-{page_number}',
+                                   geometry=stage)
+        page_stats = write_elements(ids.apply(iter_pos_elements(pos_file)), writer, stage, label_mode,
+                                    metrics=metrics)
+        ids.commit()
+
+        for key in ('elements', 'nodes', 'links'):
+            stats[key] += page_stats[key]
+        stats['files'].append(dict(page_stats, file=pos_file, page=name, renamed_ids=len(ids.renamed)))
+        metrics.count('renamed_ids', len(ids.renamed))
+
+    with metrics.timer(PHASE_SERIALIZE):
+        if not pos_files:
+            writer.start()
+        writer.end()
+    metrics.count('pages', stats['pages'])
+    print(f"Merged {stats['pages']} pages")
+    return stats
+
+# 合并并保存为xml文件，先写临时文件，成功后再替换目标文件
+def merge_files(pos_files, xml_file=DEFAULT_MERGE_OUTPUT, indent='  ', embed_preview=False, geometry=None,
+                label_mode=LABEL_AUTO, compress=False, metrics=None):
+    if metrics is None:
+        metrics = Metrics()
+    tmp_file = f'{xml_file}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+    try:
+        with metrics.timer(PHASE_TOTAL):
+            with open(tmp_file, 'x', encoding='utf-8') as f:
+                stats = merge(pos_files, f, indent, embed_preview, geometry, label_mode, compress, metrics)
+            os.replace(tmp_file, xml_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    metrics.count('files', len(pos_files))
+    return stats
@@ -0,0 +1,160 @@
+import json
+import os
+import re
+import time
+import traceback
+import uuid
+
+# 转换过程的计时和计数
+# 各阶段的耗时用Timer累加，元素级日志默认关闭，按log_sample的比例抽样打印
+# 一次运行结束后可以导出为JSON，或写成Prometheus node_exporter textfile collector读取的文本格式
+
+# 阶段名称
+PHASE_PARSE = 'parse'          # 从pos文件中解析出下一个元素
+PHASE_TEXT = 'text'            # textBlock文本转换为标签
+PHASE_NODE = 'node'            # 节点处理器（包括样式构建）
+PHASE_LINK = 'link'            # 连接线处理器（包括样式构建）
+PHASE_GEOMETRY = 'geometry'    # 几何处理
+PHASE_SERIALIZE = 'serialize'  # mxCell序列化写出（压缩模式下包括压缩）
+PHASE_INDEX = 'index'          # 分页时读取或建立元素索引
+PHASE_PREVIEW = 'preview'      # 嵌入或导出预览图
+PHASE_TOTAL = 'total'          # 整个文件的转换
+
+METRIC_PREFIX = 'pos2drawio'
+METRIC_NAME_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+# 一个阶段的累计耗时，用作上下文管理器
+class Timer:
+    __slots__ = ('calls', 'seconds', '_start')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds += time.perf_counter() - self._start
+        self.calls += 1
+        return False
+
+class Metrics:
+    # log_sample为元素级日志的抽样比例，0不打印，1全部打印
+    # tracebacks为True时元素转换失败时打印完整的调用栈，否则只打印一行错误信息
+    def __init__(self, log_sample=0.0, tracebacks=False):
+        self.log_sample = log_sample
+        self.tracebacks = tracebacks
+        self.timers = {}
+        self.counters = {}
+        self._sample_credit = 0.0
+
+    def timer(self, name):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = Timer()
+        return timer
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    # 计入一段在别处测量的耗时
+    def add_time(self, name, seconds, calls=1):
+        timer = self.timer(name)
+        timer.seconds += seconds
+        timer.calls += calls
+
+    # 包装一个迭代器，把每次取下一个元素的时间计入name阶段，不包括调用方处理元素的时间
+    def timed_iter(self, name, iterable):
+        timer = self.timer(name)
+        iterator = iter(iterable)
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                timer.seconds += clock() - start
+                return
+            timer.seconds += clock() - start
+            timer.calls += 1
+            yield item
+
+    # 按抽样比例决定这一条元素日志是否打印，抽样是确定性的：每累计满1打印一条
+    def sampled(self):
+        if self.log_sample <= 0:
+            return False
+        self._sample_credit += self.log_sample
+        if self._sample_credit >= 1:
+            self._sample_credit -= 1
+            return True
+        return False
+
+    # 元素级日志，message为返回日志文本的函数，没有被抽中时不必格式化
+    def log_element(self, message):
+        if self.sampled():
+            print(message())
+
+    def log_error(self, message):
+        print(message)
+        if self.tracebacks:
+            traceback.print_exc()
+
+    def to_dict(self):
+        return {
+            'timers': {name: {'calls': t.calls, 'seconds': t.seconds} for name, t in sorted(self.timers.items())},
+            'counters': dict(sorted(self.counters.items()))
+        }
+
+    # 合并另一次运行（例如工作进程返回的to_dict()结果）
+    def merge(self, data):
+        for name, t in data.get('timers', {}).items():
+            self.add_time(name, t['seconds'], t['calls'])
+        for name, n in data.get('counters', {}).items():
+            self.count(name, n)
+
+    # 按扩展名写出：.prom为Prometheus文本格式，其余为JSON
+    def write(self, path, labels=None):
+        if path.endswith('.prom'):
+            text = self.to_prometheus(labels)
+        else:
+            text = json.dumps(dict(self.to_dict(), labels=labels or {}), ensure_ascii=False, indent=1) + '\n'
+        # textfile collector可能在任意时刻读取，先写临时文件再替换
+        tmp_file = f'{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+        try:
+            with open(tmp_file, 'x', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_file, path)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def to_prometheus(self, labels=None):
+        base = ','.join(f'{k}="{_escape_label(v)}"' for k, v in sorted((labels or {}).items()))
+        lines = []
+
+        def sample(metric, extra, value):
+            label_text = ','.join(part for part in (base, extra) if part)
+            lines.append(f'{metric}{{{label_text}}} {value}' if label_text else f'{metric} {value}')
+
+        if self.timers:
+            metric = f'{METRIC_PREFIX}_phase_seconds_total'
+            lines.append(f'# HELP {metric} Time spent in each conversion phase.')
+            lines.append(f'# TYPE {metric} counter')
+            for name, t in sorted(self.timers.items()):
+                sample(metric, f'phase="{_escape_label(name)}"', repr(t.seconds))
+            metric = f'{METRIC_PREFIX}_phase_calls_total'
+            lines.append(f'# HELP {metric} Number of times each conversion phase ran.')
+            lines.append(f'# TYPE {metric} counter')
+            for name, t in sorted(self.timers.items()):
+                sample(metric, f'phase="{_escape_label(name)}"', t.calls)
+        for name, n in sorted(self.counters.items()):
+            metric = f"{METRIC_PREFIX}_{METRIC_NAME_RE.sub('_', name)}_total"
+            lines.append(f'# TYPE {metric} counter')
+            sample(metric, '', n)
+        return '\n'.join(lines) + '\n'
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
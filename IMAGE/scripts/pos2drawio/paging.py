@@ -0,0 +1,142 @@
+import math
+from array import array
+from collections import namedtuple
+
+from .handlers import LINKER, NODE, get_handler
+from .table import NodeTable
+
+# 分页模式：按节点中心点把画布划分为均匀网格，每个非空格子输出为一个<diagram>页面
+# 两端节点落在不同页面的连接线，在两侧页面各画一段指向对方页面的跳转链接
+
+# 默认的格子大小（画布像素）
+DEFAULT_PAGE_SIZE = (2000, 2000)
+
+# 跳转链接占位节点的大小和样式
+PAGE_LINK_SIZE = (80, 30)
+PAGE_LINK_STYLE = 'rounded=1;whiteSpace=wrap;html=1;dashed=1;fillColor=#f5f5f5;fontColor=#333333;'
+
+# 一个页面：element_ids为页面内的节点和两端都在页面内的连接线，
+# outgoing/incoming为跨页连接线 (linker_id, 对方页面)
+Page = namedtuple('Page', ['id', 'name', 'row', 'col', 'element_ids', 'outgoing', 'incoming'])
+
+# 解析 "宽x高" 形式的页面大小
+def parse_page_size(text):
+    try:
+        width, height = (float(v) for v in text.lower().split('x'))
+    except ValueError:
+        raise ValueError(f'页面大小应为 宽x高，例如 2000x2000: {text}') from None
+    if width <= 0 or height <= 0:
+        raise ValueError(f'页面大小必须为正数: {text}')
+    return width, height
+
+def _bbox_known(bbox):
+    return not any(math.isnan(v) for v in bbox)
+
+# 根据元素索引规划页面，返回按行优先排序的Page列表
+# 节点只用索引中的bbox分桶，只有连接线需要从pos文件中解码出两端的id
+# 节点的外框放在NodeTable的列中，每个节点所在的格子存为格子表中的序号
+# 分桶是O(n)，格子排序和每页按偏移读取元素是O(n log n)
+# selection为 (节点id集合, 连接线id集合) 时只规划其中的元素（见filters.select_from_index），
+# 两端节点没有都被选中的连接线直接丢弃
+def plan_pages(index, page_size=DEFAULT_PAGE_SIZE, selection=None):
+    page_width, page_height = page_size
+    selected_nodes, selected_linkers = selection or (None, None)
+
+    nodes = NodeTable()
+    linker_ids = []
+    for entry in index.entries():
+        handler = get_handler(entry.type)
+        if handler is None:
+            continue
+        if handler.kind == NODE:
+            if selected_nodes is None or entry.id in selected_nodes:
+                nodes.add(entry.id, entry.type, entry.bbox, entry.zindex)
+        elif handler.kind == LINKER:
+            if selected_linkers is None or entry.id in selected_linkers:
+                linker_ids.append(entry.id)
+
+    # 网格原点取所有节点的左上角，负坐标也从第一行第一列开始
+    known = [row for row in range(len(nodes)) if _bbox_known(nodes.bbox(row))]
+    origin_x = min((nodes.x[row] for row in known), default=0.0)
+    origin_y = min((nodes.y[row] for row in known), default=0.0)
+
+    # (行, 列) -> [元素id, 出去的连接线, 进来的连接线]
+    buckets = {}
+    # 节点行号 -> 所在格子在tiles中的序号
+    tiles = []
+    tile_codes = {}
+    node_tiles = array('i')
+
+    def bucket(tile):
+        return buckets.setdefault(tile, ([], [], []))
+
+    for row, element_id in enumerate(nodes.ids):
+        x, y, w, h = nodes.bbox(row)
+        if _bbox_known((x, y, w, h)):
+            tile = (int((y + h / 2 - origin_y) // page_height), int((x + w / 2 - origin_x) // page_width))
+        else:
+            tile = (0, 0)
+        code = tile_codes.get(tile)
+        if code is None:
+            code = tile_codes[tile] = len(tiles)
+            tiles.append(tile)
+        node_tiles.append(code)
+        bucket(tile)[0].append(element_id)
+
+    def node_tile(element_id):
+        row = nodes.row(element_id)
+        return None if row is None else tiles[node_tiles[row]]
+
+    cross_links = []
+    for linker_id, element_data in index.iter_elements(linker_ids):
+        source_tile = node_tile((element_data.get('from') or {}).get('id'))
+        target_tile = node_tile((element_data.get('to') or {}).get('id'))
+        if source_tile is not None and target_tile is not None and source_tile != target_tile:
+            cross_links.append((linker_id, source_tile, target_tile))
+        elif selection is not None and (source_tile is None or target_tile is None):
+            continue
+        else:
+            # 同页连接线；端点缺失的连接线也放进来，由write_elements报告跳过
+            bucket(source_tile or target_tile or (0, 0))[0].append(linker_id)
+
+    pages = {}
+    for tile in sorted(buckets):
+        row, col = tile
+        element_ids, outgoing, incoming = buckets[tile]
+        pages[tile] = Page(f'page-{row + 1}-{col + 1}', f'Page-{row + 1}-{col + 1}', row, col,
+                           element_ids, outgoing, incoming)
+    for linker_id, source_tile, target_tile in cross_links:
+        pages[source_tile].outgoing.append((linker_id, pages[target_tile]))
+        pages[target_tile].incoming.append((linker_id, pages[source_tile]))
+    return [pages[tile] for tile in sorted(pages)]
+
+# 跨页连接线在一侧页面中的画法：连接线另一端换成指向对方页面的占位节点
+# outgoing为True时当前页面是起点所在页，占位节点放在原终点位置；否则放在原起点位置
+# transform_point为几何处理阶段的坐标变换，占位节点的位置随之变换
+# 返回 (占位节点, 连接线属性, 连接线子元素)，占位节点为 (UserObject属性, mxCell属性, 子元素)
+def page_link_cells(linker_id, element_data, text, other_page, outgoing, transform_point=None):
+    end = element_data.get('to' if outgoing else 'from') or {}
+    x, y = float(end.get('x', 0)), float(end.get('y', 0))
+    if transform_point is not None:
+        x, y = transform_point(x, y)
+    width, height = PAGE_LINK_SIZE
+    stub_id = f'{linker_id}-page-link'
+    stub = ({
+        'label': other_page.name,
+        'link': f'data:page/id,{other_page.id}',
+        'id': stub_id
+    }, {
+        'style': PAGE_LINK_STYLE,
+        'parent': '1',
+        'vertex': '1'
+    }, [('mxGeometry', {
+        'x': str(x - width / 2),
+        'y': str(y - height / 2),
+        'width': str(width),
+        'height': str(height),
+        'as': 'geometry'
+    }, ())])
+
+    attrs, children = get_handler('linker').convert(linker_id, element_data, text)
+    attrs['target' if outgoing else 'source'] = stub_id
+    return stub, attrs, children
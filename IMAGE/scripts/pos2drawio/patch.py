@@ -0,0 +1,233 @@
+import hashlib
+import io
+import json
+import os
+import re
+import uuid
+from xml.sax.saxutils import unescape
+
+from .core import CONVERTER_VERSION, convert_file, default_output_path, write_elements
+from .handlers import LINKER, NODE, get_handler
+from .index import load_index
+from .reader import map_pos_file
+from .scanner import find_value_span
+from .text import LABEL_AUTO
+from .writer import DrawioWriter
+
+# 增量更新模式：按元素内容哈希比较pos文件和上次的输出，只重新生成新增和变化的单元格，
+# 删除已经不存在的单元格，其余单元格（包括在draw.io里手工修改过的）原样保留
+# 端点节点新增、变化或删除的连接线也重新生成，端点已不存在的连接线随之删除，与整体转换的结果一致
+
+# 元素哈希旁路文件：<输出文件>.hashes
+HASHES_SUFFIX = '.hashes'
+HASHES_VERSION = 3
+MODIFIED_PATH = ('meta', 'diagramInfo', 'modified')
+
+# XML标签（属性值中可以出现 >）、注释和处理指令
+TAG_RE = re.compile(r'<(/?)([A-Za-z_][\w:.-]*)((?:\s+[^\s=/>]+\s*=\s*(?:"[^"]*"|\'[^\']*\'))*)\s*(/?)>'
+                    r'|<!--.*?-->|<\?.*?\?>', re.DOTALL)
+ID_RE = re.compile(r'\sid\s*=\s*"([^"]*)"')
+
+def default_hashes_path(xml_file):
+    return xml_file + HASHES_SUFFIX
+
+# 每个元素规范化JSON（键排序、去掉空白）的哈希，重新保存文件引起的空白和键顺序变化不算内容变化
+# endpoints为dict时同时记录每条连接线两端的节点id
+def element_hashes(index, endpoints=None):
+    hashes = {}
+    for element_id, element_data in index.iter_elements():
+        canonical = json.dumps(element_data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        hashes[element_id] = hashlib.blake2b(canonical.encode('utf-8'), digest_size=8).hexdigest()
+        if endpoints is not None and _element_kind(element_data.get('name')) == LINKER:
+            endpoints[element_id] = tuple((element_data.get(end) or {}).get('id') for end in ('from', 'to'))
+    return hashes
+
+# pos文件中meta.diagramInfo.modified的原始文本，没有时返回None
+def read_modified(pos_file):
+    with map_pos_file(pos_file) as mm:
+        span = find_value_span(mm, MODIFIED_PATH)
+        return None if span is None else bytes(mm[span[0]:span[1]]).decode('utf-8')
+
+def _read_hashes(path, options):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if (data.get('version') != HASHES_VERSION or data.get('converter_version') != CONVERTER_VERSION
+            or data.get('options') != options):
+        return None
+    return data
+
+# pos文件的size和mtime_ns，与meta.diagramInfo.modified一起判断文件是否没有变化
+def _source_stat(pos_file):
+    st = os.stat(pos_file)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def _write_hashes(path, options, modified, source, stats, hashes):
+    tmp_file = f'{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+    try:
+        with open(tmp_file, 'x', encoding='utf-8') as f:
+            json.dump({'version': HASHES_VERSION, 'converter_version': CONVERTER_VERSION, 'options': options,
+                       'modified': modified, 'source': source, 'stats': stats, 'elements': hashes},
+                      f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_file, path)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+# 定位唯一一个<root>的直接子元素，返回 ([(单元格id, 开始, 结束)], </root>的位置)
+# 多页或压缩格式的文件返回None，只能整体重新生成
+# 每个子元素的范围扩展到整行（前面的缩进和后面的换行），删除时不留空行
+def split_root_children(xml_text):
+    stack = []
+    root_depth = None
+    children = []
+    child_id = None
+    child_start = None
+    for m in TAG_RE.finditer(xml_text):
+        closing, tag, attrs, self_closing = m.groups()
+        if tag is None:
+            continue
+        if closing:
+            stack.pop()
+            if root_depth is not None and len(stack) == root_depth + 1 and child_start is not None:
+                children.append((child_id, child_start, _line_end(xml_text, m.end())))
+                child_start = None
+            elif tag == 'root' and len(stack) == root_depth:
+                return children, _line_start(xml_text, m.start())
+            continue
+
+        if tag == 'root':
+            if root_depth is not None:
+                return None
+            root_depth = len(stack)
+        elif root_depth is not None and len(stack) == root_depth + 1:
+            id_match = ID_RE.search(attrs)
+            child_id = unescape(id_match.group(1), {'&quot;': '"'}) if id_match else None
+            if self_closing:
+                children.append((child_id, _line_start(xml_text, m.start()), _line_end(xml_text, m.end())))
+                continue
+            child_start = _line_start(xml_text, m.start())
+        if not self_closing:
+            stack.append(tag)
+    return None
+
+def _line_start(text, pos):
+    line_start = text.rfind('\n', 0, pos) + 1
+    return line_start if not text[line_start:pos].strip() else pos
+
+def _line_end(text, pos):
+    newline = text.find('\n', pos)
+    return newline + 1 if newline >= 0 and not text[pos:newline].strip() else pos
+
+# 收集write_elements写出的单元格文本，按id保存
+class _CellCollector:
+    def __init__(self, indent):
+        self.buffer = io.StringIO()
+        self.writer = DrawioWriter(self.buffer, indent)
+        self.cells = {}
+
+    def write_cell(self, attrs, children=()):
+        self.writer.write_cell(attrs, children)
+        self.cells[attrs['id']] = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+def _element_kind(element_type):
+    handler = get_handler(element_type)
+    return None if handler is None else handler.kind
+
+# 按索引统计元素、节点、连接线数量，与write_elements的统计口径一致：两端节点都存在的连接线才计入
+def _index_stats(index, endpoints):
+    stats = {'elements': len(index), 'nodes': 0, 'links': 0}
+    nodes = set()
+    for entry in index.entries():
+        if _element_kind(entry.type) == NODE:
+            nodes.add(entry.id)
+    stats['nodes'] = len(nodes)
+    stats['links'] = sum(1 for source_id, target_id in endpoints.values() if source_id in nodes and target_id in nodes)
+    return stats
+
+def _full_convert(pos_file, xml_file, hashes_file, indent, label_mode, options, modified, source, metrics):
+    stats = convert_file(pos_file, xml_file, indent, label_mode=label_mode, metrics=metrics)
+    index = load_index(pos_file)
+    endpoints = {}
+    hashes = element_hashes(index, endpoints)
+    _write_hashes(hashes_file, options, modified, source, _index_stats(index, endpoints), hashes)
+    stats.update(mode='full', added=stats['elements'], changed=0, removed=0)
+    return stats
+
+# 增量更新xml_file：第一次运行（或选项、转换器版本变化、输出无法按单元格定位）时整体转换，
+# 之后只替换新增、变化、删除的元素对应的单元格
+# meta.diagramInfo.modified与上次相同、并且文件的size和mtime_ns也没有变化时直接跳过；
+# 没有更新modified就被修改或被其他工具重写的文件仍会按元素哈希比较
+# 返回统计信息，mode为full（整体转换）、patched（增量更新）或unchanged（没有变化）
+def patch_file(pos_file, xml_file=None, indent='  ', label_mode=LABEL_AUTO, metrics=None):
+    if xml_file is None:
+        xml_file = default_output_path(pos_file)
+    hashes_file = default_hashes_path(xml_file)
+    options = {'indent': indent, 'label_mode': label_mode}
+
+    source = _source_stat(pos_file)
+    modified = read_modified(pos_file)
+    previous = _read_hashes(hashes_file, options) if os.path.exists(xml_file) else None
+    if previous is None:
+        return _full_convert(pos_file, xml_file, hashes_file, indent, label_mode, options, modified, source, metrics)
+    if modified is not None and modified == previous.get('modified') and source == previous.get('source'):
+        return dict(previous['stats'], mode='unchanged', added=0, changed=0, removed=0)
+
+    index = load_index(pos_file)
+    endpoints = {}
+    hashes = element_hashes(index, endpoints)
+    stats = _index_stats(index, endpoints)
+    old_hashes = previous['elements']
+    added = [element_id for element_id in hashes if element_id not in old_hashes]
+    changed = [element_id for element_id, h in hashes.items() if element_id in old_hashes and old_hashes[element_id] != h]
+    removed = set(old_hashes) - set(hashes)
+
+    with open(xml_file, 'r', encoding='utf-8') as f:
+        xml_text = f.read()
+    layout = split_root_children(xml_text)
+    if layout is None:
+        return _full_convert(pos_file, xml_file, hashes_file, indent, label_mode, options, modified, source, metrics)
+    children, root_end = layout
+
+    # 只转换新增和变化的元素，以及端点新增、变化或删除的连接线；
+    # 其余节点已经在输出中，连向它们的连接线可以直接写出
+    collector = _CellCollector(indent)
+    regenerate = set(added) | set(changed)
+    touched = regenerate | removed
+    if touched:
+        regenerate.update(linker_id for linker_id, (source_id, target_id) in endpoints.items()
+                          if source_id in touched or target_id in touched)
+    known_nodes = [entry.id for entry in index.entries()
+                   if entry.id not in regenerate and _element_kind(entry.type) == NODE]
+    write_elements(index.iter_elements(regenerate), collector, label_mode=label_mode, known_nodes=known_nodes,
+                   metrics=metrics)
+
+    # 拼出新文件：保留不变的单元格，替换重新生成的，删除已删除的和重新生成时被跳过的（端点不存在的连接线），
+    # 新增的追加到</root>之前
+    parts = []
+    pos = 0
+    for cell_id, start, end in children:
+        if cell_id in removed or cell_id in regenerate:
+            parts.append(xml_text[pos:start])
+            parts.append(collector.cells.pop(cell_id, ''))
+            pos = end
+    parts.append(xml_text[pos:root_end])
+    parts.extend(collector.cells.values())
+    parts.append(xml_text[root_end:])
+
+    tmp_file = f'{xml_file}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+    try:
+        with open(tmp_file, 'x', encoding='utf-8') as f:
+            f.writelines(parts)
+        os.replace(tmp_file, xml_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    _write_hashes(hashes_file, options, modified, source, stats, hashes)
+
+    stats.update(mode='patched', added=len(added), changed=len(changed), removed=len(removed))
+    return stats
@@ -0,0 +1,102 @@
+import binascii
+import json
+import os
+import uuid
+
+from .reader import find_pngdata_span, map_pos_file
+from .scanner import find_value_start, iter_members, value_end
+
+IMAGE_PATH = ('diagram', 'image')
+# 每次解码的base64字符数，必须是4的倍数
+DECODE_CHUNK_SIZE = 4 * 64 * 1024
+
+# 读取diagram.image中除pngdata以外的字段（width、height、x、y），没有预览图时返回None
+def read_preview_info(file_path):
+    with map_pos_file(file_path) as mm:
+        start = find_value_start(mm, IMAGE_PATH)
+        if start is None:
+            return None
+        info = {}
+        for key, value_start in iter_members(mm, start):
+            if key != 'pngdata':
+                info[key] = json.loads(bytes(mm[value_start:value_end(mm, value_start)]))
+        return info
+
+# 返回pngdata中base64正文的字节范围，跳过可能存在的 data:image/png;base64, 前缀
+def _base64_span(buf):
+    span = find_pngdata_span(buf)
+    if span is None or span[0] == span[1]:
+        return None
+    start, end = span
+    if buf[start:start + 5] == b'data:':
+        comma = buf.find(b',', start, end)
+        if comma >= 0:
+            start = comma + 1
+    return start, end
+
+# 按块产出pngdata的base64文本，直接从mmap切片，不会一次性读出整段字符串
+def iter_preview_base64(buf, chunk_size=DECODE_CHUNK_SIZE):
+    span = _base64_span(buf)
+    if span is None:
+        return
+    start, end = span
+    for pos in range(start, end, chunk_size):
+        yield bytes(buf[pos:min(pos + chunk_size, end)]).decode('ascii')
+
+# 把pngdata预览图解码为png文件
+# 从mmap中按4字符对齐的块逐段解码写出，内存占用只有一个块的大小
+# 返回写出的字节数，pos文件中没有预览图时返回0且不创建文件
+# 临时文件名带进程号和随机后缀，并发提取同一预览图也互不干扰
+def extract_preview(pos_file, png_file, chunk_size=DECODE_CHUNK_SIZE):
+    with map_pos_file(pos_file) as mm:
+        span = _base64_span(mm)
+        if span is None:
+            return 0
+        start, end = span
+
+        written = 0
+        tmp_file = f'{png_file}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+        try:
+            with open(tmp_file, 'xb') as f, memoryview(mm) as view:
+                for pos in range(start, end, chunk_size):
+                    with view[pos:min(pos + chunk_size, end)] as chunk:
+                        data = binascii.a2b_base64(chunk)
+                    f.write(data)
+                    written += len(data)
+            os.replace(tmp_file, png_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+    return written
+
+# 把预览图作为锁定的背景图片单元格写入draw.io，位置和大小取自diagram.image
+# 应在写出其他单元格之前调用，这样背景位于最底层；没有预览图时不写任何内容并返回False
+# geometry为几何处理阶段的Geometry时，预览图随元素一起平移缩放
+def write_preview_cell(writer, pos_file, cell_id='pos-preview', geometry=None):
+    info = read_preview_info(pos_file)
+    if not info:
+        return False
+    x, y = info.get('x', 0), info.get('y', 0)
+    width, height = info.get('width', 0), info.get('height', 0)
+    if geometry is not None:
+        x, y = geometry.transform_point(x, y)
+        width, height = float(width) * geometry.options.scale, float(height) * geometry.options.scale
+
+    with map_pos_file(pos_file) as mm:
+        if _base64_span(mm) is None:
+            return False
+        geometry = ('mxGeometry', {
+            'x': str(x),
+            'y': str(y),
+            'width': str(width),
+            'height': str(height),
+            'as': 'geometry'
+        }, ())
+        writer.write_image_cell({
+            'id': cell_id,
+            'value': '',
+            'style': 'shape=image;imageAspect=0;aspect=fixed;locked=1;editable=0;image=data:image/png,',
+            'parent': '1',
+            'vertex': '1'
+        }, iter_preview_base64(mm), ';', [geometry])
+    return True
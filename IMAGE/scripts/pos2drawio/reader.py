@@ -0,0 +1,275 @@
+import io
+import json
+import mmap
+import os
+import sys
+from contextlib import contextmanager
+
+from .scanner import decode_value, find_last_member, find_value_start, iter_member_values
+
+PNGDATA_KEY = b'"pngdata"'
+ELEMENTS_PATH = ('diagram', 'elements', 'elements')
+TITLE_PATH = ('meta', 'diagramInfo', 'title')
+JSON_WHITESPACE = b' \t\r\n'
+# 元素中同一种图形都相同的定义部分（默认属性、数据属性、外形路径、锚点、可调整方向、图库分类），
+# 转换时不会用到，却占了每个元素的大部分内存
+BOILERPLATE_KEYS = ('attribute', 'dataAttributes', 'resizeDir', 'anchors', 'path', 'category', 'title')
+
+# 在buf中定位diagram.image.pngdata字符串内容的字节范围 [start, end)，不包含两侧引号
+# base64内容里不会出现引号和反斜杠，所以找到开引号后直接向前搜索下一个引号即可（memchr级别的查找）
+def find_pngdata_span(buf):
+    pos = 0
+    while True:
+        key_pos = buf.find(PNGDATA_KEY, pos)
+        if key_pos < 0:
+            return None
+        pos = key_pos + len(PNGDATA_KEY)
+
+        # 文本里转义过的 \"pngdata\" 不是键
+        if key_pos > 0 and buf[key_pos - 1:key_pos] == b'\\':
+            continue
+
+        # 键后面必须是 [空白] : [空白] "
+        i = _skip_whitespace(buf, pos)
+        if buf[i:i + 1] != b':':
+            continue
+        i = _skip_whitespace(buf, i + 1)
+        if buf[i:i + 1] != b'"':
+            continue
+
+        start = i + 1
+        end = buf.find(b'"', start)
+        if end < 0:
+            return None
+        return start, end
+
+def _skip_whitespace(buf, i):
+    while buf[i:i + 1] and buf[i:i + 1] in JSON_WHITESPACE:
+        i += 1
+    return i
+
+# 把文件映射到内存，空文件无法mmap，直接返回空bytes
+@contextmanager
+def map_pos_file(file_path):
+    with open(file_path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            yield b''
+            return
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+# 跳过pngdata的只读字节流：对外表现为pngdata内容被删除（变成空字符串）的pos文件
+# 供ijson等流式解析器使用，预览图的字节永远不会被读出和分词
+# 数据通过普通的文件读取获得而不是从mmap中切片，避免读过的页面一直计入进程的常驻内存
+class PngdataSkippingReader(io.RawIOBase):
+    def __init__(self, raw, span, size):
+        self._raw = raw
+        if span:
+            self._segments = [(0, span[0]), (span[1], size)]
+        else:
+            self._segments = [(0, size)]
+        self._segment_index = 0
+        self._pos = 0
+        self._raw.seek(0)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._segment_index < len(self._segments):
+            seg_end = self._segments[self._segment_index][1]
+            if self._pos < seg_end:
+                n = self._raw.readinto(memoryview(b)[:min(len(b), seg_end - self._pos)])
+                if not n:
+                    return 0
+                self._pos += n
+                return n
+
+            # 当前段读完，跳到下一段
+            self._segment_index += 1
+            if self._segment_index < len(self._segments):
+                self._pos = self._segments[self._segment_index][0]
+                self._raw.seek(self._pos)
+        return 0
+
+# PngdataSkippingReader的流式版本，用于不能seek也不能mmap的输入（如HTTP请求体）
+# 边读边查找第一个pngdata键，其字符串内容被丢弃（变成空字符串），其余字节原样透传
+# 查找键时只保留可能跨块的尾部；丢弃预览图时读到的块直接扔掉，不缓存任何内容
+class PngdataSkippingStream(io.RawIOBase):
+    _SEARCH, _SKIP, _PASS = range(3)
+
+    def __init__(self, raw, read_size=64 * 1024):
+        self._raw = raw
+        self._read_size = read_size
+        self._state = self._SEARCH
+        self._buf = bytearray()
+        self._out = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._out:
+            data = self._next()
+            if data is None:
+                return 0
+            self._out = memoryview(data)
+        n = min(len(b), len(self._out))
+        b[:n] = self._out[:n]
+        self._out = self._out[n:]
+        return n
+
+    # 下一段可以交给调用方的字节（可能为空），输入结束时返回None
+    def _next(self):
+        if self._state == self._PASS:
+            if self._buf:
+                data = bytes(self._buf)
+                self._buf.clear()
+                return data
+            return self._raw.read(self._read_size) or None
+
+        chunk = self._raw.read(self._read_size)
+        if self._state == self._SKIP:
+            if not chunk:
+                return None
+            self._skip(chunk)
+            return b''
+        if chunk:
+            self._buf += chunk
+            return self._search(eof=False)
+        if not self._buf:
+            return None
+        return self._search(eof=True)
+
+    # 预览图内容中没有引号，结束引号之后的字节原样透传
+    def _skip(self, data):
+        end = data.find(b'"')
+        if end >= 0:
+            self._state = self._PASS
+            self._buf += data[end:]
+
+    # 在缓冲区中查找 "pngdata" [空白] : [空白] "，返回可以交出的字节，缓冲区中只留下还不能确定的尾部
+    def _search(self, eof):
+        buf = self._buf
+        pos = 0
+        while True:
+            key_pos = buf.find(PNGDATA_KEY, pos)
+            if key_pos < 0:
+                # 键可能跨块，连同前面可能的反斜杠一起保留
+                return self._release(len(buf) if eof else max(0, len(buf) - len(PNGDATA_KEY)))
+            pos = key_pos + len(PNGDATA_KEY)
+            if key_pos > 0 and buf[key_pos - 1:key_pos] == b'\\':
+                continue
+            i = _skip_whitespace(buf, pos)
+            if i < len(buf):
+                if buf[i:i + 1] != b':':
+                    continue
+                i = _skip_whitespace(buf, i + 1)
+            if i >= len(buf):
+                # 键后面的内容还没有读到
+                return self._release(len(buf) if eof else max(0, key_pos - 1))
+            if buf[i:i + 1] != b'"':
+                continue
+            data = self._release(i + 1)
+            rest = bytes(buf)
+            buf.clear()
+            self._state = self._SKIP
+            self._skip(rest)
+            return data
+
+    def _release(self, n):
+        data = bytes(self._buf[:n])
+        del self._buf[:n]
+        return data
+
+# 以跳过pngdata的方式打开pos文件，返回可直接交给ijson的二进制流
+@contextmanager
+def open_pos_stream(file_path):
+    with open(file_path, 'rb', buffering=0) as raw:
+        size = os.fstat(raw.fileno()).st_size
+        with map_pos_file(file_path) as mm:
+            span = find_pngdata_span(mm)
+        reader = PngdataSkippingReader(raw, span, size)
+        try:
+            yield reader
+        finally:
+            reader.close()
+
+# 读取pos文件，跳过diagram.image.pngdata
+# 只有elements、page、meta以及image的宽高和偏移会被解析，预览图不会被解码
+def read_pos_file(file_path):
+    with map_pos_file(file_path) as mm:
+        span = find_pngdata_span(mm)
+        if span:
+            content = mm[:span[0]] + mm[span[1]:]
+        else:
+            content = mm[:]
+
+    pos_data = json.loads(content)
+
+    image = pos_data.get('diagram', {}).get('image')
+    if isinstance(image, dict):
+        image.pop('pngdata', None)
+
+    return pos_data
+
+# 去掉元素中的BOILERPLATE_KEYS，原地修改并返回该元素
+def drop_boilerplate(element_data):
+    if isinstance(element_data, dict):
+        for key in BOILERPLATE_KEYS:
+            element_data.pop(key, None)
+    return element_data
+
+_decoder = json.JSONDecoder()
+
+# 大文件模式：只读取diagram.elements.elements
+# 先用扫描器在mmap上定位elements对象的起点（途经的image、page被整体跳过），
+# 再交给C实现的JSON解码器从该位置解码一个完整的值，结束位置由解码器精确确定
+# 转换为str的范围不超过elements之后的pngdata：预览图排在elements之后时只多出meta这类很小的值
+# （用value_end逐个括号找到精确的结束位置比解码本身还慢几倍）
+# 找不到elements时返回None
+# slim为True时逐个元素解码并立即去掉BOILERPLATE_KEYS，元素id被驻留，整个elements对象从不同时完整存在于内存中
+def read_pos_elements(file_path, slim=False):
+    with map_pos_file(file_path) as mm:
+        start = find_value_start(mm, ELEMENTS_PATH)
+        if start is None:
+            return None
+        if slim:
+            return {sys.intern(element_id): drop_boilerplate(element_data)
+                    for element_id, _, _, element_data in iter_member_values(mm, start)}
+        span = find_pngdata_span(mm)
+        bounds = [len(mm)]
+        if span is not None and span[0] > start:
+            bounds.insert(0, span[0])
+        for end in bounds:
+            with memoryview(mm) as view, view[start:end] as value:
+                text = str(value, 'utf-8')
+            try:
+                elements, _ = _decoder.raw_decode(text)
+            except json.JSONDecodeError:
+                # pngdata键出现在elements内部，范围截断了elements，改为解码到文件末尾
+                if end == len(mm):
+                    raise
+                continue
+            finally:
+                del text
+            return elements
+
+# 读取meta.diagramInfo.title，没有或不是字符串时返回None
+# meta通常是最后一个成员，从文件末尾向前定位后只在meta内部按路径查找，只有文件尾部会被读到；
+# meta不在最后时才由扫描器从头按路径逐个跳过前面的成员
+def read_diagram_title(file_path):
+    with map_pos_file(file_path) as mm:
+        meta_start = find_last_member(mm, TITLE_PATH[0])
+        if meta_start is not None:
+            start = find_value_start(mm, TITLE_PATH[1:], meta_start)
+        else:
+            start = find_value_start(mm, TITLE_PATH)
+        if start is None:
+            return None
+        title, _ = decode_value(mm, start)
+    return title if isinstance(title, str) else None
@@ -0,0 +1,200 @@
+import codecs
+import json
+import re
+
+# 按JSON结构在字节缓冲区（通常是mmap）中定位值的扫描器
+# 只识别对象/数组的括号和字符串的边界，不解码任何值；字符串通过memchr级别的查找整体跳过，
+# 所以跳过几十MB的pngdata预览图也只是一次查找
+
+WHITESPACE_RE = re.compile(rb'[ \t\r\n]*')
+# 对象/数组内部的结构字符，字符串需要整体跳过
+STRUCTURE_RE = re.compile(rb'["{}\[\]]')
+# 标量值（数字、true、false、null）的结束位置
+SCALAR_END_RE = re.compile(rb'[,}\]\s]')
+
+# decode_value首次解码的字节窗口，值比窗口长时按4倍扩大
+DECODE_WINDOW = 4096
+
+QUOTE = ord('"')
+BACKSLASH = ord('\\')
+OPENERS = b'{['
+
+# 扫描到不符合预期的内容时抛出
+class ScanError(ValueError):
+    pass
+
+def _skip_whitespace(buf, i):
+    return WHITESPACE_RE.match(buf, i).end()
+
+# i指向开引号，返回闭引号之后的位置
+def _string_end(buf, i):
+    j = i + 1
+    while True:
+        j = buf.find(b'"', j)
+        if j < 0:
+            raise ScanError(f'位置 {i} 的字符串没有结束')
+        # 闭引号前连续的反斜杠为偶数个时才是真正的结束
+        k = j - 1
+        while buf[k] == BACKSLASH:
+            k -= 1
+        if (j - 1 - k) % 2 == 0:
+            return j + 1
+        j += 1
+
+# i指向一个值的第一个字节，返回该值结束之后的位置
+def value_end(buf, i):
+    c = buf[i]
+    if c == QUOTE:
+        return _string_end(buf, i)
+    if c in OPENERS:
+        depth = 0
+        pos = i
+        while True:
+            m = STRUCTURE_RE.search(buf, pos)
+            if m is None:
+                raise ScanError(f'位置 {i} 的对象或数组没有结束')
+            pos = m.start()
+            token = buf[pos]
+            if token == QUOTE:
+                pos = _string_end(buf, pos)
+                continue
+            depth += 1 if token in OPENERS else -1
+            pos += 1
+            if depth == 0:
+                return pos
+    m = SCALAR_END_RE.search(buf, i)
+    return m.start() if m else len(buf)
+
+# i指向对象的 {，返回第一个成员键的位置，空对象返回None
+def _first_member(buf, i):
+    if buf[i:i + 1] != b'{':
+        raise ScanError(f'位置 {i} 不是对象')
+    pos = _skip_whitespace(buf, i + 1)
+    if buf[pos:pos + 1] == b'}':
+        return None
+    return pos
+
+# pos指向成员的键，返回 (键, 值起始位置)
+def _read_member_key(buf, pos):
+    if buf[pos] != QUOTE:
+        raise ScanError(f'位置 {pos} 应为对象的键')
+    key_end = _string_end(buf, pos)
+    key = json.loads(bytes(buf[pos:key_end]))
+    pos = _skip_whitespace(buf, key_end)
+    if buf[pos:pos + 1] != b':':
+        raise ScanError(f'位置 {pos} 应为冒号')
+    return key, _skip_whitespace(buf, pos + 1)
+
+# pos为一个成员值结束之后的位置，返回下一个成员键的位置，对象结束时返回None
+def _next_member(buf, pos):
+    pos = _skip_whitespace(buf, pos)
+    separator = buf[pos:pos + 1]
+    if separator == b'}':
+        return None
+    if separator != b',':
+        raise ScanError(f'位置 {pos} 应为逗号或 }}')
+    return _skip_whitespace(buf, pos + 1)
+
+# 逐个产出对象的成员 (键, 值起始位置)，i指向对象的 {
+# 每次产出后继续时会跳过该值，找到目标键后调用方应直接停止迭代
+def iter_members(buf, i):
+    pos = _first_member(buf, i)
+    while pos is not None:
+        key, value_start = _read_member_key(buf, pos)
+        yield key, value_start
+        pos = _next_member(buf, value_end(buf, value_start))
+
+# 逐个产出对象的成员 (键, 值起始位置, 值结束位置)，适合需要每个值字节范围的建索引等场景
+def iter_member_spans(buf, i):
+    pos = _first_member(buf, i)
+    while pos is not None:
+        key, value_start = _read_member_key(buf, pos)
+        end = value_end(buf, value_start)
+        yield key, value_start, end
+        pos = _next_member(buf, end)
+
+# 解码i处的一个值，返回 (值, 结束位置)
+# 与value_end逐个括号计数不同，这里把从i开始的一小段字节解码为str后交给json的C解码器，
+# 再把字符数换算回字节数；窗口截断了值时扩大窗口重试，适合需要逐个解码大量元素的场景
+def decode_value(buf, i, window=DECODE_WINDOW):
+    decoder = json.JSONDecoder()
+    while True:
+        end = min(i + window, len(buf))
+        text = codecs.getincrementaldecoder('utf-8')().decode(buf[i:end], final=end == len(buf))
+        try:
+            value, char_end = decoder.raw_decode(text)
+        except json.JSONDecodeError as e:
+            if end == len(buf):
+                raise ScanError(f'位置 {i} 的值无法解码: {e}') from None
+            window *= 4
+            continue
+        # 数字可能恰好在窗口边界被截断，只有后面还有内容时结果才可信
+        if char_end == len(text) and end < len(buf):
+            window *= 4
+            continue
+        return value, i + len(text[:char_end].encode('utf-8'))
+
+# 逐个产出对象的成员 (键, 值起始位置, 值结束位置, 值)，每个值都被完整解码
+def iter_member_values(buf, i):
+    pos = _first_member(buf, i)
+    while pos is not None:
+        key, value_start = _read_member_key(buf, pos)
+        value, end = decode_value(buf, value_start)
+        yield key, value_start, end, value
+        pos = _next_member(buf, end)
+
+# 按键路径定位值的起始位置，例如 ('diagram', 'elements', 'elements')，找不到返回None
+# 路径上经过的兄弟值只被跳过，不会被解码；start为路径起点所在对象的位置，默认为整个缓冲区
+def find_value_start(buf, path, start=0):
+    pos = _skip_whitespace(buf, start)
+    for key in path:
+        if buf[pos:pos + 1] != b'{':
+            return None
+        for member_key, value_start in iter_members(buf, pos):
+            if member_key == key:
+                pos = value_start
+                break
+        else:
+            return None
+    return pos
+
+# 最外层对象的最后一个成员的键为key时返回其值的起始位置，否则返回None
+# 从缓冲区末尾向前查找键，前面的成员一个字节都不经过；适合meta这类排在最后、
+# 前面隔着整个elements的小值（iter_members要逐个括号跳过前面所有的值）
+def find_last_member(buf, key):
+    end = len(buf)
+    while end > 0 and buf[end - 1] in b' \t\r\n':
+        end -= 1
+    if end == 0 or buf[end - 1] != ord('}'):
+        return None
+    end -= 1
+    pattern = json.dumps(key).encode('utf-8')
+    pos = end
+    while True:
+        pos = buf.rfind(pattern, 0, pos)
+        if pos < 0:
+            return None
+        # 引号前连续的反斜杠为奇数个时是字符串内容，不是键
+        k = pos - 1
+        while k >= 0 and buf[k] == BACKSLASH:
+            k -= 1
+        if (pos - 1 - k) % 2:
+            continue
+        colon = _skip_whitespace(buf, pos + len(pattern))
+        if buf[colon:colon + 1] != b':':
+            continue
+        value_start = _skip_whitespace(buf, colon + 1)
+        try:
+            _, value_stop = decode_value(buf, value_start)
+        except ScanError:
+            continue
+        # 值之后只剩最外层的 } 时才是最外层对象的最后一个成员
+        if _skip_whitespace(buf, value_stop) == end:
+            return value_start
+
+# 按键路径定位值的字节范围 [start, end)，适合page、meta这类较小的值
+def find_value_span(buf, path):
+    start = find_value_start(buf, path)
+    if start is None:
+        return None
+    return start, value_end(buf, start)
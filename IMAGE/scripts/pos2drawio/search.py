@@ -0,0 +1,262 @@
+import os
+import re
+import sqlite3
+
+import ijson
+
+from .index import element_bbox
+from .reader import open_pos_stream, read_diagram_title
+from .text import html_to_text
+
+# 跨文件的全文索引：textBlock文本 → (文件, 元素id, bbox)，存放在一个SQLite数据库中
+# 中日韩文字按相邻两字切分（bigram），其余文字按单词切分并转为小写
+# 每个文件记录size/mtime_ns，更新索引时只重新扫描变化过的文件，已删除的文件从索引中移除
+# 查询先在倒排表中求所有词的交集，再用原文逐条核对，连续的中文短语不会匹配到分散的两个字
+
+SEARCH_DB_NAME = '.pos2drawio-search.sqlite'
+SCHEMA_VERSION = 1
+ELEMENTS_PREFIX = 'diagram.elements.elements'
+
+# 中日韩文字（汉字、假名、谚文）
+CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+')
+WORD_RE = re.compile(r'[^\W_]+')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    title TEXT
+);
+CREATE TABLE IF NOT EXISTS elements (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL,
+    element_id TEXT NOT NULL,
+    type TEXT,
+    x REAL, y REAL, w REAL, h REAL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS elements_file ON elements (file_id);
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    term TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term_id INTEGER NOT NULL,
+    element INTEGER NOT NULL,
+    PRIMARY KEY (term_id, element)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_element ON postings (element);
+'''
+
+# 把纯文本切分为索引词
+# 中日韩文字的每个连续片段产生所有相邻两字，外加片段的最后一个字，
+# 这样单字查询按前缀查找词表就能覆盖该字出现的每个位置
+def tokenize(text):
+    terms = set()
+    pos = 0
+    text = text.casefold()
+    for m in CJK_RE.finditer(text):
+        terms.update(WORD_RE.findall(text, pos, m.start()))
+        run = m.group(0)
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+        terms.add(run[-1])
+        pos = m.end()
+    terms.update(WORD_RE.findall(text, pos))
+    return terms
+
+# 查询串切分为 (词, 是否按前缀匹配) 的列表，以及用于逐条核对的片段
+def _query_terms(query):
+    query = query.casefold()
+    terms = []
+    pieces = []
+    pos = 0
+    for m in CJK_RE.finditer(query):
+        for word in WORD_RE.findall(query, pos, m.start()):
+            terms.append((word, False))
+            pieces.append(word)
+        run = m.group(0)
+        if len(run) == 1:
+            terms.append((run, True))
+        else:
+            terms.extend((run[i:i + 2], False) for i in range(len(run) - 1))
+        pieces.append(run)
+        pos = m.end()
+    for word in WORD_RE.findall(query, pos):
+        terms.append((word, False))
+        pieces.append(word)
+    return terms, pieces
+
+# 元素的全部textBlock文本，转换为纯文本后按行拼接
+def element_text(element_data):
+    parts = []
+    for text_block in element_data.get('textBlock') or ():
+        text = text_block.get('text') if isinstance(text_block, dict) else None
+        if text:
+            parts.append(html_to_text(text).strip())
+    return '\n'.join(part for part in parts if part)
+
+# 扫描一个pos文件，返回 (meta.diagramInfo.title, [(元素id, 类型, bbox, 文本)])，只包含有文本的元素
+# 元素由ijson逐个流式解析，取出文本和bbox后立即丢弃
+def scan_labels(pos_file):
+    title = read_diagram_title(pos_file)
+    labels = []
+    with open_pos_stream(pos_file) as f:
+        for element_id, element_data in ijson.kvitems(f, ELEMENTS_PREFIX):
+            if not isinstance(element_data, dict):
+                continue
+            text = element_text(element_data)
+            if text:
+                labels.append((element_id, element_data.get('name'), element_bbox(element_data), text))
+    return title, labels
+
+# 一条查询结果
+class SearchHit:
+    __slots__ = ('path', 'title', 'element_id', 'type', 'bbox', 'text')
+
+    def __init__(self, path, title, element_id, element_type, bbox, text):
+        self.path = path
+        self.title = title
+        self.element_id = element_id
+        self.type = element_type
+        self.bbox = bbox
+        self.text = text
+
+class TextIndex:
+    def __init__(self, db_path=SEARCH_DB_NAME):
+        self.db_path = db_path
+        self.db = sqlite3.connect(db_path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            raise ValueError(f'{db_path} 的索引版本 {version} 不受支持，请删除后重建')
+        with self.db:
+            self.db.executescript(SCHEMA)
+            self.db.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        self._term_ids = {}
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _term_id(self, term):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            row = self.db.execute('SELECT id FROM terms WHERE term = ?', (term,)).fetchone()
+            if row is None:
+                term_id = self.db.execute('INSERT INTO terms (term) VALUES (?)', (term,)).lastrowid
+            else:
+                term_id = row[0]
+            self._term_ids[term] = term_id
+        return term_id
+
+    def _remove_file(self, file_id):
+        self.db.execute('DELETE FROM postings WHERE element IN (SELECT id FROM elements WHERE file_id = ?)', (file_id,))
+        self.db.execute('DELETE FROM elements WHERE file_id = ?', (file_id,))
+        self.db.execute('DELETE FROM files WHERE id = ?', (file_id,))
+
+    # 文件自上次索引以来是否没有变化
+    def is_fresh(self, pos_file):
+        row = self.db.execute('SELECT size, mtime_ns FROM files WHERE path = ?', (os.path.abspath(pos_file),)).fetchone()
+        if row is None:
+            return False
+        st = os.stat(pos_file)
+        return row == (st.st_size, st.st_mtime_ns)
+
+    # 重新索引一个文件（一个事务），返回有文本的元素数量
+    def index_file(self, pos_file):
+        path = os.path.abspath(pos_file)
+        st = os.stat(pos_file)
+        title, labels = scan_labels(pos_file)
+        try:
+            return self._insert_file(path, st, title, labels)
+        except BaseException:
+            # 事务已回滚，缓存中新插入的词id不再有效
+            self._term_ids.clear()
+            raise
+
+    def _insert_file(self, path, st, title, labels):
+        with self.db:
+            row = self.db.execute('SELECT id FROM files WHERE path = ?', (path,)).fetchone()
+            if row is not None:
+                self._remove_file(row[0])
+            file_id = self.db.execute('INSERT INTO files (path, size, mtime_ns, title) VALUES (?, ?, ?, ?)',
+                                      (path, st.st_size, st.st_mtime_ns, title)).lastrowid
+            postings = []
+            for element_id, element_type, bbox, text in labels:
+                element = self.db.execute(
+                    'INSERT INTO elements (file_id, element_id, type, x, y, w, h, text) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (file_id, element_id, element_type, *(None if v != v else v for v in bbox), text)).lastrowid
+                postings.extend((self._term_id(term), element) for term in tokenize(text))
+            self.db.executemany('INSERT OR IGNORE INTO postings (term_id, element) VALUES (?, ?)', postings)
+        return len(labels)
+
+    # 增量更新：pos_files为当前应当在索引中的全部文件
+    # 没有变化的文件跳过，变化的重新索引，不在列表中的从索引中删除
+    # 逐个产出 (pos文件, 状态, 有文本的元素数量或错误信息)，状态为 indexed、fresh、removed 或 error
+    def update(self, pos_files, prune=True):
+        wanted = {os.path.abspath(pos_file) for pos_file in pos_files}
+        if prune:
+            for file_id, path in self.db.execute('SELECT id, path FROM files').fetchall():
+                if path not in wanted:
+                    with self.db:
+                        self._remove_file(file_id)
+                    yield path, 'removed', 0
+        for pos_file in pos_files:
+            if self.is_fresh(pos_file):
+                yield pos_file, 'fresh', 0
+                continue
+            try:
+                yield pos_file, 'indexed', self.index_file(pos_file)
+            except (OSError, ValueError) as e:
+                yield pos_file, 'error', f'{type(e).__name__}: {e}'
+
+    # 查询同时包含query中所有词的元素，按文件和元素出现顺序返回最多limit条SearchHit
+    def search(self, query, limit=100):
+        terms, pieces = _query_terms(query)
+        if not terms:
+            return []
+
+        # 每个词对应一组词表id（前缀匹配时可能有多个），任何一个词在词表中不存在就没有结果
+        groups = []
+        for term, prefix in terms:
+            if prefix:
+                rows = self.db.execute('SELECT id FROM terms WHERE term >= ? AND term < ?',
+                                       (term, term + '\U0010ffff')).fetchall()
+            else:
+                rows = self.db.execute('SELECT id FROM terms WHERE term = ?', (term,)).fetchall()
+            if not rows:
+                return []
+            groups.append([row[0] for row in rows])
+
+        # 每组的倒排表求交集，再取出元素和文件信息
+        selects = []
+        params = []
+        for ids in groups:
+            selects.append(f"SELECT element FROM postings WHERE term_id IN ({','.join('?' * len(ids))})")
+            params.extend(ids)
+        sql = (f"SELECT f.path, f.title, e.element_id, e.type, e.x, e.y, e.w, e.h, e.text "
+               f"FROM elements e JOIN files f ON f.id = e.file_id "
+               f"WHERE e.id IN ({' INTERSECT '.join(selects)}) ORDER BY e.id")
+
+        hits = []
+        for path, title, element_id, element_type, x, y, w, h, text in self.db.execute(sql, params):
+            folded = text.casefold()
+            if all(piece in folded for piece in pieces):
+                hits.append(SearchHit(path, title, element_id, element_type, (x, y, w, h), text))
+                if len(hits) >= limit:
+                    break
+        return hits
+
+    # 索引中的文件数、元素数和词数
+    def stats(self):
+        return {name: self.db.execute(f'SELECT count(*) FROM {name}').fetchone()[0]
+                for name in ('files', 'elements', 'terms')}
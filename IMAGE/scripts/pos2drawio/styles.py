@@ -0,0 +1,130 @@
+import sys
+from functools import lru_cache
+
+# 样式缓存的容量，一个图表中不同的(形状, 填充, 边框, 线宽)组合通常只有几十种
+STYLE_CACHE_SIZE = 4096
+
+# 各节点类型的基础形状样式
+SHAPE_STYLES = {
+    'round': ['rounded=1', 'shape=ellipse'],
+    'circle': ['rounded=1', 'shape=ellipse'],
+    'rect': ['rounded=0'],
+    'rectangle': ['rounded=0'],
+    'note': ['rounded=1', 'shape=note', 'fillColor=#fff0c2'],
+    'roundRectangle': ['rounded=1', 'arcSize=20'],
+    'diamond': ['shape=diamond'],
+    'singleRightArrow': ['shape=process', 'rounded=0'],
+    'singleLeftArrow': ['shape=process', 'rounded=0'],
+}
+
+# 将RGB颜色转换为十六进制，无法识别的格式返回default
+def rgb_to_hex(color_val, default):
+    if isinstance(color_val, (list, tuple)) and len(color_val) >= 3:
+        # 处理RGB数组格式 [r, g, b]
+        r, g, b = color_val[:3]
+        # 确保颜色值在0-255范围内
+        r = max(0, min(255, int(r)))
+        g = max(0, min(255, int(g)))
+        b = max(0, min(255, int(b)))
+        return f'#{r:02x}{g:02x}{b:02x}'
+    elif isinstance(color_val, str) and color_val.startswith('#'):
+        # 已经是十六进制格式
+        return color_val
+    else:
+        return default
+
+# 把颜色值规范化为可哈希的形式，用作缓存键
+def _color_key(color_val):
+    if isinstance(color_val, list):
+        return tuple(color_val)
+    return color_val
+
+# 线宽用原始文本作键：Decimal('1.0') 与 1 相等但输出不同，不能共用缓存
+def _width_key(line_style):
+    if 'width' in line_style:
+        return str(line_style['width'])
+    return None
+
+# 节点样式的规范化键：(类型, 填充色, 边框色, 线宽)，没有设置的项为None
+def node_style_key(element_data):
+    fill_style = element_data.get('fillStyle')
+    line_style = element_data.get('lineStyle') or {}
+    return (
+        element_data['name'],
+        _color_key(fill_style.get('color', [255, 255, 255])) if fill_style else None,
+        _color_key(line_style['color']) if 'color' in line_style else None,
+        _width_key(line_style)
+    )
+
+# 编译节点样式字符串，结果被缓存并驻留，相同的组合在整个进程中只构建一次
+@lru_cache(maxsize=STYLE_CACHE_SIZE)
+def compile_node_style(element_type, fill, stroke, width):
+    style = list(SHAPE_STYLES.get(element_type, ()))
+
+    # 文本样式
+    style.append('whiteSpace=wrap')
+    style.append('html=1')
+
+    # 填充颜色（如果不是特殊形状）
+    if element_type != 'note':  # note已经有默认填充色
+        if fill is not None:
+            fill_color = rgb_to_hex(fill, '#ffffff')
+            # 避免黑色背景导致文本不可见
+            if fill_color == '#000000':
+                fill_color = '#ffffff'
+            style.append(f'fillColor={fill_color}')
+        else:
+            style.append('fillColor=#ffffff')
+
+    # 边框颜色
+    if stroke is not None:
+        style.append(f"strokeColor={rgb_to_hex(stroke, '#ffffff')}")
+    elif element_type != 'note':  # note使用默认边框颜色
+        style.append('strokeColor=#000000')
+
+    # 文本颜色
+    style.append('fontColor=#000000')  # 设置黑色文本确保可见性
+
+    # 边框宽度
+    if width is not None:
+        style.append(f'strokeWidth={width}')
+
+    return sys.intern(';'.join(style))
+
+# 连接线样式的规范化键：(边框色, 线宽)
+def linker_style_key(element_data):
+    line_style = element_data.get('lineStyle') or {}
+    return (
+        _color_key(line_style['color']) if 'color' in line_style else None,
+        _width_key(line_style)
+    )
+
+# 编译连接线样式字符串，与节点样式共用同样的缓存和驻留策略
+@lru_cache(maxsize=STYLE_CACHE_SIZE)
+def compile_linker_style(stroke, width):
+    style = ['endArrow=classic', 'html=1', 'rounded=0', 'fillColor=none']  # 连接线无填充
+
+    # 添加线条样式
+    if width is not None:
+        style.append(f'strokeWidth={width}')
+    if stroke is not None:
+        style.append(f"strokeColor={rgb_to_hex(stroke, '#000000')}")
+
+    # 文本颜色
+    style.append('fontColor=#000000')  # 设置黑色文本确保可见性
+
+    return sys.intern(';'.join(style))
+
+# 获取节点样式
+def node_style(element_data):
+    return compile_node_style(*node_style_key(element_data))
+
+# 获取连接线样式
+def linker_style(element_data):
+    return compile_linker_style(*linker_style_key(element_data))
+
+# 两个样式缓存合计的 (命中次数, 未命中次数)，未命中的次数就是实际构建样式字符串的次数
+def style_cache_info():
+    node_info = compile_node_style.cache_info()
+    linker_info = compile_linker_style.cache_info()
+    return node_info.hits + linker_info.hits, node_info.misses + linker_info.misses
@@ -0,0 +1,90 @@
+import sys
+from array import array
+
+# 紧凑的节点表：需要在整个转换期间保留的节点信息（是否存在、类型、zindex、外框）
+# 不保存元素字典，每个节点一行，按列存放在array中：
+#   id通过sys.intern驻留，同一个id作为节点和连接线端点出现时共用一个字符串对象
+#   类型存为类型表中的序号，x/y/w/h存为double，zindex存为int
+# 每个节点约占40字节的列数据加上id到行号的一个字典项，百万节点的图表也可以放在内存中
+
+NAN = float('nan')
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+def _integer(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+class NodeTable:
+    __slots__ = ('rows', 'ids', 'types', '_type_codes', 'type', 'zindex', 'x', 'y', 'w', 'h')
+
+    # ids为预先存在、没有几何信息的节点（例如增量更新时输出中已有的节点）
+    def __init__(self, ids=()):
+        self.rows = {}
+        self.ids = []
+        self.types = []
+        self._type_codes = {}
+        self.type = array('H')
+        self.zindex = array('i')
+        self.x = array('d')
+        self.y = array('d')
+        self.w = array('d')
+        self.h = array('d')
+        for element_id in ids:
+            self.add(element_id)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, element_id):
+        return element_id in self.rows
+
+    # 添加一个节点，返回行号；id已存在时更新该行
+    def add(self, element_id, element_type='', bbox=(NAN, NAN, NAN, NAN), zindex=0):
+        code = self._type_codes.get(element_type)
+        if code is None:
+            code = self._type_codes[element_type] = len(self.types)
+            self.types.append(element_type)
+        x, y, w, h = bbox
+
+        row = self.rows.get(element_id)
+        if row is not None:
+            self.type[row] = code
+            self.zindex[row] = zindex
+            self.x[row], self.y[row], self.w[row], self.h[row] = x, y, w, h
+            return row
+
+        element_id = sys.intern(element_id)
+        row = self.rows[element_id] = len(self.ids)
+        self.ids.append(element_id)
+        self.type.append(code)
+        self.zindex.append(zindex)
+        self.x.append(x)
+        self.y.append(y)
+        self.w.append(w)
+        self.h.append(h)
+        return row
+
+    # 从元素数据中取出类型、props中的外框和zindex，元素字典本身不保留
+    def add_element(self, element_id, element_data):
+        props = element_data.get('props') or {}
+        return self.add(element_id, element_data.get('name') or '',
+                        (_number(props.get('x')), _number(props.get('y')),
+                         _number(props.get('w')), _number(props.get('h'))),
+                        _integer(props.get('zindex', 0)))
+
+    # 节点的行号，不存在时返回default
+    def row(self, element_id, default=None):
+        return self.rows.get(element_id, default)
+
+    def type_of(self, row):
+        return self.types[self.type[row]]
+
+    def bbox(self, row):
+        return self.x[row], self.y[row], self.w[row], self.h[row]
@@ -0,0 +1,74 @@
+import re
+from functools import lru_cache
+from html.entities import html5
+
+# textBlock文本（ProcessOn编辑器产生的HTML片段）到draw.io标签的转换
+# 标签和实体由同一个正则一次扫描处理，不再对整段文本反复replace；重复出现的文本直接命中缓存
+
+# 标签模式
+LABEL_AUTO = 'auto'    # 只有换行类标签时转换为纯文本，带行内样式时原样保留HTML
+LABEL_HTML = 'html'    # 原样保留HTML，由draw.io的html=1渲染
+LABEL_TEXT = 'text'    # 总是转换为纯文本，丢弃行内样式
+LABEL_MODES = (LABEL_AUTO, LABEL_HTML, LABEL_TEXT)
+
+# 一个HTML标签或字符实体
+TOKEN_RE = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)\b[^>]*>|&(#[0-9]+|#[xX][0-9a-fA-F]+|[a-zA-Z][a-zA-Z0-9]*);')
+
+# 只表示换行的标签，转换为纯文本不会丢失信息
+BLOCK_TAGS = frozenset(['div', 'p'])
+LINE_BREAK_TAGS = frozenset(['br'])
+
+# 节点样式带html=1，解码为这几个字符的实体（&lt;、&#60;、&#x3c;、&LT;等）必须保持转义，
+# draw.io才会按字面显示，否则转义过的文本会变成真正的标签
+MARKUP_CHARS = frozenset('<>&')
+
+def _decode_entity(name):
+    if name[0] == '#':
+        try:
+            code = int(name[2:], 16) if name[1] in 'xX' else int(name[1:])
+            return chr(code)
+        except (ValueError, OverflowError):
+            return None
+    if name == 'nbsp':
+        return ' '
+    return html5.get(name + ';')
+
+# 一次扫描完成转换，返回 (文本, 是否遇到了换行类以外的标签)
+# keep_markup为True时保留表示 < > & 的实体，结果可以直接作为html=1的标签
+def _translate(text, keep_markup):
+    inline = False
+
+    def replace(m):
+        nonlocal inline
+        closing, tag, entity = m.groups()
+        if tag is not None:
+            tag = tag.lower()
+            if tag in BLOCK_TAGS:
+                return '' if closing else '\n'
+            if tag in LINE_BREAK_TAGS:
+                return '\n'
+            inline = True
+            return ''
+        decoded = _decode_entity(entity)
+        if decoded is None or keep_markup and decoded in MARKUP_CHARS:
+            return m.group(0)
+        return decoded
+
+    return TOKEN_RE.sub(replace, text), inline
+
+# 把textBlock文本转换为draw.io标签
+@lru_cache(maxsize=4096)
+def translate_label(text, mode=LABEL_AUTO):
+    if mode == LABEL_HTML or '<' not in text and '&' not in text:
+        return text
+    label, inline = _translate(text, keep_markup=True)
+    if inline and mode == LABEL_AUTO:
+        return text
+    return label
+
+# 把textBlock文本转换为完全解码的纯文本，用于日志、检索等不经过draw.io渲染的场合
+@lru_cache(maxsize=4096)
+def html_to_text(text):
+    if '<' not in text and '&' not in text:
+        return text
+    return _translate(text, keep_markup=False)[0]
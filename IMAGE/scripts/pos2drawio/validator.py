@@ -0,0 +1,185 @@
+import math
+import xml.etree.ElementTree as ET
+
+from .compression import iter_decompressed
+
+# 每个文件最多记录的问题条数，超过后只计数
+MAX_ERRORS = 20
+
+# 带自定义属性的单元格写成 <UserObject id=...><mxCell .../></UserObject>
+WRAPPER_TAGS = ('UserObject', 'object')
+
+# 把节点的style归类，用于统计节点类型
+def classify_node_style(style):
+    if 'shape=note' in style:
+        return 'note'
+    if 'shape=ellipse' in style:
+        return 'circle/round'
+    if 'shape=diamond' in style:
+        return 'diamond'
+    if 'rounded=1' in style:
+        return 'rounded rectangle'
+    return 'rectangle'
+
+def _is_number(value):
+    try:
+        return math.isfinite(float(value))
+    except (TypeError, ValueError):
+        return False
+
+# 检查节点的mxGeometry，返回问题描述，没有问题返回None
+def check_vertex_geometry(cell):
+    geometry = None
+    for child in cell:
+        if child.tag == 'mxGeometry' and child.get('as') == 'geometry':
+            geometry = child
+            break
+    if geometry is None:
+        return '缺少mxGeometry'
+    for name in ('x', 'y'):
+        value = geometry.get(name)
+        if value is not None and not _is_number(value):
+            return f'mxGeometry的{name}不是数字: {value!r}'
+    for name in ('width', 'height'):
+        value = geometry.get(name)
+        if value is None:
+            return f'mxGeometry缺少{name}'
+        if not _is_number(value) or float(value) < 0:
+            return f'mxGeometry的{name}不是非负数字: {value!r}'
+    return None
+
+# 单个<diagram>页面的检查状态
+# 引用的id可能出现在后面，所以先引用后定义的情况暂存在pending中，页面结束时再判断
+class _DiagramState:
+    def __init__(self, name):
+        self.name = name
+        self.ids = set()
+        # 尚未出现的id -> [(引用方id, 引用的属性)]
+        self.pending = {}
+
+    def reference(self, cell_id, attr, ref_id):
+        if ref_id not in self.ids:
+            self.pending.setdefault(ref_id, []).append((cell_id, attr))
+
+    def define(self, cell_id):
+        self.ids.add(cell_id)
+        self.pending.pop(cell_id, None)
+
+# 用iterparse流式校验一个draw.io文件，每个mxCell检查完就清除，内存占用与文件大小无关（id集合除外）
+# 检查：根元素为mxfile、同一页面内id唯一、parent/source/target引用的单元格存在、节点有合法的mxGeometry
+# 压缩格式的页面边解压边解析，同样逐个单元格检查
+# 返回结果字典，status为ok（通过）、invalid（有问题）或error（无法解析）
+def validate_file(path, max_errors=MAX_ERRORS):
+    result = {'file': path, 'status': 'ok', 'diagrams': 0, 'compressed': 0, 'cells': 0, 'nodes': 0, 'edges': 0,
+              'node_types': {}, 'problems': 0, 'errors': []}
+
+    def problem(message):
+        result['problems'] += 1
+        if len(result['errors']) < max_errors:
+            result['errors'].append(message)
+
+    try:
+        events = ET.iterparse(path, events=('start', 'end'))
+        for event, elem in events:
+            if elem.tag != 'mxfile':
+                problem(f'根元素是<{elem.tag}>，不是<mxfile>')
+                events = ()
+            break
+
+        for event, elem in events:
+            if event != 'start' or elem.tag != 'diagram':
+                continue
+            result['diagrams'] += 1
+            diagram = _DiagramState(elem.get('name') or elem.get('id') or str(result['diagrams']))
+            _walk_cells(events, diagram, result, problem)
+
+            # 压缩格式的页面：内容是一段文本而不是子元素
+            if len(elem) == 0 and (elem.text or '').strip():
+                result['compressed'] += 1
+                try:
+                    _walk_cells(_iter_compressed_events(elem.text), diagram, result, problem)
+                except (ValueError, ET.ParseError) as e:
+                    problem(f'页面 {diagram.name}: 压缩内容无法解析: {e}')
+
+            for ref_id, refs in diagram.pending.items():
+                for cell_id, attr in refs:
+                    problem(f'页面 {diagram.name}: 单元格 {cell_id} 的{attr}引用了不存在的 {ref_id}')
+            elem.clear()
+    except ET.ParseError as e:
+        result['status'] = 'error'
+        result['errors'].append(f'XML解析失败: {e}')
+        return result
+    except OSError as e:
+        result['status'] = 'error'
+        result['errors'].append(f'{type(e).__name__}: {e}')
+        return result
+
+    if result['diagrams'] == 0 and not result['problems']:
+        problem('没有<diagram>页面')
+    if result['problems']:
+        result['status'] = 'invalid'
+    return result
+
+# 逐个检查事件流中的mxCell，直到当前<diagram>结束（或事件流结束）
+def _walk_cells(events, diagram, result, problem):
+    # 当前<root>元素，每处理完一个mxCell就清空它，避免已解析的单元格堆积在树中
+    cells_root = None
+    # 包着mxCell的<UserObject>/<object>，这时id在外层元素上
+    wrapper = None
+    for event, elem in events:
+        if event == 'start':
+            if elem.tag == 'root':
+                cells_root = elem
+            elif elem.tag in WRAPPER_TAGS:
+                wrapper = elem
+            continue
+
+        if elem.tag == 'mxCell':
+            _check_cell(elem, diagram, result, problem, wrapper.get('id') if wrapper is not None else None)
+            if cells_root is not None:
+                cells_root.clear()
+        elif elem.tag in WRAPPER_TAGS:
+            wrapper = None
+        elif elem.tag == 'diagram':
+            return
+
+# 边解压边解析压缩页面，产出与iterparse相同的 (事件, 元素)
+def _iter_compressed_events(payload):
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    for chunk in iter_decompressed(payload):
+        parser.feed(chunk)
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+# 检查一个mxCell
+def _check_cell(cell, diagram, result, problem, wrapper_id=None):
+    result['cells'] += 1
+    cell_id = cell.get('id', wrapper_id)
+    if cell_id is None:
+        problem(f'页面 {diagram.name}: 第 {result["cells"]} 个单元格缺少id')
+        cell_id = f'#{result["cells"]}'
+    elif cell_id in diagram.ids:
+        problem(f'页面 {diagram.name}: 重复的id {cell_id}')
+    else:
+        diagram.define(cell_id)
+
+    parent = cell.get('parent')
+    if parent is not None:
+        diagram.reference(cell_id, 'parent', parent)
+
+    if cell.get('vertex') == '1':
+        result['nodes'] += 1
+        node_type = classify_node_style(cell.get('style', ''))
+        result['node_types'][node_type] = result['node_types'].get(node_type, 0) + 1
+        message = check_vertex_geometry(cell)
+        if message:
+            problem(f'页面 {diagram.name}: 节点 {cell_id} {message}')
+    elif cell.get('edge') == '1':
+        result['edges'] += 1
+        for attr in ('source', 'target'):
+            ref_id = cell.get(attr)
+            if ref_id is None:
+                problem(f'页面 {diagram.name}: 连接线 {cell_id} 缺少{attr}')
+            else:
+                diagram.reference(cell_id, attr, ref_id)
@@ -0,0 +1,154 @@
+from .compression import DeflateBase64Writer
+
+# 默认的mxfile根元素属性
+MXFILE_ATTRS = {
+    'host': 'app.diagrams.net',
+    'modified': '2026-01-01T00:00:00.000Z',
+    'agent': 'pos_to_drawio_converter',
+    'version': '24.8.3',
+    'etag': 'converted_from_pos',
+    'type': 'device'
+}
+
+# 默认的diagram元素属性
+DIAGRAM_ATTRS = {
+    'name': 'Page-1',
+    'id': 'converted-diagram'
+}
+
+# 默认的mxGraphModel元素属性
+GRAPH_MODEL_ATTRS = {
+    'dx': '2000',
+    'dy': '2000',
+    'grid': '1',
+    'gridSize': '10',
+    'guides': '1',
+    'tooltips': '1',
+    'connect': '1',
+    'arrows': '1',
+    'fold': '1',
+    'page': '1',
+    'pageScale': '1',
+    'pageWidth': '827',
+    'pageHeight': '1169',
+    'math': '0',
+    'shadow': '0'
+}
+
+# 属性值转义，与minidom写属性时的规则一致
+def escape_attr(value):
+    return value.replace('&', '&amp;').replace('<', '&lt;').replace('"', '&quot;').replace('>', '&gt;')
+
+# 增量式draw.io XML写入器
+# 每个mxCell在转换出来后立刻写入输出文件，不在内存中保留整棵树
+# indent='  '时输出与 minidom.toprettyxml(indent='  ') 逐字节一致；indent=None时输出紧凑格式
+# compress为True时每个<diagram>的内容按draw.io的压缩格式边生成边压缩写出
+class DrawioWriter:
+    def __init__(self, out, indent='  ', compress=False):
+        self.out = out
+        if indent is None:
+            self.indent = ''
+            self.newl = ''
+        else:
+            self.indent = indent
+            self.newl = '\n'
+        self.compress = compress
+        self.cells_written = 0
+        # 压缩当前页面时保存的 (输出流, 缩进, 换行, 压缩器)
+        self._saved = None
+
+    # 写XML声明以及 mxfile/diagram/mxGraphModel/root 的开始标签和两个默认节点
+    def start(self, mxfile_attrs=None, diagram_attrs=None, graph_model_attrs=None):
+        self.out.write('<?xml version="1.0" ?>' + self.newl)
+        self._write_open('mxfile', mxfile_attrs or MXFILE_ATTRS, 0)
+        self.start_diagram(diagram_attrs, graph_model_attrs)
+
+    # 开始一个diagram页面
+    def start_diagram(self, diagram_attrs=None, graph_model_attrs=None):
+        if self.compress:
+            # 页面内容是一段文本，压缩前的XML不需要缩进
+            self.out.write(self._start_tag('diagram', diagram_attrs or DIAGRAM_ATTRS, 1) + '>')
+            compressor = DeflateBase64Writer(self.out)
+            self._saved = (self.out, self.indent, self.newl, compressor)
+            self.out, self.indent, self.newl = compressor, '', ''
+        else:
+            self._write_open('diagram', diagram_attrs or DIAGRAM_ATTRS, 1)
+        self._write_open('mxGraphModel', graph_model_attrs or GRAPH_MODEL_ATTRS, 2)
+        self._write_open('root', {}, 3)
+        self.write_cell({'id': '0'})
+        self.write_cell({'id': '1', 'parent': '0'})
+
+    # 写一个mxCell，children为 (tag, attrs, children) 形式的子元素列表
+    def write_cell(self, attrs, children=()):
+        self._write_node(('mxCell', attrs, children), 4)
+        self.cells_written += 1
+
+    # 写一个带自定义属性（如label、link）的单元格：<UserObject>包着不带id和value的mxCell
+    def write_object(self, object_attrs, cell_attrs, children=()):
+        self._write_node(('UserObject', object_attrs, [('mxCell', cell_attrs, children)]), 4)
+        self.cells_written += 1
+
+    # 写一个图片单元格，style中的图片数据（base64文本，无需转义）由image_chunks逐块写出，
+    # 不需要把整段图片放进内存；attrs['style']是图片数据之前的部分，style_suffix是之后的部分
+    def write_image_cell(self, attrs, image_chunks, style_suffix='', children=()):
+        # style之前的属性连同未闭合的style写在head中，style之后的属性写在tail中
+        head = []
+        tail = []
+        parts = head
+        for name, value in attrs.items():
+            if name == 'style':
+                head.append(' style="' + escape_attr(value))
+                parts = tail
+            else:
+                parts.append(' ' + name + '="' + escape_attr(value) + '"')
+        self.out.write(self.indent * 4 + '<mxCell' + ''.join(head))
+        for chunk in image_chunks:
+            self.out.write(chunk)
+        self.out.write(escape_attr(style_suffix) + '"' + ''.join(tail))
+        if children:
+            self.out.write('>' + self.newl)
+            for child in children:
+                self._write_node(child, 5)
+            self._write_close('mxCell', 4)
+        else:
+            self.out.write('/>' + self.newl)
+        self.cells_written += 1
+
+    # 结束当前diagram页面
+    def end_diagram(self):
+        self._write_close('root', 3)
+        self._write_close('mxGraphModel', 2)
+        if self._saved is not None:
+            self.out, self.indent, self.newl, compressor = self._saved
+            self._saved = None
+            compressor.close()
+            self.out.write('</diagram>' + self.newl)
+        else:
+            self._write_close('diagram', 1)
+
+    # 写所有结束标签
+    def end(self):
+        self.end_diagram()
+        self._write_close('mxfile', 0)
+
+    def _write_node(self, node, depth):
+        tag, attrs, children = node
+        if children:
+            self._write_open(tag, attrs, depth)
+            for child in children:
+                self._write_node(child, depth + 1)
+            self._write_close(tag, depth)
+        else:
+            self.out.write(self._start_tag(tag, attrs, depth) + '/>' + self.newl)
+
+    def _write_open(self, tag, attrs, depth):
+        self.out.write(self._start_tag(tag, attrs, depth) + '>' + self.newl)
+
+    def _write_close(self, tag, depth):
+        self.out.write(self.indent * depth + '</' + tag + '>' + self.newl)
+
+    def _start_tag(self, tag, attrs, depth):
+        parts = [self.indent * depth, '<', tag]
+        for name, value in attrs.items():
+            parts.append(' ' + name + '="' + escape_attr(value) + '"')
+        return ''.join(parts)
@@ -0,0 +1,86 @@
+import heapq
+import itertools
+import json
+import struct
+import tempfile
+
+from .handlers import NODE, get_handler
+from .reader import map_pos_file
+
+# 层叠顺序：draw.io按单元格在文档中的顺序绘制，后写出的在上层
+# 按 (props.zindex, 文件偏移) 升序写出元素，zindex相同时保持文件中的顺序，与ProcessOn中的层叠一致
+# 排序键直接取自元素索引中的定长记录，不需要解码元素；
+# 外部归并排序：每RUN_SIZE条排序键排好序后打包为SORT_RECORD写入临时文件，写出时用heapq.merge归并各段，
+# 内存中最多一段排序键加上每段一个读缓冲，元素按偏移从mmap中逐个解码，任意时刻只有一个在内存中
+
+# 每段排序键的条数
+RUN_SIZE = 256 * 1024
+# 排序记录：zindex、偏移、长度、索引中的行号
+SORT_RECORD = struct.Struct('<iQII')
+# 归并时每段每次读取的记录数
+MERGE_BUFFER = 4096
+
+# 把一段排序键排序后写入临时文件，返回文件对象（关闭时自动删除）
+def _spill(keys, tmp_dir):
+    keys.sort()
+    run = tempfile.TemporaryFile(dir=tmp_dir)
+    run.write(b''.join(itertools.starmap(SORT_RECORD.pack, keys)))
+    run.seek(0)
+    return run
+
+def _read_run(run):
+    while True:
+        chunk = run.read(SORT_RECORD.size * MERGE_BUFFER)
+        if not chunk:
+            return
+        yield from SORT_RECORD.iter_unpack(chunk)
+
+# 对 (zindex, 偏移, 长度, 行号) 序列做外部归并排序，按升序产出
+# 键的数量不超过run_size时直接在内存中排序，不写临时文件；写出的段数计入metrics的sort_runs
+def external_sort(keys, run_size=RUN_SIZE, tmp_dir=None, metrics=None):
+    runs = []
+    try:
+        while True:
+            batch = list(itertools.islice(keys, run_size))
+            if len(batch) < run_size and not runs:
+                batch.sort()
+                yield from batch
+                return
+            if batch:
+                runs.append(_spill(batch, tmp_dir))
+            if len(batch) < run_size:
+                break
+        del batch
+        if metrics is not None:
+            metrics.count('sort_runs', len(runs))
+        yield from heapq.merge(*(_read_run(run) for run in runs))
+    finally:
+        for run in runs:
+            run.close()
+
+# 索引中所有节点的id
+def node_ids(index):
+    nodes = set()
+    for entry in index.entries():
+        handler = get_handler(entry.type)
+        if handler is not None and handler.kind == NODE:
+            nodes.add(entry.id)
+    return nodes
+
+# 按层叠顺序从pos文件中解码元素，产出 (element_id, element_data)
+# selection为 (节点id集合, 连接线id集合) 时只产出其中的元素（见filters.select_from_index），
+# 两端节点没有都被选中的连接线丢弃；此时不支持的类型也不再产出
+def iter_z_ordered(index, selection=None, run_size=RUN_SIZE, tmp_dir=None, metrics=None):
+    selected_nodes, selected_linkers = selection or (None, None)
+    ids = index.ids
+    keys = ((zindex, offset, length, row) for row, (offset, length, zindex) in enumerate(index.spans()))
+    with map_pos_file(index.pos_file) as mm:
+        for _, offset, length, row in external_sort(keys, run_size, tmp_dir, metrics):
+            element_id = ids[row]
+            if selection is not None and element_id not in selected_nodes and element_id not in selected_linkers:
+                continue
+            element_data = json.loads(bytes(mm[offset:offset + length]))
+            if selection is not None and element_id in selected_linkers:
+                if any((element_data.get(end) or {}).get('id') not in selected_nodes for end in ('from', 'to')):
+                    continue
+            yield element_id, element_data
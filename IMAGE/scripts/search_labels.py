@@ -0,0 +1,78 @@
+import argparse
+import math
+import os
+import sys
+import time
+
+from batch_convert import find_pos_files
+from pos2drawio.search import SEARCH_DB_NAME, TextIndex
+
+# 在一批图表的textBlock文本中查找关键词
+# index子命令建立或增量更新全文索引，search子命令直接查索引，不再解析pos文件
+
+def _format_bbox(bbox):
+    if any(v is None or math.isnan(v) for v in bbox):
+        return ''
+    x, y, w, h = bbox
+    return f'({x:.0f}, {y:.0f}, {w:.0f}x{h:.0f})'
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='在pos文件的文本标签中全文检索')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    index_parser = subparsers.add_parser('index', help='建立或增量更新全文索引')
+    index_parser.add_argument('paths', nargs='*', default=['.'], help='要索引的.pos文件或目录，默认当前目录')
+    index_parser.add_argument('--db', default=SEARCH_DB_NAME, help=f'索引数据库路径，默认{SEARCH_DB_NAME}')
+    index_parser.add_argument('--keep-missing', action='store_true',
+                              help='保留不在本次路径中的文件，默认从索引中删除')
+
+    search_parser = subparsers.add_parser('search', help='查找同时包含所有关键词的元素')
+    search_parser.add_argument('query', nargs='+', help='关键词，中文按连续短语匹配')
+    search_parser.add_argument('--db', default=SEARCH_DB_NAME, help=f'索引数据库路径，默认{SEARCH_DB_NAME}')
+    search_parser.add_argument('-n', '--limit', type=int, default=100, help='最多显示的结果数，默认100')
+
+    stats_parser = subparsers.add_parser('stats', help='显示索引中的文件数、元素数和词数')
+    stats_parser.add_argument('--db', default=SEARCH_DB_NAME, help=f'索引数据库路径，默认{SEARCH_DB_NAME}')
+    return parser.parse_args(argv)
+
+# 主函数
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command != 'index' and not os.path.exists(args.db):
+        print(f'索引 {args.db} 不存在，请先运行 index 子命令')
+        return 1
+
+    with TextIndex(args.db) as index:
+        if args.command == 'index':
+            start = time.perf_counter()
+            counts = {}
+            pos_files = [pos_file for _, pos_file in find_pos_files(args.paths)]
+            for pos_file, status, detail in index.update(pos_files, prune=not args.keep_missing):
+                counts[status] = counts.get(status, 0) + 1
+                if status == 'indexed':
+                    print(f'已索引 {pos_file}：{detail} 个带文本的元素')
+                elif status == 'removed':
+                    print(f'已移除 {pos_file}')
+                elif status == 'error':
+                    print(f'索引 {pos_file} 失败: {detail}')
+            summary = '，'.join(f'{status} {count}' for status, count in sorted(counts.items()))
+            print(f'完成（{summary or "没有文件"}），耗时 {time.perf_counter() - start:.2f}s')
+            return 1 if counts.get('error') else 0
+
+        if args.command == 'stats':
+            stats = index.stats()
+            print(f"文件 {stats['files']}，元素 {stats['elements']}，词 {stats['terms']}")
+            return 0
+
+        start = time.perf_counter()
+        hits = index.search(' '.join(args.query), args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+        for hit in hits:
+            text = hit.text.replace('\n', ' ')
+            print(f"{hit.path}  [{hit.title or ''}]  {hit.element_id}  {hit.type}  {_format_bbox(hit.bbox)}")
+            print(f"    {text[:120]}{'...' if len(text) > 120 else ''}")
+        print(f'共 {len(hits)} 条结果，耗时 {elapsed:.1f}ms')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
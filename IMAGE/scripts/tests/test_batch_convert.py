@@ -0,0 +1,36 @@
+import os
+import signal
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_convert import convert_one
+from benchmark import generate_pos
+
+# 超时：计时器到期后转换必须立即结束，不能被按元素捕获异常的地方吞掉后继续转换
+@unittest.skipUnless(hasattr(signal, 'SIGALRM'), '需要SIGALRM')
+class ConversionTimeoutTest(unittest.TestCase):
+    def test_tiny_timeout_stops_large_conversion(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pos_file = os.path.join(tmp, 'large.pos')
+            xml_file = os.path.join(tmp, 'large.drawio.xml')
+            generate_pos(pos_file, 20000, png_kb=0)
+
+            # 几个不同的到期时间，让计时器落在解析、节点和连接线转换等不同位置
+            for timeout in (0.02, 0.05, 0.1, 0.2):
+                start = time.perf_counter()
+                result = convert_one(pos_file, xml_file, timeout=timeout)
+                elapsed = time.perf_counter() - start
+
+                self.assertEqual(result['status'], 'timeout', timeout)
+                self.assertLess(elapsed, timeout + 1.0)
+                self.assertEqual(result['metrics']['counters'].get('node_errors', 0), 0)
+                self.assertEqual(result['metrics']['counters'].get('link_errors', 0), 0)
+                self.assertFalse(os.path.exists(xml_file))
+                self.assertEqual([name for name in os.listdir(tmp) if name.endswith('.tmp')], [])
+
+if __name__ == '__main__':
+    unittest.main()
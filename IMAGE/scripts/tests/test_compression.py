@@ -0,0 +1,69 @@
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pos2drawio.compression import DeflateBase64Writer, decompress_diagram, iter_decompressed
+from pos2drawio.core import convert_file
+from pos2drawio.validator import validate_file
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                       'drawings', 'ZOOKEEPER.pos')
+DIAGRAM_RE = re.compile(r'<diagram [^>]*>(.*?)</diagram>', re.DOTALL)
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+# 压缩输出：每个<diagram>的内容解压后必须与不压缩的紧凑输出中对应页面的内容完全一致
+class CompressedOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.pos_file = os.path.join(self.tmp, 'diagram.pos')
+        shutil.copyfile(FIXTURE, self.pos_file)
+
+    def check(self, **options):
+        plain_file = os.path.join(self.tmp, 'plain.drawio.xml')
+        compressed_file = os.path.join(self.tmp, 'compressed.drawio.xml')
+        convert_file(self.pos_file, plain_file, indent=None, **options)
+        convert_file(self.pos_file, compressed_file, compress=True, **options)
+
+        plain_pages = DIAGRAM_RE.findall(read_text(plain_file))
+        diagrams = ET.parse(compressed_file).getroot().findall('diagram')
+        self.assertEqual(len(diagrams), len(plain_pages))
+        for diagram, plain_page in zip(diagrams, plain_pages):
+            self.assertEqual(decompress_diagram(diagram.text), plain_page)
+
+        plain = validate_file(plain_file)
+        compressed = validate_file(compressed_file)
+        self.assertEqual(compressed['status'], 'ok', compressed['errors'])
+        self.assertEqual((compressed['nodes'], compressed['edges']), (plain['nodes'], plain['edges']))
+
+    def test_single_page(self):
+        self.check()
+
+    def test_paged(self):
+        self.check(page_size=(2000, 2000))
+
+class DeflateBase64WriterTest(unittest.TestCase):
+    def test_streamed_writes_round_trip(self):
+        text = ''.join(f'<mxCell id="{i}" value="节点 {i} &amp; 100%"/>' for i in range(2000))
+        out = io.StringIO()
+        writer = DeflateBase64Writer(out)
+        for pos in range(0, len(text), 7):
+            writer.write(text[pos:pos + 7])
+        writer.close()
+        payload = out.getvalue()
+        self.assertEqual(decompress_diagram(payload), text)
+        # 很小的解码块让百分号编码落在块边界上
+        self.assertEqual(b''.join(iter_decompressed(payload, chunk_size=8)).decode('utf-8'), text)
+
+if __name__ == '__main__':
+    unittest.main()
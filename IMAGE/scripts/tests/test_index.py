@@ -0,0 +1,60 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pos2drawio.index import PosIndex, PosIndexError, build_index, element_bbox, element_zindex, load_index
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                       'drawings', 'ZOOKEEPER.pos')
+
+# 元素索引：每条记录的偏移和长度必须恰好框住该元素的JSON，类型、zindex和bbox与解码整个文件的结果一致
+class PosIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.pos_file = os.path.join(self.tmp, 'diagram.pos')
+        shutil.copyfile(FIXTURE, self.pos_file)
+
+    def check_entries(self):
+        with open(self.pos_file, 'rb') as f:
+            data = f.read()
+        elements = json.loads(data)['diagram']['elements']['elements']
+        index = load_index(self.pos_file)
+
+        self.assertEqual(index.ids, list(elements))
+        for entry in index.entries():
+            element_data = elements[entry.id]
+            self.assertEqual(json.loads(data[entry.offset:entry.offset + entry.length]), element_data)
+            self.assertEqual(data[entry.offset:entry.offset + 1], b'{')
+            self.assertEqual(data[entry.offset + entry.length - 1:entry.offset + entry.length], b'}')
+            self.assertEqual(entry.type, element_data['name'])
+            self.assertEqual(entry.zindex, element_zindex(element_data))
+            self.assertEqual(entry.bbox, element_bbox(element_data))
+        self.assertEqual(dict(index.iter_elements()), elements)
+
+    def test_original_file(self):
+        self.check_entries()
+
+    def test_reformatted_file(self):
+        # 缩进、非ASCII字符原样保存，偏移按字节计算
+        with open(self.pos_file, 'r', encoding='utf-8') as f:
+            pos_data = json.load(f)
+        with open(self.pos_file, 'w', encoding='utf-8') as f:
+            json.dump(pos_data, f, ensure_ascii=False, indent=2)
+        self.check_entries()
+
+    def test_stale_index_is_rebuilt(self):
+        build_index(self.pos_file)
+        with open(self.pos_file, 'ab') as f:
+            f.write(b'\n')
+        with self.assertRaises(PosIndexError):
+            PosIndex(self.pos_file)
+        self.assertEqual(len(load_index(self.pos_file)), 194)
+
+if __name__ == '__main__':
+    unittest.main()
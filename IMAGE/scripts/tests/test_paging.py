@@ -0,0 +1,58 @@
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import generate_pos
+from pos2drawio.core import convert_file
+from pos2drawio.index import load_index
+from pos2drawio.validator import validate_file
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                       'drawings', 'ZOOKEEPER.pos')
+CELL_ID_RE = re.compile(r'<(?:mxCell|UserObject) [^>]*?\bid="([^"]*)"')
+
+# 分页输出：每一页都必须通过验证（跨页的连接线不能引用其他页面的单元格），每个节点恰好出现在一页中
+class PagedOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def check(self, pos_file, page_size, **options):
+        xml_file = os.path.join(self.tmp, 'paged.drawio.xml')
+        stats = convert_file(pos_file, xml_file, page_size=page_size, **options)
+        result = validate_file(xml_file)
+        self.assertEqual(result['status'], 'ok', result['errors'])
+        self.assertEqual(result['diagrams'], stats['pages'])
+        self.assertGreater(stats['pages'], 1)
+
+        with open(xml_file, 'r', encoding='utf-8') as f:
+            cell_ids = Counter(CELL_ID_RE.findall(f.read()))
+        node_ids = [entry.id for entry in load_index(pos_file).entries() if entry.type != 'linker']
+        self.assertEqual(len(node_ids), stats['nodes'])
+        for node_id in node_ids:
+            self.assertEqual(cell_ids[node_id], 1, node_id)
+
+    def test_fixture_pages(self):
+        pos_file = os.path.join(self.tmp, 'diagram.pos')
+        shutil.copyfile(FIXTURE, pos_file)
+        for page_size in ((2000, 2000), (600, 600)):
+            self.check(pos_file, page_size)
+
+    def test_fixture_pages_z_order(self):
+        pos_file = os.path.join(self.tmp, 'diagram.pos')
+        shutil.copyfile(FIXTURE, pos_file)
+        self.check(pos_file, (600, 600), z_order=True)
+
+    def test_generated_pages(self):
+        pos_file = os.path.join(self.tmp, 'generated.pos')
+        generate_pos(pos_file, 2000, png_kb=0)
+        self.check(pos_file, (1000, 1000))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pos2drawio.core import convert_file
+from pos2drawio.patch import patch_file
+from pos2drawio.validator import validate_file
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                       'drawings', 'ZOOKEEPER.pos')
+# 被两条连接线引用的节点
+NODE_ID = '16d4ec9cafd3be'
+LINKER_IDS = ('16d4ec9bcf1a18', '16d4ec9d07b35')
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+# 增量更新：每次修改后的结果必须通过验证，并且与对同一个pos文件整体转换的结果逐字节一致
+class PatchFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.pos_file = os.path.join(self.tmp, 'diagram.pos')
+        self.xml_file = os.path.join(self.tmp, 'diagram.drawio.xml')
+        shutil.copyfile(FIXTURE, self.pos_file)
+        with open(FIXTURE, 'r', encoding='utf-8') as f:
+            self.pos_data = json.load(f)
+        self.elements = self.pos_data['diagram']['elements']['elements']
+        self.assertEqual(patch_file(self.pos_file, self.xml_file)['mode'], 'full')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def save(self, indent=None):
+        with open(self.pos_file, 'w', encoding='utf-8') as f:
+            json.dump(self.pos_data, f, ensure_ascii=False, indent=indent)
+
+    def assert_same_as_full(self, stats):
+        self.assertEqual(stats['mode'], 'patched')
+        result = validate_file(self.xml_file)
+        self.assertEqual(result['status'], 'ok', result['errors'])
+        full_file = os.path.join(self.tmp, 'full.drawio.xml')
+        convert_file(self.pos_file, full_file)
+        self.assertEqual(read_text(self.xml_file), read_text(full_file))
+
+    def test_removed_node_drops_its_linkers(self):
+        del self.elements[NODE_ID]
+        self.save()
+        stats = patch_file(self.pos_file, self.xml_file)
+        self.assertEqual(stats['removed'], 1)
+        self.assert_same_as_full(stats)
+        xml_text = read_text(self.xml_file)
+        for element_id in (NODE_ID,) + LINKER_IDS:
+            self.assertNotIn(f'id="{element_id}"', xml_text)
+
+    def test_readded_node_restores_its_linkers(self):
+        node = self.elements.pop(NODE_ID)
+        self.save()
+        patch_file(self.pos_file, self.xml_file)
+
+        # 编辑器里重新加入的元素排在最后
+        self.elements[NODE_ID] = node
+        self.save()
+        stats = patch_file(self.pos_file, self.xml_file)
+        self.assertEqual(stats['added'], 1)
+        self.assert_same_as_full(stats)
+        xml_text = read_text(self.xml_file)
+        for element_id in (NODE_ID,) + LINKER_IDS:
+            self.assertIn(f'id="{element_id}"', xml_text)
+
+    def test_changed_node_without_new_modified(self):
+        # meta.diagramInfo.modified没有更新，仍然要按元素哈希比较
+        self.elements[NODE_ID]['textBlock'][0]['text'] = 'zookeeper cluster'
+        self.save()
+        stats = patch_file(self.pos_file, self.xml_file)
+        self.assertEqual(stats['changed'], 1)
+        self.assert_same_as_full(stats)
+        self.assertIn('zookeeper cluster', read_text(self.xml_file))
+
+    def test_reformatted_file_changes_nothing(self):
+        before = read_text(self.xml_file)
+        self.save(indent=2)
+        stats = patch_file(self.pos_file, self.xml_file)
+        self.assertEqual((stats['added'], stats['changed'], stats['removed']), (0, 0, 0))
+        self.assertEqual(read_text(self.xml_file), before)
+
+    def test_untouched_file_is_skipped(self):
+        self.assertEqual(patch_file(self.pos_file, self.xml_file)['mode'], 'unchanged')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import io
+import os
+import sys
+import unittest
+import xml.etree.ElementTree as ET
+from xml.dom import minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pos2drawio.writer import DIAGRAM_ATTRS, GRAPH_MODEL_ATTRS, MXFILE_ATTRS, DrawioWriter
+
+# 小的测试图：一个节点、一个没有子元素的单元格和一条带折点的连接线，文本中包含需要转义的字符
+GEOMETRY = ('mxGeometry', {'x': '10', 'y': '20', 'width': '120', 'height': '60', 'as': 'geometry'}, ())
+EDGE_GEOMETRY = ('mxGeometry', {'relative': '1', 'as': 'geometry'}, [
+    ('Array', {'as': 'points'}, [
+        ('mxPoint', {'x': '70', 'y': '100'}, ()),
+        ('mxPoint', {'x': '200', 'y': '100'}, ()),
+    ]),
+])
+CELLS = [
+    ({'id': 'n1', 'value': 'a < b & "c" > d', 'style': 'rounded=1;whiteSpace=wrap;html=1;', 'parent': '1',
+      'vertex': '1'}, [GEOMETRY]),
+    ({'id': 'n2', 'value': '', 'style': 'text;', 'parent': '1', 'vertex': '1'}, ()),
+    ({'id': 'e1', 'style': 'endArrow=classic;html=1;', 'parent': '1', 'edge': '1', 'source': 'n1',
+      'target': 'n2'}, [EDGE_GEOMETRY]),
+]
+
+def _add_node(parent, node):
+    tag, attrs, children = node
+    element = ET.SubElement(parent, tag, attrs)
+    for child in children:
+        _add_node(element, child)
+
+# 原来的做法：构建整棵ElementTree，再经minidom格式化
+def minidom_output():
+    mxfile = ET.Element('mxfile', MXFILE_ATTRS)
+    diagram = ET.SubElement(mxfile, 'diagram', DIAGRAM_ATTRS)
+    model = ET.SubElement(diagram, 'mxGraphModel', GRAPH_MODEL_ATTRS)
+    root = ET.SubElement(model, 'root')
+    ET.SubElement(root, 'mxCell', {'id': '0'})
+    ET.SubElement(root, 'mxCell', {'id': '1', 'parent': '0'})
+    for attrs, children in CELLS:
+        _add_node(root, ('mxCell', attrs, children))
+    return minidom.parseString(ET.tostring(mxfile, encoding='unicode')).toprettyxml(indent='  ')
+
+def writer_output(indent='  '):
+    out = io.StringIO()
+    writer = DrawioWriter(out, indent)
+    writer.start()
+    for attrs, children in CELLS:
+        writer.write_cell(attrs, children)
+    writer.end()
+    return out.getvalue()
+
+class DrawioWriterTest(unittest.TestCase):
+    def test_matches_minidom_pretty_print(self):
+        self.assertEqual(writer_output(), minidom_output())
+
+    def test_compact_output_parses_to_same_tree(self):
+        compact = ET.fromstring(writer_output(indent=None))
+        pretty = ET.fromstring(minidom_output())
+        for element in pretty.iter():
+            if element.text is not None and not element.text.strip():
+                element.text = None
+            if element.tail is not None and not element.tail.strip():
+                element.tail = None
+        self.assertEqual(ET.tostring(compact), ET.tostring(pretty))
+
+if __name__ == '__main__':
+    unittest.main()
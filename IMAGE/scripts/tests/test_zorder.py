@@ -0,0 +1,77 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pos2drawio.core import convert_file
+from pos2drawio.handlers import HANDLERS
+from pos2drawio.index import load_index
+from pos2drawio.validator import validate_file
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                       'drawings', 'ZOOKEEPER.pos')
+FAILING_NODES = 3
+
+# 按层叠顺序写出：连接线排在端点节点之前时，端点节点转换失败，连接线也必须被跳过，
+# 否则输出中的连接线指向不存在的单元格
+class ZOrderFailingNodeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.pos_file = os.path.join(self.tmp, 'diagram.pos')
+        shutil.copyfile(FIXTURE, self.pos_file)
+
+        # 选出zindex比引用它的连接线大的节点，按层叠顺序时连接线先写出
+        index = load_index(self.pos_file)
+        zindex = {entry.id: entry.zindex for entry in index.entries()}
+        self.failing = set()
+        endpoints = {}
+        for element_id, element_data in index.iter_elements():
+            if element_data.get('name') != 'linker':
+                continue
+            ends = [(element_data.get(end) or {}).get('id') for end in ('from', 'to')]
+            endpoints[element_id] = ends
+            for node_id in ends:
+                if len(self.failing) < FAILING_NODES and node_id in zindex and zindex[node_id] > zindex[element_id]:
+                    self.failing.add(node_id)
+        self.assertEqual(len(self.failing), FAILING_NODES)
+        self.skipped_links = {linker_id for linker_id, ends in endpoints.items() if self.failing.intersection(ends)}
+
+        # 让这几个节点的处理器抛出异常
+        for node_id in self.failing:
+            name = index.read_element(node_id)['name']
+            handler = HANDLERS[name]
+            self.addCleanup(HANDLERS.__setitem__, name, handler)
+            HANDLERS[name] = handler._replace(convert=self._failing_convert(handler.convert))
+
+    def _failing_convert(self, convert):
+        def failing(element_id, element_data, text):
+            if element_id in self.failing:
+                raise ValueError(f'{element_id} 转换失败')
+            return convert(element_id, element_data, text)
+        return failing
+
+    def check(self, **options):
+        xml_file = os.path.join(self.tmp, 'diagram.drawio.xml')
+        convert_file(self.pos_file, xml_file, **options)
+        result = validate_file(xml_file)
+        self.assertEqual(result['status'], 'ok', result['errors'])
+        with open(xml_file, 'r', encoding='utf-8') as f:
+            xml_text = f.read()
+        for element_id in self.failing | self.skipped_links:
+            self.assertNotIn(f'id="{element_id}"', xml_text)
+
+    def test_file_order(self):
+        self.check()
+
+    def test_z_order(self):
+        self.check(z_order=True)
+
+    def test_z_order_paged(self):
+        self.check(z_order=True, page_size=(2000, 2000))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,51 +1,71 @@
-import xml.etree.ElementTree as ET
-
-# 解析生成的XML文件
-try:
-    tree = ET.parse('ZOOKEEPER理论.drawio.xml')
-    root = tree.getroot()
-    
-    # 检查根元素
-    if root.tag != 'mxfile':
-        print("错误：不是有效的draw.io XML文件")
-        exit(1)
-    
-    # 统计元素数量
-    nodes = []
-    edges = []
-    
-    for diagram in root.findall('.//diagram'):
-        for mx_cell in diagram.findall('.//mxCell'):
-            if 'vertex' in mx_cell.attrib and mx_cell.attrib['vertex'] == '1':
-                nodes.append(mx_cell)
-            elif 'edge' in mx_cell.attrib and mx_cell.attrib['edge'] == '1':
-                edges.append(mx_cell)
-    
-    print(f"验证完成：")
-    print(f"  - 节点数量: {len(nodes)}")
-    print(f"  - 连接线数量: {len(edges)}")
-    
-    # 检查不同类型的节点
-    print("\n节点类型统计：")
-    node_types = {}
-    for node in nodes:
-        style = node.attrib.get('style', '')
-        if 'shape=note' in style:
-            node_types['note'] = node_types.get('note', 0) + 1
-        elif 'shape=ellipse' in style:
-            node_types['circle/round'] = node_types.get('circle/round', 0) + 1
-        elif 'shape=diamond' in style:
-            node_types['diamond'] = node_types.get('diamond', 0) + 1
-        elif 'rounded=1' in style and 'shape=note' not in style and 'shape=ellipse' not in style:
-            node_types['rounded rectangle'] = node_types.get('rounded rectangle', 0) + 1
-        else:
-            node_types['rectangle'] = node_types.get('rectangle', 0) + 1
-    
-    for node_type, count in node_types.items():
-        print(f"  - {node_type}: {count}")
-    
-    print("\nXML文件验证通过！")
-    
-except Exception as e:
-    print(f"验证XML文件时出错: {e}")
-    exit(1)
\ No newline at end of file
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from pos2drawio.validator import MAX_ERRORS, validate_file
+
+# 递归查找要校验的draw.io文件，直接给出的文件不限制扩展名
+def find_xml_files(paths):
+    xml_files = []
+    for path in paths:
+        if os.path.isfile(path):
+            xml_files.append(path)
+            continue
+        for dir_path, dir_names, file_names in os.walk(path):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                if file_name.endswith('.drawio.xml') or file_name.endswith('.drawio'):
+                    xml_files.append(os.path.join(dir_path, file_name))
+    return xml_files
+
+# 打印单个文件的校验结果
+def print_result(result, verbose):
+    compressed = f"（压缩 {result['compressed']}）" if result['compressed'] else ''
+    print(f"{result['status']:<8} {result['file']}: 页面 {result['diagrams']}{compressed}，"
+          f"节点 {result['nodes']}，连接线 {result['edges']}")
+    for message in result['errors']:
+        print(f'         {message}')
+    if result['problems'] > len(result['errors']):
+        print(f"         ……共 {result['problems']} 个问题")
+    if verbose:
+        for node_type, count in sorted(result['node_types'].items()):
+            print(f'         - {node_type}: {count}')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='流式校验生成的draw.io文件：id唯一、连接线端点存在、节点几何信息完整')
+    parser.add_argument('paths', nargs='*', default=['.'], help='要校验的文件或目录，默认当前目录')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='工作进程数，默认CPU核数')
+    parser.add_argument('--max-errors', type=int, default=MAX_ERRORS, help=f'每个文件最多列出的问题数，默认{MAX_ERRORS}')
+    parser.add_argument('-v', '--verbose', action='store_true', help='同时打印节点类型统计')
+    return parser.parse_args(argv)
+
+# 主函数
+def main(argv=None):
+    args = parse_args(argv)
+
+    xml_files = find_xml_files(args.paths)
+    if not xml_files:
+        print('没有找到draw.io文件')
+        return 1
+
+    # 单个文件时不必启动进程池
+    workers = max(1, min(args.jobs, len(xml_files)))
+    results = []
+    if workers == 1:
+        for path in xml_files:
+            results.append(validate_file(path, args.max_errors))
+            print_result(results[-1], args.verbose)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(validate_file, xml_files, [args.max_errors] * len(xml_files)):
+                results.append(result)
+                print_result(result, args.verbose)
+
+    failed = sum(1 for r in results if r['status'] != 'ok')
+    print(f"共 {len(results)} 个文件，通过 {len(results) - failed} 个，失败 {failed} 个，"
+          f"节点 {sum(r['nodes'] for r in results)}，连接线 {sum(r['edges'] for r in results)}")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import argparse
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from batch_convert import (OK_STATUSES, add_conversion_arguments, add_metrics_arguments, check_conversion_arguments,
+                           conversion_options, convert_one, find_pos_files, output_path, record_metrics)
+from conversion_cache import CACHE_FILE_NAME, ConversionCache
+from file_watcher import Debouncer, create_watcher
+from pos2drawio import CONVERTER_VERSION
+from pos2drawio.metrics import Metrics
+
+# 常驻的监视模式：监视目录树，.pos文件写完后立即交给常驻的进程池转换
+# 与cron定时运行batch_convert相比，不必每次重新启动解释器、导入模块、扫描全部文件
+
+# 有转换在进行时，等待文件事件的最长时间，决定了转换结果的输出延迟
+RESULT_POLL_INTERVAL = 0.02
+
+# 工作进程的初始化：退出由主进程统一处理，工作进程不响应Ctrl+C，SIGTERM恢复默认行为；
+# 同时预先导入转换器，第一个文件到达时不再付出导入的开销
+def _init_worker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    import pos2drawio.core  # noqa: F401
+
+def _worker_pid(_):
+    return os.getpid()
+
+# 收到SIGTERM时与Ctrl+C一样退出主循环
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+def _directory(text):
+    if not os.path.isdir(text):
+        raise argparse.ArgumentTypeError(f'不是目录: {text}')
+    return os.path.abspath(text)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='监视目录中的.pos文件，新增或修改后立即转换为draw.io XML')
+    parser.add_argument('paths', nargs='*', type=_directory, default=[os.path.abspath('.')],
+                        help='要监视的目录，默认当前目录')
+    parser.add_argument('-o', '--output-dir', help='输出目录，按输入的相对路径镜像；默认写在.pos文件旁边')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='常驻工作进程数，默认CPU核数')
+    parser.add_argument('--timeout', type=float, default=300, help='单个文件的超时秒数，0表示不限制')
+    parser.add_argument('--debounce', type=float, default=0.2, help='文件最后一次写入后等待的秒数，默认0.2')
+    parser.add_argument('--polling', action='store_true', help='不使用inotify，定期扫描目录')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='轮询的间隔秒数，默认1')
+    parser.add_argument('--no-initial', action='store_true', help='启动时不转换已有的文件，只处理之后的变化')
+    parser.add_argument('--cache', help=f'增量转换缓存清单路径，默认为输出目录（或第一个监视目录）下的{CACHE_FILE_NAME}')
+    parser.add_argument('--no-cache', action='store_true', help='不使用缓存，每次变化都重新转换')
+    add_conversion_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    check_conversion_arguments(parser, args)
+    return args
+
+# 监视循环：文件事件经过防抖后提交到进程池，同一个文件同时只有一个转换，
+# 转换期间又发生的变化在当前转换完成后再处理一次
+class WatchLoop:
+    def __init__(self, args):
+        self.args = args
+        self.roots = args.paths
+        self.options = conversion_options(args)
+        self.timeout = args.timeout or None
+        self.workers = max(1, args.jobs)
+
+        self.cache = None
+        if not args.no_cache:
+            manifest_path = args.cache or os.path.join(args.output_dir or self.roots[0], CACHE_FILE_NAME)
+            self.cache = ConversionCache(manifest_path, CONVERTER_VERSION, self.options).load()
+
+        self.debouncer = Debouncer(args.debounce)
+        # future -> (pos_file, xml_file, 第一次事件的时间, 缓存条目)
+        self.running = {}
+        # 正在转换的pos文件 -> 转换期间又发生变化的第一次事件时间
+        self.in_flight = {}
+        # pos文件 -> 还没有提交的第一次事件时间，用于统计从事件到输出的延迟
+        self.first_seen = {}
+        self.pool = None
+        # 启动以来的累计指标，每完成一个文件就重写一次--metrics文件
+        self.metrics = Metrics()
+
+    def start_pool(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        # 提交与进程数相同的空任务，让所有工作进程立即启动
+        for _ in self.pool.map(_worker_pid, range(self.workers)):
+            pass
+
+    # 文件所在的监视目录，用于按相对路径镜像输出目录
+    def root_of(self, pos_file):
+        pos_dir = os.path.dirname(os.path.abspath(pos_file))
+        matches = [root for root in self.roots if os.path.commonpath([root, pos_dir]) == root]
+        return max(matches, key=len) if matches else pos_dir
+
+    def notice(self, pos_file, now):
+        self.first_seen.setdefault(pos_file, now)
+        self.debouncer.touch(pos_file, now)
+
+    def submit(self, pos_file):
+        seen = self.first_seen.pop(pos_file, time.monotonic())
+        if pos_file in self.in_flight:
+            # 等当前的转换结束后再提交，保留最早的事件时间
+            if self.in_flight[pos_file] is None:
+                self.in_flight[pos_file] = seen
+            return
+        if not os.path.exists(pos_file):
+            return
+
+        xml_file = output_path(pos_file, self.root_of(pos_file), self.args.output_dir)
+        state, entry = self.cache.lookup(pos_file, xml_file) if self.cache else ('miss', None)
+        if state == 'fresh':
+            return
+        future = self.pool.submit(convert_one, pos_file, xml_file, self.timeout,
+                                  hash_input=self.cache is not None,
+                                  expected_sha256=entry['sha256'] if entry else None,
+                                  options=self.options, patch=self.args.patch, log_sample=self.args.log_sample)
+        self.running[future] = (pos_file, xml_file, seen, entry)
+        self.in_flight[pos_file] = None
+
+    # 报告已完成的转换，转换期间又发生变化的文件重新提交
+    def collect(self):
+        done = [f for f in self.running if f.done()]
+        resubmit = []
+        broken = False
+        while done:
+            for future in done:
+                broken |= self.finish(future, resubmit)
+            # 进程池失效时其余的转换也会很快以BrokenProcessPool结束，全部收集后再换新的进程池
+            done = list(wait(self.running).done) if broken and self.running else []
+        if broken:
+            self.restart_pool()
+        for pos_file in resubmit:
+            self.submit(pos_file)
+
+    # 返回进程池是否已失效
+    def finish(self, future, resubmit):
+        pos_file, xml_file, seen, entry = self.running.pop(future)
+        broken = False
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            broken = True
+            result = {'file': pos_file, 'status': 'crashed', 'elements': 0, 'nodes': 0, 'links': 0,
+                      'seconds': 0.0, 'error': '工作进程异常退出'}
+        self.report(result, xml_file, seen, entry)
+
+        again = self.in_flight.pop(pos_file)
+        if again is not None:
+            self.first_seen.setdefault(pos_file, again)
+            resubmit.append(pos_file)
+        return broken
+
+    # 进程池失效（如工作进程被OOM杀掉）后换一个新的，未完成的文件都已作为crashed报告
+    def restart_pool(self):
+        print('进程池已失效，重新启动工作进程')
+        self.pool.shutdown(wait=False)
+        self.start_pool()
+
+    def report(self, result, xml_file, seen, entry):
+        if self.cache and result['status'] in OK_STATUSES:
+            if result['status'] == 'cached':
+                result.update((k, entry[k]) for k in ('elements', 'nodes', 'links'))
+            self.cache.record(result['file'], xml_file, result['size'], result['mtime_ns'], result['sha256'], result)
+            self.cache.save()
+        latency = (time.monotonic() - seen) * 1000
+        if self.args.metrics:
+            record_metrics(self.metrics, result)
+            self.metrics.add_time('latency', latency / 1000)
+            self.metrics.write(self.args.metrics)
+        print(f"{time.strftime('%H:%M:%S')} {result['status']:<8} {result['file']}  "
+              f"元素 {result['elements']}，节点 {result['nodes']}，连接线 {result['links']}，"
+              f"转换 {result['seconds'] * 1000:.0f}ms，距发现变化 {latency:.0f}ms")
+        if result['error']:
+            print(f"         {result['error']}")
+
+    def run(self):
+        watcher = create_watcher(self.roots, '.pos', self.args.polling, self.args.poll_interval)
+        try:
+            self.start_pool()
+            print(f"监视 {len(self.roots)} 个目录（{type(watcher).__name__}），{self.workers} 个工作进程已就绪")
+
+            if not self.args.no_initial:
+                now = time.monotonic()
+                for _, pos_file in find_pos_files(self.roots):
+                    self.first_seen.setdefault(pos_file, now)
+                    self.submit(pos_file)
+
+            while True:
+                timeout = self.debouncer.timeout()
+                if self.running:
+                    timeout = RESULT_POLL_INTERVAL if timeout is None else min(timeout, RESULT_POLL_INTERVAL)
+                changed = watcher.read(timeout)
+                now = time.monotonic()
+                for pos_file in changed:
+                    self.notice(pos_file, now)
+                for pos_file in self.debouncer.pop_ready(now):
+                    self.submit(pos_file)
+                self.collect()
+        except KeyboardInterrupt:
+            print('正在退出，等待进行中的转换完成')
+        finally:
+            watcher.close()
+            if self.pool is not None:
+                self.pool.shutdown(wait=True, cancel_futures=True)
+            if self.cache:
+                self.cache.save()
+
+# 主函数
+def main(argv=None):
+    args = parse_args(argv)
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    WatchLoop(args).run()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())